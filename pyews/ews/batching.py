@@ -0,0 +1,137 @@
+##
+## Created : Sun Oct 18 20:31:40 IST 2026
+##
+## Copyright (C) 2026 Sriram Karra <karra.etc@gmail.com>
+##
+## This file is part of pyews
+##
+## pyews is free software: you can redistribute it and/or modify it under
+## the terms of the GNU Affero General Public License as published by the
+## Free Software Foundation, version 3 of the License
+##
+## pyews is distributed in the hope that it will be useful, but WITHOUT
+## ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+## FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero General Public
+## License for more details.
+##
+## You should have a copy of the license in the doc/ directory of pyews.  If
+## not, see <http://www.gnu.org/licenses/>.
+
+##
+## Exchange turns away requests that are over its maximum request size, and
+## a request with thousands of items in it can take long enough for it or
+## its response to time out. So the bulk item methods of ExchangeService
+## split the items they are given into batches that stay under the
+## service's max_request_items and max_request_bytes, send a request per
+## batch, and put the responses back together in a MergedResponse. A batch
+## that fails does not take the others down with it; see
+## MergedResponse.failed_batches
+##
+## A request class that can be split this way names the keyword argument
+## that carries the list in its batch_arg attribute, and estimates the
+## serialized size of an entry of that list in item_size().
+##
+
+import logging
+
+## A generous allowance for the envelope and the rest of the fixed parts of
+## a request, in bytes
+REQUEST_OVERHEAD = 1024
+
+def split_batches (values, size_of, max_items=None, max_bytes=None,
+                   overhead=REQUEST_OVERHEAD):
+    """
+    Split the list values into consecutive batches of at most max_items
+    entries, such that overhead plus the size_of() of all the entries of a
+    batch stays under max_bytes. An entry that is too large by itself gets a
+    batch of its own. A limit of None means no limit.
+
+    Returns a list of (offset, batch) tuples, where offset is the position
+    of the first entry of the batch in values. There is always at least one
+    batch, even if values is empty.
+    """
+
+    values = list(values)
+    if max_items is None and max_bytes is None:
+        return [(0, values)]
+
+    batches = []
+    start = 0
+    size = overhead
+
+    for i, v in enumerate(values):
+        s = size_of(v) if max_bytes is not None else 0
+        n = i - start
+
+        if n > 0 and ((max_items is not None and n >= max_items) or
+                      (max_bytes is not None and size + s > max_bytes)):
+            batches.append((start, values[start:i]))
+            start = i
+            size = overhead
+
+        if max_bytes is not None and overhead + s > max_bytes:
+            logging.warning('split_batches: entry %d is %d bytes, which is '
+                            'over the limit of %d bytes by itself', i, s,
+                            max_bytes)
+
+        size += s
+
+    batches.append((start, values[start:]))
+    return batches
+
+class MergedResponse(object):
+    """
+    The responses to the requests a batch of work was split into, put
+    together to look like the response to a single request for the whole
+    lot: the counts add up, errors are keyed on the position of the item in
+    the original list, and the items of item bearing responses are
+    concatenated in order. The individual responses are in 'responses'.
+
+    The requests that raised an exception instead of returning a response
+    are listed in failed_batches, as (offset, batch, exception) tuples -
+    batch being the part of the original list the request was for, starting
+    at position offset. None of the counts include these.
+    """
+
+    def __init__ (self, results, batches):
+        """
+        results are the responses, or the exceptions raised in their place,
+        for the (offset, batch) tuples in batches. See split_batches()
+        """
+
+        self.responses = []
+        self.failed_batches = []
+        self.err_cnt = 0
+        self.suc_cnt = 0
+        self.war_cnt = 0
+        self.errors = {}
+        self.items = None
+
+        for resp, (offset, batch) in zip(results, batches):
+            if isinstance(resp, Exception):
+                logging.warning('MergedResponse: batch of %d at offset %d '
+                                'failed: %s', len(batch), offset, resp)
+                self.failed_batches.append((offset, batch, resp))
+                continue
+
+            self.responses.append(resp)
+            self.err_cnt += resp.err_cnt
+            self.suc_cnt += resp.suc_cnt
+            self.war_cnt += resp.war_cnt
+
+            for i, err in resp.errors.iteritems():
+                self.errors[offset + i] = err
+
+            if resp.items is not None:
+                if self.items is None:
+                    self.items = []
+                self.items += resp.items
+
+    def has_errors (self):
+        return self.err_cnt > 0 or len(self.failed_batches) > 0
+
+    def item_count (self):
+        if self.items is not None:
+            return len(self.items)
+
+        return self.suc_cnt + self.war_cnt + self.err_cnt
@@ -19,12 +19,13 @@
 
 import logging
 from item    import Item, Field, FieldURI, ExtendedProperty, LastModifiedTime
-from pyews.soap    import SoapClient, unQName, QName_T
-from pyews.utils   import pretty_xml
+from item    import text_handler, TAG_EXTENDED_FIELD_URI, TAG_VALUE
+from item    import BASE_RESP_HANDLERS, ItemField
+from pyews.soap    import SoapClient, QName_T
+from pyews.utils   import pretty_xml, xml_attr, xml_text
 from pyews.ews     import mapitags
 from pyews.ews.data import MapiPropertyTypeType, MapiPropertyTypeTypeInv
 from pyews.ews.data import GenderType
-from xml.sax.saxutils import escape
 
 class CField(Field):
     def __init__ (self, tag=None, text=None):
@@ -32,11 +33,10 @@ class CField(Field):
         self.furi = ('contacts:%s' % tag) if tag else None
 
     def write_to_xml_update (self):
-        ats = ['%s="%s"' % (k, v) for k, v in self.attrib.iteritems() if v]
         s = '<t:FieldURI FieldURI="%s"/>' % self.furi
         s += '\n<t:Contact>'
-        s += '\n  <t:%s %s>%s</t:%s>' % (self.tag, ' '.join(ats),
-                                         escape(self.value), self.tag)
+        s += '\n  <t:%s %s>%s</t:%s>' % (self.tag, self.atts_as_xml(),
+                                         xml_text(self.value), self.tag)
         s += '\n</t:Contact>'
 
         return s
@@ -181,7 +181,8 @@ class EmailAddresses(CField):
 
     def __init__ (self, node=None):
         CField.__init__(self, 'EmailAddresses')
-        self.children = self.entries = []
+        self.children = []
+        self.entries = self.children
         if node is not None:
             self.populate_from_node(node)
 
@@ -208,11 +209,11 @@ class EmailAddresses(CField):
         for email in self.entries:
             s = ''
             s += '\n<t:IndexedFieldURI FieldURI="contacts:EmailAddress" '
-            s += 'FieldIndex="%s"/>' % email.attrib['Key']
+            s += 'FieldIndex="%s"/>' % xml_attr(email.attrib['Key'])
             s += '\n<t:Contact>'
             s += '\n  <t:EmailAddresses>'
-            s += '\n    <t:Entry Key="%s">%s</t:Entry>' % (email.attrib['Key'],
-                                                           escape(email.value))
+            s += '\n    <t:Entry Key="%s">%s</t:Entry>' % (
+                xml_attr(email.attrib['Key']), xml_text(email.value))
             s += '\n  </t:EmailAddresses>'
             s += '\n</t:Contact>'
             ret.append(s)
@@ -241,7 +242,8 @@ class ImAddresses(CField):
 
     def __init__ (self, node=None):
         CField.__init__(self, 'ImAddresses')
-        self.children = self.entries = []
+        self.children = []
+        self.entries = self.children
         if node is not None:
             self.populate_from_node(node)
 
@@ -268,11 +270,11 @@ class ImAddresses(CField):
         for im in self.entries:
             s = ''
             s += '\n<t:IndexedFieldURI FieldURI="contacts:ImAddress" '
-            s += 'FieldIndex="%s"/>' % im.attrib['Key']
+            s += 'FieldIndex="%s"/>' % xml_attr(im.attrib['Key'])
             s += '\n<t:Contact>'
             s += '\n  <t:ImAddresses>'
-            s += '\n    <t:Entry Key="%s">%s</t:Entry>' % (im.attrib['Key'],
-                                                           escape(im.value))
+            s += '\n    <t:Entry Key="%s">%s</t:Entry>' % (
+                xml_attr(im.attrib['Key']), xml_text(im.value))
             s += '\n  </t:ImAddresses>'
             s += '\n</t:Contact>'
             ret.append(s)
@@ -301,7 +303,8 @@ class PhoneNumbers(CField):
 
     def __init__ (self, node=None):
         CField.__init__(self, 'PhoneNumbers')
-        self.children = self.entries = []
+        self.children = []
+        self.entries = self.children
 
         if node is not None:
             self.populate_from_node(node)
@@ -329,11 +332,11 @@ class PhoneNumbers(CField):
         for phone in self.entries:
             s = ''
             s += '\n<t:IndexedFieldURI FieldURI="contacts:PhoneNumber" '
-            s += 'FieldIndex="%s"/>' % phone.attrib['Key']
+            s += 'FieldIndex="%s"/>' % xml_attr(phone.attrib['Key'])
             s += '\n<t:Contact>'
             s += '\n  <t:PhoneNumbers>'
-            s += '\n    <t:Entry Key="%s">%s</t:Entry>' % (phone.attrib['Key'],
-                                                           phone.value)
+            s += '\n    <t:Entry Key="%s">%s</t:Entry>' % (
+                xml_attr(phone.attrib['Key']), xml_text(phone.value))
             s += '\n  </t:PhoneNumbers>'
             s += '\n</t:Contact>'
             ret.append(s)
@@ -368,6 +371,12 @@ class PersonalHomePage(ExtendedProperty):
         else:
             return ''
 
+    def xml_size (self):
+        if self.val.value is not None:
+            return ExtendedProperty.xml_size(self)
+        else:
+            return 0
+
     def __str__ (self):
         return self.val.value
 
@@ -385,6 +394,12 @@ class Gender(ExtendedProperty):
         else:
             return ''
 
+    def xml_size (self):
+        if self.val.value is not None:
+            return ExtendedProperty.xml_size(self)
+        else:
+            return 0
+
     def __str__ (self):
         v = self.val.value
         if v is None or v == 'None':
@@ -396,6 +411,32 @@ class Gender(ExtendedProperty):
         else:
             return 'Unspecified'
 
+## The Contact specific fields, other than the extended properties: attribute
+## name, field class, and the tags of the response elements the field is
+## decoded from. Contact.__init__ makes the fields from this, and LazyContact
+## decodes each of them from the listed elements on first use.
+CONTACT_FIELDS = [
+    ('file_as',            FileAs,             [QName_T('FileAs')]),
+    ('alias',              Alias,              [QName_T('Alias')]),
+    ('complete_name',      CompleteName,       [QName_T('GivenName'),
+                                                QName_T('Surname'),
+                                                QName_T('Initials')]),
+    ('display_name',       DisplayName,        [QName_T('DisplayName')]),
+    ('spouse_name',        SpouseName,         [QName_T('SpouseName')]),
+    ('job_title',          JobTitle,           [QName_T('JobTitle')]),
+    ('company_name',       CompanyName,        [QName_T('CompanyName')]),
+    ('department',         Department,         [QName_T('Department')]),
+    ('manager',            Manager,            [QName_T('Manager')]),
+    ('assistant_name',     AssistantName,      [QName_T('AssistantName')]),
+    ('birthday',           Birthday,           [QName_T('Birthday')]),
+    ('anniversary',        WeddingAnniversary, [QName_T('WeddingAnniversary')]),
+    ('notes',              Notes,              [QName_T('Body')]),
+    ('emails',             EmailAddresses,     [QName_T('EmailAddresses')]),
+    ('ims',                ImAddresses,        [QName_T('ImAddresses')]),
+    ('phones',             PhoneNumbers,       [QName_T('PhoneNumbers')]),
+    ('business_home_page', BusinessHomePage,   [QName_T('BusinessHomePage')]),
+]
+
 class Contact(Item):
     """
     Abstract wrapper class around an Exchange Item object. Frequently an
@@ -405,29 +446,14 @@ class Contact(Item):
     def __init__ (self, service, parent_fid=None, resp_node=None):
         Item.__init__(self, service, parent_fid, resp_node, tag='Contact')
 
-        self.file_as      = FileAs()
-        self.alias        = Alias()
-        self.complete_name = CompleteName()
-        self.display_name = DisplayName()
-        self.spouse_name = SpouseName()
-
-        self.job_title      = JobTitle()
-        self.company_name   = CompanyName()
-        self.department     = Department()
-        self.manager        = Manager()
-        self.assistant_name = AssistantName()
-
-        self.birthday    = Birthday()
-        self.anniversary = WeddingAnniversary()
+        ## Nothing to put together again yet, so the fields go straight
+        ## into the instance dictionary. See ItemField
+        fields = self.__dict__
+        for name, field_class, tags in CONTACT_FIELDS:
+            fields[name] = field_class()
 
-        self.notes = Notes()
-        self.emails = EmailAddresses()
-        self.ims    = ImAddresses()
-        self.phones = PhoneNumbers()
-        self.business_home_page = BusinessHomePage()
-
-        self.gender = Gender()
-        self.personal_home_page = PersonalHomePage()
+        fields['gender'] = Gender()
+        fields['personal_home_page'] = PersonalHomePage()
 
         self._init_from_resp()
 
@@ -436,52 +462,16 @@ class Contact(Item):
             return
 
         rnode = self.resp_node
+        handlers = CONTACT_RESP_HANDLERS
         for child in rnode:
-            tag = unQName(child.tag)
-
-            if tag == 'FileAs':
-                self.file_as.value = child.text
-            elif tag == 'Alias':
-                self.alias.value = child.text
-            elif tag == 'SpouseName':
-                self.spouse_nam.value = child.text
-            elif tag == 'JobTitle':
-                self.job_title.value = child.text
-            elif tag == 'CompanyName':
-                self.company_name.value = child.text
-            elif tag == 'Department':
-                self.department.value = child.text
-            elif tag == 'Manager':
-                self.manager.value = child.text
-            elif tag == 'AssistantName':
-                self.assistant_name.value = child.text
-            elif tag == 'Birthday':
-                self.birthday.value = child.text
-            elif tag == 'WeddingAnniversary':
-                self.anniversary.value = child.text
-            elif tag == 'GivenName':
-                self.complete_name.given_name.value = child.text
-            elif tag == 'Surname':
-                self.complete_name.surname.value = child.text
-            elif tag == 'Initials':
-                self.complete_name.initials.value = child.text
-            elif tag == 'DisplayName':
-                self.display_name.value = child.text
-            elif tag == 'Body':
-                ## FIXME: We are assuming a text body type, but they could
-                ## contain html or other types as well... Oh, well.
-                self.notes.value = child.text
-            elif tag == 'EmailAddresses':
-                self.emails.populate_from_node(child)
-            elif tag == 'ImAddresses':
-                self.ims.populate_from_node(child)
-            elif tag == 'PhoneNumbers':
-                self.phones.populate_from_node(child)
-            elif tag == 'BusinessHomePage':
-                self.business_home_page.value = child.text
-            elif tag == 'ExtendedProperty':
-                self.add_extended_property(node=child)
+            handler = handlers.get(child.tag)
+            if handler is not None:
+                handler(self, child)
+
+        self._init_complete_name_from_resp(rnode)
+        self._init_names()
 
+    def _init_complete_name_from_resp (self, rnode):
         n = rnode.find('CompleteName')
         if n is not None:
             rnode = n
@@ -496,6 +486,7 @@ class Contact(Item):
         self.complete_name.full_name.value = fts(rnode, 'FullName')
         self.complete_name.nickname.value = fts(rnode, 'Nickname')
 
+    def _init_names (self):
         ## It's a bit hard to understand why the hell they have so many
         ## variants for the same stupid information... Oh well, let's just
         ## have a few handy shortcuts for the information that matters
@@ -538,9 +529,9 @@ class Contact(Item):
 
     def add_tagged_property (self, node=None, tag=None, value=None):
         if node is not None and tag is None:
-            uri = node.find(QName_T('ExtendedFieldURI'))
+            uri = node.find(TAG_EXTENDED_FIELD_URI)
             tag = ExtendedProperty.get_prop_tag_from_xml(uri)
-            value = node.find(QName_T('Value')).text
+            value = node.find(TAG_VALUE).text
 
         eprop = None
 
@@ -558,14 +549,20 @@ class Contact(Item):
             eprop.value = value
             self.eprops.append(eprop)
             self.eprops_tagged[tag] = eprop
+            self.children_changed()
 
-    ## Override Field.get_chidren to refresh the children array every time
+    ## Override Field.get_chidren to refresh the children array whenever a
+    ## field is replaced or an extended property is added
     def get_children (self):
+        if not self._children_stale:
+            return self._children
+
         cn = self.complete_name
         ## Note that children is used for generating xml representation of
         ## this contact for CreateItem and update operations. The order of
-        ## these fields is critical. I know, it's crazy.
-        self.children = [self.notes] + self.eprops + [self.gender,
+        ## these fields is critical. I know, it's crazy. A plain list, as the
+        ## fields need no link back to the contact; see Item
+        self._children = [self.notes] + self.eprops + [self.gender,
                          self.personal_home_page, self.file_as,
                          self.display_name, cn.given_name, cn.initials,
                          cn.middle_name, cn.nickname, self.company_name,
@@ -574,8 +571,9 @@ class Contact(Item):
                          self.department, self.ims, self.job_title,
                          self.manager, self.spouse_name, cn.surname,
                          self.anniversary, self.alias]
+        self._children_stale = False
 
-        return self.children
+        return self._children
 
     def save (self):
         if self.itemid.value is None:
@@ -601,6 +599,161 @@ class Contact(Item):
 
         return s
 
+## Replacing any of the fields a contact is made of changes its xml
+for _name in ([f[0] for f in CONTACT_FIELDS] +
+              ['gender', 'personal_home_page']):
+    setattr(Contact, _name, ItemField(_name))
+
+class LazyContact(Contact):
+    """
+    A Contact that is cheap to make from a response element: only the fields
+    common to all items - the ItemId, ChangeKey and so on - are picked up
+    right away. Each of the other fields is decoded from the element when it
+    is first used, so listing a large folder just to compare change keys
+    does not pay for the phones, emails and notes of every contact.
+
+    Otherwise it is a Contact like any other. ExchangeService.lazy_contacts
+    has the requests make these instead of Contacts.
+    """
+
+    ## Element lists keyed on tag, built from the response element the first
+    ## time a field is decoded
+    _index = None
+
+    def __init__ (self, service, parent_fid=None, resp_node=None):
+        Item.__init__(self, service, parent_fid, None, tag='Contact')
+
+        ## The extended properties, including the last modified time, are
+        ## decoded in one go on first use, see _decode_eprops()
+        for name in LAZY_EPROP_ATTRS:
+            if name in self.__dict__:
+                delattr(self, name)
+
+        self.resp_node = resp_node
+        if resp_node is not None:
+            handlers = LAZY_BASE_RESP_HANDLERS
+            for child in resp_node:
+                handler = handlers.get(child.tag)
+                if handler is not None:
+                    handler(self, child)
+
+    def __getattr__ (self, name):
+        ## Only called for attributes that have not been set yet
+
+        spec = LAZY_FIELDS.get(name)
+        if spec is not None:
+            self._decode_field(name, *spec)
+        elif name in LAZY_EPROP_ATTRS:
+            self._decode_eprops()
+        elif name in LAZY_NAME_ATTRS:
+            self._init_names()
+        else:
+            raise AttributeError(name)
+
+        return object.__getattribute__(self, name)
+
+    def _elements (self, tag):
+        if self.resp_node is None:
+            return []
+
+        if self._index is None:
+            index = {}
+            for child in self.resp_node:
+                index.setdefault(child.tag, []).append(child)
+            self._index = index
+
+        return self._index.get(tag, [])
+
+    def _decode_field (self, name, field_class, tags):
+        setattr(self, name, field_class())
+        for tag in tags:
+            handler = CONTACT_RESP_HANDLERS[tag]
+            for node in self._elements(tag):
+                handler(self, node)
+
+        if name == 'complete_name' and self.resp_node is not None:
+            self._init_complete_name_from_resp(self.resp_node)
+
+    def _decode_eprops (self):
+        ## Any of these that were assigned before the first use stay as they
+        ## are; the ones decoded from the response only fill in the rest.
+        assigned = dict([(name, self.__dict__[name])
+                         for name in LAZY_EPROP_ATTRS if name in self.__dict__])
+
+        self.eprops = []
+        self.eprops_tagged = {}
+        self.eprops_named_str = {}
+        self.eprops_named_int = {}
+        self.last_modified_time = None
+        self.gender = Gender()
+        self.personal_home_page = PersonalHomePage()
+
+        for node in self._elements(QName_T('LastModifiedTime')):
+            BASE_RESP_HANDLERS[node.tag](self, node)
+
+        for node in self._elements(QName_T('ExtendedProperty')):
+            self.add_extended_property(node=node)
+
+        for name, val in assigned.iteritems():
+            setattr(self, name, val)
+
+##
+## Response handlers for the Contact specific fields. See BASE_RESP_HANDLERS
+## in item.py
+##
+
+def _emails_handler (contact, node):
+    contact.emails.populate_from_node(node)
+
+def _ims_handler (contact, node):
+    contact.ims.populate_from_node(node)
+
+def _phones_handler (contact, node):
+    contact.phones.populate_from_node(node)
+
+def _eprop_handler (contact, node):
+    contact.add_extended_property(node=node)
+
+CONTACT_RESP_HANDLERS = {
+    QName_T('FileAs')             : text_handler('file_as'),
+    QName_T('Alias')              : text_handler('alias'),
+    QName_T('SpouseName')         : text_handler('spouse_name'),
+    QName_T('JobTitle')           : text_handler('job_title'),
+    QName_T('CompanyName')        : text_handler('company_name'),
+    QName_T('Department')         : text_handler('department'),
+    QName_T('Manager')            : text_handler('manager'),
+    QName_T('AssistantName')      : text_handler('assistant_name'),
+    QName_T('Birthday')           : text_handler('birthday'),
+    QName_T('WeddingAnniversary') : text_handler('anniversary'),
+    QName_T('GivenName')          : text_handler('complete_name.given_name'),
+    QName_T('Surname')            : text_handler('complete_name.surname'),
+    QName_T('Initials')           : text_handler('complete_name.initials'),
+    QName_T('DisplayName')        : text_handler('display_name'),
+    ## FIXME: We are assuming a text body type, but they could contain html
+    ## or other types as well... Oh, well.
+    QName_T('Body')               : text_handler('notes'),
+    QName_T('EmailAddresses')     : _emails_handler,
+    QName_T('ImAddresses')        : _ims_handler,
+    QName_T('PhoneNumbers')       : _phones_handler,
+    QName_T('BusinessHomePage')   : text_handler('business_home_page'),
+    QName_T('ExtendedProperty')   : _eprop_handler,
+}
+
+## The fields of a LazyContact that are decoded when first used: attribute
+## name -> (field class, tags of the elements the field is decoded from)
+LAZY_FIELDS = dict([(name, (field_class, tags))
+                    for name, field_class, tags in CONTACT_FIELDS])
+
+LAZY_EPROP_ATTRS = frozenset(['eprops', 'eprops_tagged', 'eprops_named_str',
+                              'eprops_named_int', 'last_modified_time',
+                              'gender', 'personal_home_page'])
+
+LAZY_NAME_ATTRS = frozenset(['_firstname', '_lastname', '_displayname'])
+
+LAZY_BASE_RESP_HANDLERS = dict([(tag, h) for tag, h in
+                                BASE_RESP_HANDLERS.iteritems()
+                                if tag != QName_T('LastModifiedTime')])
+
 ## The XML Schema for a EWS Contact, taken from:
 ## http://msdn.microsoft.com/en-us/library/office/aa581315(v=exchg.150).aspx
 ##
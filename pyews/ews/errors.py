@@ -37,6 +37,25 @@ class EWSResponseError(Exception):
 
         return s
 
+class EWSBatchError(Exception):
+    """
+    Raised when some of the requests that a bulk operation was split into
+    failed. resp_obj is the ews.batching.MergedResponse with the results of
+    the others, and the exceptions in its failed_batches.
+    """
+
+    def __init__ (self, resp_obj):
+        self.resp_obj = resp_obj
+
+    def __str__ (self):
+        s = '%d of %d batches failed: ' % (len(self.resp_obj.failed_batches),
+                                          len(self.resp_obj.failed_batches) +
+                                          len(self.resp_obj.responses))
+        for offset, batch, err in self.resp_obj.failed_batches:
+            s += '\n  %d-%d - %s' % (offset, offset + len(batch) - 1, err)
+
+        return s
+
 class EWSCreateFolderError(Exception):
     pass
 
@@ -0,0 +1,109 @@
+##
+## Created : Sun Oct 18 11:40:27 IST 2026
+##
+## Copyright (C) 2026 Sriram Karra <karra.etc@gmail.com>
+##
+## This file is part of pyews
+##
+## pyews is free software: you can redistribute it and/or modify it under
+## the terms of the GNU Affero General Public License as published by the
+## Free Software Foundation, version 3 of the License
+##
+## pyews is distributed in the hope that it will be useful, but WITHOUT
+## ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+## FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero General Public
+## License for more details.
+##
+## You should have a copy of the license in the doc/ directory of pyews.  If
+## not, see <http://www.gnu.org/licenses/>.
+
+import logging, Queue, sys, threading
+
+class RequestExecutor(object):
+    """
+    Runs a bunch of Request objects concurrently on a pool of worker
+    threads, with at most max_workers requests in flight at any time. The
+    threads only live for the duration of a single map() or as_completed()
+    call.
+
+    If a request raises an exception, the requests that have not been
+    started yet are dropped and the exception is raised to the caller -
+    unless return_exceptions is True, in which case all the requests are
+    run and the exception takes the place of the response of the request
+    that raised it.
+    """
+
+    def __init__ (self, max_workers=4):
+        self.max_workers = max_workers
+
+    def map (self, reqs, return_exceptions=False):
+        """
+        Execute all the requests and return a list of their responses in the
+        same order as the requests.
+        """
+
+        reqs = list(reqs)
+        resps = [None] * len(reqs)
+        for i, resp in self.as_completed(reqs, return_exceptions):
+            resps[i] = resp
+
+        return resps
+
+    def as_completed (self, reqs, return_exceptions=False):
+        """
+        A generator that executes all the requests and yields (index, resp)
+        tuples in the order in which the requests complete. index is the
+        position of the request in reqs.
+        """
+
+        reqs = list(reqs)
+
+        if self.max_workers <= 1 or len(reqs) <= 1:
+            for i, req in enumerate(reqs):
+                try:
+                    resp = req.execute()
+                except Exception as e:
+                    if not return_exceptions:
+                        raise
+                    resp = e
+                yield i, resp
+            return
+
+        todo = Queue.Queue()
+        for i, req in enumerate(reqs):
+            todo.put((i, req))
+
+        done = Queue.Queue()
+        stop = threading.Event()
+
+        def worker ():
+            while not stop.is_set():
+                try:
+                    i, req = todo.get_nowait()
+                except Queue.Empty:
+                    return
+
+                try:
+                    done.put((i, req.execute(), None))
+                except Exception:
+                    done.put((i, None, sys.exc_info()))
+
+        nthreads = min(self.max_workers, len(reqs))
+        logging.debug('RequestExecutor: %d requests on %d threads',
+                      len(reqs), nthreads)
+
+        for n in range(nthreads):
+            t = threading.Thread(target=worker, name='pyews-executor-%d' % n)
+            t.daemon = True
+            t.start()
+
+        try:
+            for n in range(len(reqs)):
+                i, resp, exc = done.get()
+                if exc is not None:
+                    if not return_exceptions:
+                        raise exc[0], exc[1], exc[2]
+                    resp = exc[1]
+                yield i, resp
+        finally:
+            stop.set()
@@ -22,7 +22,6 @@ import pyews.utils as utils
 from   pyews.soap import SoapClient, QName_M, QName_T, unQName
 from   pyews.ews.request_response import GetFolderRequest, GetFolderResponse
 from   pyews.ews.request_response import FindFoldersRequest, FindFoldersResponse
-import xml.etree.ElementTree as ET
 
 import logging
 
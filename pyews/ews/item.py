@@ -18,18 +18,19 @@
 ## not, see <http://www.gnu.org/licenses/>.
 
 from    abc             import ABCMeta, abstractmethod
-from    pyews.soap      import SoapClient, QName_M, QName_T, unQName
+from    pyews.soap      import SoapClient, QName_M, QName_T, QN_T
 import  pyews.soap      as     soap
 import  pyews.utils     as     utils
 from    pyews.ews       import mapitags
 from    pyews.ews.data  import MapiPropertyTypeType, MapiPropertyTypeTypeInv
 
-import  xml.etree.ElementTree as ET
-from    xml.sax.saxutils import escape
-import  logging
+import  logging, operator
 
 gnd = SoapClient.get_node_detail
 
+TAG_EXTENDED_FIELD_URI = QN_T['ExtendedFieldURI']
+TAG_VALUE = QN_T['Value']
+
 class ReadOnly:
     """
     When applied as a Mixin, this class will ensure that no XML is generated
@@ -48,17 +49,169 @@ class ReadOnly:
     def write_to_xml (self):
         return ''
 
+    def xml_size (self):
+        return 0
+
+class FieldAttrib(dict):
+    """
+    The attributes of a Field. Any change to them throws away the xml cached
+    for the field.
+    """
+
+    __slots__ = ('owner',)
+
+    def __init__ (self, owner, atts=None):
+        dict.__init__(self)
+        self.owner = owner
+
+        ## One at a time, so the attributes come out in the same order as
+        ## they would from the dictionary we were given
+        if atts is not None:
+            for k, v in atts.iteritems():
+                dict.__setitem__(self, k, v)
+
+    def __setitem__ (self, key, val):
+        dict.__setitem__(self, key, val)
+        self.owner.invalidate()
+
+    def __delitem__ (self, key):
+        dict.__delitem__(self, key)
+        self.owner.invalidate()
+
+    def update (self, *args, **kwargs):
+        dict.update(self, *args, **kwargs)
+        self.owner.invalidate()
+
+    def setdefault (self, key, val=None):
+        self.owner.invalidate()
+        return dict.setdefault(self, key, val)
+
+    def pop (self, *args):
+        self.owner.invalidate()
+        return dict.pop(self, *args)
+
+    def popitem (self):
+        self.owner.invalidate()
+        return dict.popitem(self)
+
+    def clear (self):
+        dict.clear(self)
+        self.owner.invalidate()
+
+class FieldList(list):
+    """
+    The children of a Field. Fields put in here are linked to the owner, so
+    that a change to any of them throws away the xml cached for the owner as
+    well. So does adding or removing a child.
+    """
+
+    __slots__ = ('owner',)
+
+    def __init__ (self, owner, fields=()):
+        list.__init__(self, fields)
+        self.owner = owner
+        for f in self:
+            f.link_parent(owner)
+
+    def _added (self, fields):
+        for f in fields:
+            f.link_parent(self.owner)
+        self.owner.invalidate()
+
+    def _removed (self, fields):
+        ## A field can be in the list more than once
+        for f in fields:
+            if f not in self:
+                f.unlink_parent(self.owner)
+        self.owner.invalidate()
+
+    def append (self, f):
+        list.append(self, f)
+        self._added([f])
+
+    def extend (self, fields):
+        fields = list(fields)
+        list.extend(self, fields)
+        self._added(fields)
+
+    def __iadd__ (self, fields):
+        self.extend(fields)
+        return self
+
+    def insert (self, i, f):
+        list.insert(self, i, f)
+        self._added([f])
+
+    def __setitem__ (self, i, f):
+        old = list.__getitem__(self, i)
+        list.__setitem__(self, i, f)
+        if isinstance(i, slice):
+            self._added(f)
+            self._removed(old)
+        else:
+            self._added([f])
+            self._removed([old])
+
+    def __setslice__ (self, i, j, fields):
+        fields = list(fields)
+        old = list.__getslice__(self, i, j)
+        list.__setslice__(self, i, j, fields)
+        self._added(fields)
+        self._removed(old)
+
+    def __delitem__ (self, i):
+        old = list.__getitem__(self, i)
+        list.__delitem__(self, i)
+        self._removed(old if isinstance(i, slice) else [old])
+
+    def __delslice__ (self, i, j):
+        old = list.__getslice__(self, i, j)
+        list.__delslice__(self, i, j)
+        self._removed(old)
+
+    def remove (self, f):
+        list.remove(self, f)
+        self._removed([f])
+
+    def pop (self, *args):
+        f = list.pop(self, *args)
+        self._removed([f])
+        return f
+
+    def sort (self, *args, **kwargs):
+        list.sort(self, *args, **kwargs)
+        self.owner.invalidate()
+
+    def reverse (self):
+        list.reverse(self)
+        self.owner.invalidate()
+
 class Field:
     """
     Represents an XML Element
+
+    The xml for a field is generated once and cached till the value,
+    attributes or children of the field, or of any field below it, change.
+    Changes to the attrib dictionary and the children list are tracked, and
+    so are assignments to value; anything else that affects the xml should
+    call invalidate().
     """
     __metaclass__ = ABCMeta
 
+    ## Cached output of write_to_xml(), or None
+    _xml = None
+
+    ## The fields whose xml includes ours. See FieldList
+    _parents = ()
+
+    ## Most fields never have any attributes or children, so the containers
+    ## for them are only created when they are first asked for.
+    _attrib = None
+    _children = None
+
     def __init__ (self, tag=None, text=None):
         self.tag = tag
         self.value = text
-        self.attrib = {}
-        self.children = []
         self.read_only = False
 
         ## furi is used when this field needs to be used as part of an update
@@ -72,40 +225,129 @@ class Field:
     @value.setter
     def value (self, val):
         self._value = val
-        
+        self.invalidate()
+
+    @property
+    def attrib (self):
+        if self._attrib is None:
+            self._attrib = FieldAttrib(self)
+        return self._attrib
+
+    @attrib.setter
+    def attrib (self, val):
+        self._attrib = FieldAttrib(self, val)
+        self.invalidate()
+
+    @property
+    def children (self):
+        if self._children is None:
+            self._children = FieldList(self)
+        return self._children
+
+    @children.setter
+    def children (self, val):
+        old = self._children
+        self._children = FieldList(self, val)
+        if old is not None:
+            self._children._removed(old)
+        self.invalidate()
+
+    def link_parent (self, parent):
+        if parent not in self._parents:
+            self._parents += (parent,)
+
+    def unlink_parent (self, parent):
+        """
+        Called when this field is no longer a part of parent, so that parent
+        is not kept alive by us, and is not invalidated by our changes.
+        """
+
+        if parent in self._parents:
+            self._parents = tuple([p for p in self._parents
+                                   if p is not parent])
+
+    def invalidate (self):
+        """
+        Throw away the xml cached for this field, and for all the fields that
+        contain it.
+        """
+
+        ## Not assigned unless there is something to throw away, which keeps
+        ## the instance dictionaries of the many fields that never get
+        ## written out small
+        if self._xml is not None:
+            self._xml = None
+
+        for p in self._parents:
+            p.invalidate()
+
     def add_attrib (self, key, val):
         self.attrib.update({key: val})
 
     def atts_as_xml (self):
-        ats = ['%s="%s"' % (k, v) for k, v in self.attrib.iteritems() if v]
+        if not self._attrib:
+            return ''
+
+        ats = ['%s="%s"' % (k, utils.xml_attr(v))
+               for k, v in self._attrib.iteritems() if v]
         return ' '.join(ats)
 
     def value_as_xml (self):
-        return escape(self.value) if self.value is not None else ''
+        return utils.xml_text(self.value)
 
-    def children_as_xml (self):
-        self.children = self.get_children()
-        xmls = [x.write_to_xml() for x in self.children]
+    def children_as_xml (self, children=None):
+        if children is None:
+            children = self.get_children()
+
+        xmls = [x.write_to_xml() for x in children]
         return '\n'.join([y for y in xmls if y is not None])
 
     def write_to_xml (self):
         """
-        Return an XML representation of this field.
+        Return an XML representation of this field. It is kept till the field
+        changes; see invalidate().
         """
 
+        xml = self._xml
+        if xml is not None:
+            return xml
+
         children = self.get_children()
 
-        if ((self.value is not None) or (len(self.attrib) > 0) or
-            (len(children) > 0)):
+        ## Fields with nothing in them, which is most of them, are cheap to
+        ## write out again and are not worth holding on to a string for.
+        if self.value is None and not self._attrib and len(children) == 0:
+            return ''
+
+        text = self.value_as_xml()
+        ats = self.atts_as_xml()
+        cs = self.children_as_xml(children)
 
-            text = self.value_as_xml()
-            ats = self.atts_as_xml()
-            cs = self.children_as_xml()
+        xml = '<t:%s %s>%s%s</t:%s>' % (self.tag, ats, text, cs, self.tag)
+        self._xml = xml
 
-            ret =  '<t:%s %s>%s%s</t:%s>' % (self.tag, ats, text, cs, self.tag)
-            return ret
-        else:
-            return ''
+        return xml
+
+    def xml_size (self):
+        """
+        The length of what write_to_xml() returns, worked out without putting
+        the xml together, so that nothing gets cached on the way.
+        """
+
+        if self._xml is not None:
+            return len(self._xml)
+
+        children = self.get_children()
+        if self.value is None and not self._attrib and len(children) == 0:
+            return 0
+
+        ## See write_to_xml(). The children are joined with newlines.
+        size = len('<t: ></t:>') + 2 * len(self.tag)
+        size += len(self.atts_as_xml()) + len(self.value_as_xml())
+        if len(children) > 0:
+            size += sum([c.xml_size() for c in children]) + len(children) - 1
+
+        return size
 
     def write_to_xml_get (self):
         """
@@ -124,7 +366,12 @@ class Field:
                     (isinstance(self.value, list) and len(self.value) == 0))
 
     def get_children (self):
-        return self.children
+        ## Not self.children, which would create an empty list for the many
+        ## fields without any
+        if self._children is None:
+            return ()
+
+        return self._children
 
     def set (self, value):
         self.value = value
@@ -197,11 +444,11 @@ class ExtendedProperty(Field):
             from the node.
             """
 
-            uri = node.find(QName_T('ExtendedFieldURI'))
+            uri = node.find(TAG_EXTENDED_FIELD_URI)
             if uri is None:
-                logging.debug('ExtendedProperty.init_from_xml(): no child node ' +
+                logging.debug('ExtendedProperty.init_from_xml(): no child node '
                               'ExtendedFieldURI in node: %s',
-                              pretty_xml(node))
+                              utils.LazyPrettyXml(node))
             else :
                 self.attrib.update(uri.attrib)
 
@@ -231,7 +478,7 @@ class ExtendedProperty(Field):
 
         ## FIXME: We can have a multi-valued property as well.
         if node is not None:
-            self.value = node.find(QName_T('Value')).text
+            self.value = node.find(TAG_VALUE).text
 
         self.children = [self.efuri, self.val]
 
@@ -298,7 +545,7 @@ class ExtendedProperty(Field):
         s += '\n<t:Contact>'
         s += '\n  <t:ExtendedProperty>'
         s += '\n      %s' % ef
-        s += '\n      <t:Value>%s</t:Value>' % escape(str(self.value))
+        s += '\n      <t:Value>%s</t:Value>' % utils.xml_text(self.value)
         s += '\n  </t:ExtendedProperty>'
         s += '\n</t:Contact>'
 
@@ -479,11 +726,105 @@ class LastModifiedTime(ReadOnly, ExtendedProperty):
         ptag  = mapitags.PROP_ID(mapitags.PR_LAST_MODIFICATION_TIME)
         ptype = mapitags.PROP_TYPE(mapitags.PR_LAST_MODIFICATION_TIME)
         ExtendedProperty.__init__(self, node=node, ptag=ptag, ptype=ptype)
+        if node is None and text is not None:
+            self.value = text
+
+##
+## Response parsing. Each item type has a table that maps the fully qualified
+## tags of the child elements of an item in a response to a handler that
+## takes (item, element) and picks up whatever is of interest from the
+## element. That way a child costs a single dictionary lookup.
+##
+
+def text_handler (path):
+    """
+    Return a response handler that sets the value of the field at path - a
+    dotted attribute path starting at the item - to the text of the element
+    """
+
+    get = operator.attrgetter(path)
+
+    def handler (item, node):
+        get(item).value = node.text
+
+    return handler
+
+def _item_id_handler (item, node):
+    item.itemid.value = node.attrib['Id']
+    item.change_key.value = node.attrib['ChangeKey']
+
+def _parent_folder_id_handler (item, node):
+    item.parent_fid = ParentFolderId(node.attrib['Id'])
+    item.parent_fck = ParentFolderChangeKey(node.attrib['ChangeKey'])
+
+def _item_class_handler (item, node):
+    item.item_class = ItemClass(node.text)
+
+def _last_modified_time_handler (item, node):
+    item.last_modified_time = LastModifiedTime(text=node.text)
+
+def _date_time_created_handler (item, node):
+    item.created_time = DateTimeCreated(node.text)
+
+## Handlers for the fields common to all items
+BASE_RESP_HANDLERS = {
+    QName_T('ItemId')          : _item_id_handler,
+    QName_T('ParentFolderId')  : _parent_folder_id_handler,
+    QName_T('ItemClass')       : _item_class_handler,
+    QName_T('LastModifiedTime'): _last_modified_time_handler,
+    QName_T('DateTimeCreated') : _date_time_created_handler,
+}
+
+class ItemField(object):
+    """
+    Class attribute for an attribute of an Item that holds one of the fields
+    the xml of the item is made of. The field is kept in the instance
+    dictionary under the same name. Replacing it with another field has the
+    item put together its children again; the first assignment to the
+    attribute is simply stored.
+    """
+
+    __slots__ = ('name',)
+
+    def __init__ (self, name):
+        self.name = name
+
+    def __get__ (self, item, owner=None):
+        if item is None:
+            return self
+
+        try:
+            return item.__dict__[self.name]
+        except KeyError:
+            raise AttributeError(self.name)
+
+    def __set__ (self, item, field):
+        fields = item.__dict__
+        old = fields.get(self.name)
+        fields[self.name] = field
+
+        if old is not None and old is not field:
+            item.children_changed()
+
+    def __delete__ (self, item):
+        try:
+            old = item.__dict__.pop(self.name)
+        except KeyError:
+            raise AttributeError(self.name)
+
+        if old is not None:
+            item.children_changed()
 
 class Item(Field):
     """
     Abstract wrapper class around an Exchange Item object. Frequently an
     object of this type is instantiated from a response.
+
+    Unlike its fields, an item does not keep its own xml. It is mostly
+    written out once, for a single request, and keeping it would mean
+    linking every one of its fields back to it (see FieldList) - which
+    costs more the first time round than putting together the kept xml of
+    the fields does every time.
     """
 
     __metaclass__ = ABCMeta
@@ -512,6 +853,33 @@ class Item(Field):
         if self.resp_node is not None:
             self._init_base_fields_from_resp(resp_node)
 
+    ## Set when the list returned by get_children() has to be put together
+    ## again. See children_changed()
+    _children_stale = True
+
+    def write_to_xml (self):
+        children = self.get_children()
+        if self.value is None and not self._attrib and len(children) == 0:
+            return ''
+
+        text = self.value_as_xml()
+        ats = self.atts_as_xml()
+        cs = self.children_as_xml(children)
+
+        return '<t:%s %s>%s%s</t:%s>' % (self.tag, ats, text, cs, self.tag)
+
+    def children_changed (self):
+        """
+        To be called when the set of fields that make up the item changes,
+        for e.g. when an extended property is added, or a field is replaced
+        (see ItemField). Sub classes that put together their children in
+        get_children() can use the _children_stale flag to skip that when
+        nothing has changed.
+        """
+
+        self._children_stale = True
+        self.invalidate()
+
     ##
     ## First the abstract methods that will be implementd by sub classes
     ##
@@ -558,11 +926,11 @@ class Item(Field):
         insert that into the self.eprops member variable
         """
 
-        uri = node.find(QName_T('ExtendedFieldURI'))
+        uri = node.find(TAG_EXTENDED_FIELD_URI)
         if uri is None:
-            logging.error('ExtendedProperty.init_from_xml(): no child node ' +
+            logging.error('ExtendedProperty.init_from_xml(): no child node '
                           'ExtendedFieldURI in node: %s',
-                          pretty_xml(node))
+                          utils.LazyPrettyXml(node))
             return
 
         ## Look for known extended properties
@@ -576,6 +944,7 @@ class Item(Field):
         else:
             logging.debug('Unrecognized ExtendedProp Variant. Useless')
             self.eprops.append(ExtendedProperty(node=node))
+            self.children_changed()
 
 
     def add_named_str_property (self, node=None, psetid=None, pname=None,
@@ -586,6 +955,7 @@ class Item(Field):
             eprop.value = value
 
         self.eprops.append(eprop)
+        self.children_changed()
         if eprop.psetid in self.eprops_named_str:
             self.eprops_named_str[eprop.psetid].update({eprop.pname : eprop})
         else:
@@ -600,6 +970,7 @@ class Item(Field):
             eprop.value = value
 
         self.eprops.append(eprop)
+        self.children_changed()
         if eprop.psetid in self.eprops_named_int:
             self.eprops_named_int[eprop.psetid].update({eprop.pid : eprop})
         else:
@@ -664,18 +1035,8 @@ class Item(Field):
         """Return a reference to the parsed Element object for response after
         snarfing all the common fields."""
 
+        handlers = BASE_RESP_HANDLERS
         for child in rnode:
-            tag = unQName(child.tag)
-
-            if tag == 'ItemId':
-                self.itemid.value = child.attrib['Id']
-                self.change_key.value = child.attrib['ChangeKey']
-            elif tag == 'ParentFolderId':
-                self.parent_fid = ParentFolderId(child.attrib['Id'])
-                self.parent_fck = ParentFolderChangeKey(child.attrib['ChangeKey'])
-            elif tag == 'ItemClass':
-                self.item_class = ItemClass(child.text)
-            elif tag == 'LastModifiedTime':
-                self.last_modified_time = LastModifiedTime(child.text)
-            elif tag == 'DateTimeCreated':
-                self.created_time = DateTimeCreated(child.text)
+            handler = handlers.get(child.tag)
+            if handler is not None:
+                handler(self, child)
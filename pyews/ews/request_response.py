@@ -17,15 +17,17 @@
 ## You should have a copy of the license in the doc/ directory of pyews.  If
 ## not, see <http://www.gnu.org/licenses/>.
 
-import logging
-import xml.etree.ElementTree as ET
+import logging, time
 import pyews.utils as utils
 
 from   abc            import ABCMeta, abstractmethod
-from   pyews.soap     import SoapClient, QName_S, QName_T, QName_M
+from   tornado        import gen
+from   pyews.soap     import SoapClient, QName_S, QName_T, QName_M, QName_E
 from   pyews.utils    import pretty_xml
-from   pyews.ews.contact    import Contact
+from   pyews.ews.contact    import Contact, LazyContact
 from   pyews.ews.errors     import EWSMessageError, EWSResponseError
+from   pyews.ews.timing     import RequestTimings
+from   pyews.ews            import builders
 
 ##
 ## Base classes
@@ -34,31 +36,327 @@ from   pyews.ews.errors     import EWSMessageError, EWSResponseError
 class Request(object):
     __metaclass__ = ABCMeta
 
+    ## Requests whose responses carry a list of items set this to the tag of
+    ## the item elements. When response streaming is turned on in the
+    ## service, items are built as soon as their element is parsed off the
+    ## wire. See SoapStreamTarget for the details.
+    stream_tag = None
+
+    ## Requests that carry a list of items (or item ids) that can be split
+    ## across several requests name the keyword argument with the list here,
+    ## and estimate the serialized size of an entry of it in item_size(). See
+    ## ews.batching
+    batch_arg = None
+
+    ## Whether sending the request twice has the same effect as sending it
+    ## once. Requests that create, change or delete things set this to
+    ## False, and are then retried only for errors that show the server did
+    ## not run them. See ews.retry
+    idempotent = True
+
+    ## Whether the request and response xml should be logged. This can be
+    ## overridden for all requests with ExchangeService.log_payloads.
+    debug = False
+
     def __init__ (self, ews, template=None):
         self.ews = ews
         self.template = template
         self.kwargs = None
         self.resp = None
+        self.resp_node = None
+        self.resp_obj = None
+        self.streamed_items = None
+        self.timings = None
+
+    @staticmethod
+    def item_size (value):
+        return 0
 
     ##
     ## Abstract methods
     ##
 
     @abstractmethod
-    def execute (self):
+    def process_response (self, node):
+        """
+        node is the parsed response from the server. Build, save in
+        self.resp_obj and return the Response object for it.
+        """
         pass
 
     ##
     ## Public methods
     ##
 
-    def request_server (self, debug=False):
-        r = self.ews.loader.load(self.template).generate(**self.kwargs)
-        r = utils.pretty_xml(r)
+    def execute (self):
+        """
+        Send the request to the server and return the response object.
+        Transient failures - the server being busy or throttling us,
+        connection errors and the like - are retried as per the service's
+        retry_policy, if it has one.
+        """
+
+        self.timings = self.start_timings()
+        debug = self.log_payloads()
+
+        attempt = 0
+        while True:
+            try:
+                self.resp_node = self.request_server(debug=debug)
+                self.build_response(self.resp_node)
+                delay = self.retry_delay(None, attempt)
+            except Exception as e:
+                delay = self.retry_delay(e, attempt)
+                if delay is None:
+                    self.finish_timings(attempt, e)
+                    raise
+
+            if delay is None:
+                self.finish_timings(attempt)
+                return self.resp_obj
+
+            if self.timings is not None:
+                self.timings.retry_wait += delay
+
+            time.sleep(delay)
+            attempt += 1
+
+    @gen.coroutine
+    def execute_async (self):
+        """
+        Coroutine version of execute() for use with a service whose send()
+        method returns a future - see AsyncExchangeService. The rendering of
+        the request and the processing of the response are the same.
+        """
+
+        self.timings = self.start_timings()
+        debug = self.log_payloads()
+
+        attempt = 0
+        while True:
+            try:
+                self.resp_node = yield self.request_server(debug=debug)
+                self.build_response(self.resp_node)
+                delay = self.retry_delay(None, attempt)
+            except Exception as e:
+                delay = self.retry_delay(e, attempt)
+                if delay is None:
+                    self.finish_timings(attempt, e)
+                    raise
+
+            if delay is None:
+                self.finish_timings(attempt)
+                raise gen.Return(self.resp_obj)
+
+            if self.timings is not None:
+                self.timings.retry_wait += delay
+
+            yield gen.sleep(delay)
+            attempt += 1
+
+    def retry_delay (self, err, attempt):
+        """
+        Returns the number of seconds to wait before retrying the request, or
+        None if it should not be retried. err is the exception raised by the
+        attempt-th try, or None if it did return a response; in the latter
+        case the response is retried only if all its messages failed.
+        """
+
+        policy = self.ews.retry_policy
+        if policy is None:
+            return None
+
+        if err is None:
+            if not (self.resp_obj.has_errors() and self.resp_obj.suc_cnt == 0):
+                return None
+            err = EWSResponseError(self.resp_obj)
+
+        return policy.next_delay(err, attempt, self.idempotent)
+
+    def build_response (self, node):
+        """
+        process_response() with the time taken accounted as build time
+        """
+
+        if self.timings is None:
+            return self.process_response(node)
+
+        t = time.time()
+        resp = self.process_response(node)
+        self.timings.build += time.time() - t
+
+        return resp
+
+    def start_timings (self):
+        """
+        Return a new RequestTimings object to fill in, or None if nobody is
+        interested.
+        """
+
+        if len(self.ews.timing_sinks) == 0:
+            return None
+
+        return RequestTimings(self.__class__.__name__)
+
+    def finish_timings (self, attempt, err=None):
+        """
+        Wrap up the timings of this request and pass them on to the sinks.
+        attempt is the number of retries done, and err the exception the
+        request failed with, if it did.
+        """
+
+        t = self.timings
+        if t is None:
+            return
+
+        t.total = time.time() - t.start
+        t.attempts = attempt + 1
+        if err is not None:
+            t.error = err.__class__.__name__
+        elif self.resp_obj is not None:
+            t.items = self.resp_obj.item_count()
+
+        for sink in self.ews.timing_sinks:
+            try:
+                sink.record(t)
+            except Exception as e:
+                logging.error('Request: Error in timing sink %s: %s', sink, e)
+
+    def log_payloads (self):
+        """
+        True if the request and response xml should be written to the log
+        for this request.
+        """
+
+        flag = self.ews.log_payloads
+        if flag is None:
+            flag = self.debug
+
+        return flag and utils.debug_enabled()
+
+    def body_streamer (self):
+        """
+        Return the generator function to build the request body with if the
+        request carries enough items that its body should be streamed - see
+        ExchangeService.stream_request_items - otherwise None.
+        """
+
+        ews = self.ews
+        if (ews.stream_request_items is None or not ews.request_builders or
+            not ews.compact_requests):
+            return None
+
+        items = self.kwargs.get('items')
+        if items is None or len(items) < ews.stream_request_items:
+            return None
+
+        return builders.STREAMERS.get(self.template)
+
+    def render (self, debug=False):
+        """
+        Return the xml for the request. If there is a request builder for our
+        template that is used, otherwise the template is rendered.
+
+        For large CreateItems and UpdateItems requests this returns a
+        generator that yields the body in chunks instead; the items are
+        serialized as the body is being sent. A new generator is returned
+        for every call, so every retry sends the whole body again.
+        """
+
+        stream = self.body_streamer()
+        if stream is not None:
+            if debug:
+                logging.debug('Request: %s with %d items; streaming the body',
+                              self.__class__.__name__,
+                              len(self.kwargs['items']))
+            if self.timings is not None:
+                return self.timed_chunks(stream(**self.kwargs))
+            return stream(**self.kwargs)
+
+        if self.timings is not None:
+            t = time.time()
+
+        build = None
+        if self.ews.request_builders:
+            build = builders.BUILDERS.get(self.template)
+
+        if build is not None:
+            r = build(**self.kwargs)
+        else:
+            r = self.ews.loader.load(self.template).generate(**self.kwargs)
+
+        if self.timings is not None:
+            t2 = time.time()
+            self.timings.render += t2 - t
+
+        ## Builders produce compact xml to start with
+        if not self.ews.compact_requests:
+            r = utils.pretty_xml(r)
+        elif build is None:
+            r = utils.compact_xml(r)
+
+        if self.timings is not None:
+            self.timings.serialize += time.time() - t2
 
         if debug:
-            logging.debug('Request: %s', r)
-        return self.ews.send(r, debug)
+            logging.debug('Request: %s', utils.LazyPrettyXml(r))
+
+        return r
+
+    def timed_chunks (self, chunks):
+        """
+        Pass on the chunks of a streamed request body, with the time taken to
+        produce each accounted as render time. This happens while the body
+        is being sent, so the same time is taken out of the network time.
+        """
+
+        timings = self.timings
+        chunks = iter(chunks)
+        while True:
+            t = time.time()
+            try:
+                chunk = next(chunks)
+            except StopIteration:
+                chunk = None
+
+            t = time.time() - t
+            timings.render += t
+            timings.inline_render += t
+
+            if chunk is None:
+                return
+            yield chunk
+
+    def request_server (self, debug=False):
+        """
+        Send the request and return the parsed response, or for asynchronous
+        services, a future that resolves to it.
+        """
+
+        r = self.render(debug)
+
+        if self.stream_tag is not None and self.ews.stream_responses:
+            self.streamed_items = []
+            return self.ews.send(r, debug, stream_tag=self.stream_tag,
+                                 on_elem=self.on_stream_elem,
+                                 timings=self.timings)
+
+        return self.ews.send(r, debug, timings=self.timings)
+
+    def on_stream_elem (self, elem):
+        ## A LazyContact decodes its fields from the element later on, so the
+        ## element must not be cleared once we are done here
+        if self.timings is None:
+            self.streamed_items.append(make_contact(self.ews, elem))
+            return self.ews.lazy_contacts
+
+        t = time.time()
+        self.streamed_items.append(make_contact(self.ews, elem))
+        t = time.time() - t
+        self.timings.build += t
+        self.timings.inline_build += t
+
+        return self.ews.lazy_contacts
 
     def assert_error (self):
         if self.resp is not None:
@@ -67,10 +365,106 @@ class Request(object):
         if self.has_errors():
             raise EWSResponseError(self.resp)
 
+class ResponseScan(object):
+    """
+    Everything the Response classes look for in a response, gathered in a
+    single walk down the tree: the faults, the response messages, the
+    first RootFolder, the contacts, the first folder or list of folders,
+    the sync state and the changes of a SyncFolderItems response.
+
+    The walk does not go into the elements it collects - faults, items and
+    folders - so what it costs depends on the number of response messages
+    and not on the size of the items in them.
+    """
+
+    def __init__ (self, node):
+        self.faults = []
+        self.messages = []
+        self.root_folder = None
+        self.contacts = []
+        self.folder = None
+        self.folders = None
+        self.sync_state = None
+        self.creates = []
+        self.updates = []
+        self.deletes = []
+
+        self.walk(node)
+
+    def walk (self, node):
+        handlers = SCAN_HANDLERS
+        for child in node:
+            handler = handlers.get(child.tag)
+            if handler is None or handler(self, child):
+                self.walk(child)
+
+##
+## Handlers for the elements of interest to ResponseScan. Each one returns
+## True if the walk should go on into the element.
+##
+
+def _scan_fault (scan, node):
+    scan.faults.append(node)
+    return False
+
+def _scan_response_messages (scan, node):
+    scan.messages.extend(node)
+    return True
+
+def _scan_root_folder (scan, node):
+    if scan.root_folder is None:
+        scan.root_folder = node
+    return True
+
+def _scan_contact (scan, node):
+    scan.contacts.append(node)
+    return False
+
+def _scan_folder (scan, node):
+    if scan.folder is None:
+        scan.folder = node
+    return False
+
+def _scan_folders (scan, node):
+    if scan.folders is None:
+        scan.folders = node
+    return False
+
+def _scan_sync_state (scan, node):
+    if scan.sync_state is None:
+        scan.sync_state = node.text
+    return False
+
+def _scan_create (scan, node):
+    scan.creates.extend(node)
+    return False
+
+def _scan_update (scan, node):
+    scan.updates.extend(node)
+    return False
+
+def _scan_delete (scan, node):
+    scan.deletes.extend(node)
+    return False
+
+SCAN_HANDLERS = {
+    QName_S('Fault')            : _scan_fault,
+    QName_M('ResponseMessages') : _scan_response_messages,
+    QName_M('RootFolder')       : _scan_root_folder,
+    QName_T('Contact')          : _scan_contact,
+    QName_T('Folder')           : _scan_folder,
+    QName_T('Folders')          : _scan_folders,
+    QName_M('SyncState')        : _scan_sync_state,
+    QName_T('Create')           : _scan_create,
+    QName_T('Update')           : _scan_update,
+    QName_T('Delete')           : _scan_delete,
+}
+
 class Response(object):
     def __init__ (self, req, node):
         self.req = req
         self.node = node
+        self.scan = ResponseScan(node)
         self.err_cnt = 0
         self.suc_cnt = 0
         self.war_cnt = 0
@@ -79,11 +473,16 @@ class Response(object):
         ## Useful for some response objects.
         self.includes_last = True
 
+        ## Item bearing responses set this to the list of items
+        self.items = None
+
         self.parse_for_faults()
 
     def snarf_includes_last (self):
-        gna = SoapClient.get_node_attribute
-        last = gna(self.node, 'RootFolder', 'IncludesLastItemInRange')
+        root = self.scan.root_folder
+        last = None
+        if root is not None:
+            last = root.attrib['IncludesLastItemInRange']
         self.includes_last = (last == 'true')
 
         return self.includes_last
@@ -95,18 +494,29 @@ class Response(object):
         """
 
         self.has_faults = False
+        self.fault_resp_code = None
+        self.back_off_ms = None
 
-        for fault in self.node.iter(QName_S('Fault')):
+        for fault in self.scan.faults:
             self.fault_code = fault.find('faultcode').text
             self.fault_str  = fault.find('faultstring').text
             self.has_faults = True
 
+            ## The detail element has the EWS response code, and for
+            ## throttling errors, a hint on how long to back off.
+            detail = fault.find('detail')
+            if detail is not None:
+                rc = detail.find(QName_E('ResponseCode'))
+                if rc is not None:
+                    self.fault_resp_code = rc.text
+                self.back_off_ms = get_back_off_ms(detail)
+
             raise EWSMessageError(self)
 
     def parse_for_errors (self, tag, succ_func=None):
         """
-        Look in the present response node for all child nodes of given tag,
-        while looking for errors and warnings as well.
+        Look in the present response node for all the response messages of
+        given tag, while looking for errors and warnings as well.
 
         Errors are when the server understood our message, but could not do
         what was asked of it, for whatever reason.
@@ -115,7 +525,10 @@ class Response(object):
         assert self.node is not None
 
         i = 0
-        for gfrm in self.node.iter(tag):
+        for gfrm in self.scan.messages:
+            if gfrm.tag != tag:
+                continue
+
             resp_class = gfrm.attrib['ResponseClass']
             if resp_class == 'Error':
                 self.err_cnt += 1
@@ -139,6 +552,67 @@ class Response(object):
     def has_errors (self):
         return self.err_cnt > 0
 
+    def item_count (self):
+        """
+        Number of items (or folders) in the response, used for the timings.
+        For responses that do not carry items, such as that of a DeleteItem,
+        this is the number of response messages.
+        """
+
+        if self.items is not None:
+            return len(self.items)
+
+        return self.suc_cnt + self.war_cnt + self.err_cnt
+
+    def build_items (self):
+        """
+        Return a list of Contact objects for all the contacts in the
+        response. If the response was streamed the items have already been
+        built during the parse.
+        """
+
+        if self.req.streamed_items is not None:
+            return self.req.streamed_items
+
+        ## FIXME: As we support additional item types we will add more such
+        ## loops.
+        return [make_contact(self.req.ews, cxml)
+                for cxml in self.scan.contacts]
+
+def make_contact (ews, node):
+    """
+    Build a Contact from a response element - or a LazyContact if the
+    service is set up for lazy_contacts.
+    """
+
+    if ews.lazy_contacts:
+        return LazyContact(ews, resp_node=node)
+
+    return Contact(ews, resp_node=node)
+
+def get_back_off_ms (node):
+    """
+    node is a MessageXml element (or its parent) from an error response. If
+    the server has told us how long to back off, return that as an integer
+    number of milli seconds, otherwise None.
+
+    <t:MessageXml>
+      <t:Value Name="BackOffMilliseconds">297749</t:Value>
+    </t:MessageXml>
+    """
+
+    if node is None:
+        return None
+
+    for val in node.iter(QName_T('Value')):
+        if val.attrib.get('Name') == 'BackOffMilliseconds':
+            try:
+                return int(val.text)
+            except (TypeError, ValueError):
+                return None
+
+    return None
+
 class EWSErrorElement(object):
     """
     Wraps an XML response element that represents an erorr response from the
@@ -164,6 +638,8 @@ class EWSErrorElement(object):
         t = node.find(QName_M('DescriptiveLinkKey'))
         self.des_link_key = t.text if t is not None else None
 
+        self.back_off_ms = get_back_off_ms(node.find(QName_M('MessageXml')))
+
     def __str__ (self):
         return 'Code: %s; Text: %s' % (self.resp_code, self.msg_text)
 
@@ -180,9 +656,8 @@ class GetFolderRequest(Request):
     ## Implement the abstract methods
     ##
 
-    def execute (self):
-        self.resp_node = self.request_server(debug=False)
-        self.resp_obj = GetFolderResponse(self, self.resp_node)
+    def process_response (self, node):
+        self.resp_obj = GetFolderResponse(self, node)
 
         return self.resp_obj
 
@@ -199,26 +674,32 @@ class GetFolderResponse(Response):
         """
 
         self.parse_for_errors(QName_M('GetFolderResponseMessage'))
-        for child in self.node.iter(QName_T('Folder')):
-            self.folder_node = child
-            break
+        if self.scan.folder is not None:
+            self.folder_node = self.scan.folder
 
 ##
 ## CreateItems
 ##
 
 class CreateItemsRequest(Request):
+    debug = True
+    batch_arg = 'items'
+    idempotent = False
+
     def __init__ (self, ews, **kwargs):
         Request.__init__(self, ews, template=utils.REQ_CREATE_ITEM)
         self.kwargs = kwargs
 
+    @staticmethod
+    def item_size (item):
+        return item.xml_size()
+
     ##
     ## Implement the abstract methods
     ##
 
-    def execute (self):
-        self.resp_node = self.request_server(debug=True)
-        self.resp_obj = CreateItemsResponse(self, self.resp_node)
+    def process_response (self, node):
+        self.resp_obj = CreateItemsResponse(self, node)
 
         return self.resp_obj
 
@@ -252,17 +733,24 @@ class CreateItemsResponse(Response):
 ##
 
 class DeleteItemsRequest(Request):
+    debug = True
+    batch_arg = 'itemids'
+    idempotent = False
+
     def __init__ (self, ews, **kwargs):
         Request.__init__(self, ews, template=utils.REQ_DELETE_ITEM)
         self.kwargs = kwargs
 
+    @staticmethod
+    def item_size (itemid):
+        return len('<t:ItemId Id=""/>') + len(itemid)
+
     ##
     ## Implement the abstract methods
     ##
 
-    def execute (self):
-        self.resp_node = self.request_server(debug=True)
-        self.resp_obj = DeleteItemsResponse(self, self.resp_node)
+    def process_response (self, node):
+        self.resp_obj = DeleteItemsResponse(self, node)
 
         return self.resp_obj
 
@@ -293,9 +781,8 @@ class FindFoldersRequest(Request):
     ## Implement the abstract methods
     ##
 
-    def execute (self):
-        self.resp_node = self.request_server(debug=False)
-        self.resp_obj = FindFoldersResponse(self, self.resp_node)
+    def process_response (self, node):
+        self.resp_obj = FindFoldersResponse(self, node)
 
         return self.resp_obj
 
@@ -316,16 +803,20 @@ class FindFoldersResponse(Response):
         self.parse_for_errors(QName_M('FindFolderResponseMessage'))
 
         self.folders = []
-        for folders  in self.node.iter(QName_T('Folders')):
-            for child in folders:
+        if self.scan.folders is not None:
+            for child in self.scan.folders:
                 self.folders.append(F(self.req.ews, None, node=child))
-            break
+
+    def item_count (self):
+        return len(self.folders)
 
 ##
 ## FindItems
 ##
 
 class FindItemsRequest(Request):
+    stream_tag = QName_T('Contact')
+
     def __init__ (self, ews, **kwargs):
         Request.__init__(self, ews, template=utils.REQ_FIND_ITEM)
         self.kwargs = kwargs
@@ -334,9 +825,8 @@ class FindItemsRequest(Request):
     ## Implement the abstract methods
     ##
 
-    def execute (self):
-        self.resp_node = self.request_server(debug=False)
-        self.resp_obj = FindItemsResponse(self, self.resp_node)
+    def process_response (self, node):
+        self.resp_obj = FindItemsResponse(self, node)
 
         return self.resp_obj
 
@@ -354,17 +844,15 @@ class FindItemsResponse(Response):
         self.snarf_includes_last()
         self.parse_for_errors(QName_M('FindItemResponseMessage'))
 
-        self.items = []
-        ## FIXME: As we support additional item types we will add more such
-        ## loops.
-        for cxml in self.node.iter(QName_T('Contact')):
-            self.items.append(Contact(self, resp_node=cxml))
+        self.items = self.build_items()
 
 ##
 ## FindItemsLMT
 ##
 
 class FindItemsLMTRequest(Request):
+    stream_tag = QName_T('Contact')
+
     def __init__ (self, ews, **kwargs):
         Request.__init__(self, ews, template=utils.REQ_FIND_ITEM_LMT)
         self.kwargs = kwargs
@@ -373,10 +861,8 @@ class FindItemsLMTRequest(Request):
     ## Implement the abstract methods
     ##
 
-    def execute (self):
-        print '*** WTF: ', self.kwargs
-        self.resp_node = self.request_server(debug=False)
-        self.resp_obj = FindItemsLMTResponse(self, self.resp_node)
+    def process_response (self, node):
+        self.resp_obj = FindItemsLMTResponse(self, node)
 
         return self.resp_obj
 
@@ -394,17 +880,16 @@ class FindItemsLMTResponse(Response):
         self.snarf_includes_last()
         self.parse_for_errors(QName_M('FindItemResponseMessage'))
 
-        self.items = []
-        ## FIXME: As we support additional item types we will add more such
-        ## loops.
-        for cxml in self.node.iter(QName_T('Contact')):
-            self.items.append(Contact(self, resp_node=cxml))
+        self.items = self.build_items()
 
 ##
 ## GetItems
 ##
 
 class GetItemsRequest(Request):
+    stream_tag = QName_T('Contact')
+    debug = True
+
     def __init__ (self, ews, **kwargs):
         Request.__init__(self, ews, template=utils.REQ_GET_ITEM)
         self.kwargs = kwargs
@@ -413,9 +898,8 @@ class GetItemsRequest(Request):
     ## Implement the abstract methods
     ##
 
-    def execute (self):
-        self.resp_node = self.request_server(debug=True)
-        self.resp_obj = GetItemsResponse(self, self.resp_node)
+    def process_response (self, node):
+        self.resp_obj = GetItemsResponse(self, node)
 
         return self.resp_obj
 
@@ -433,11 +917,7 @@ class GetItemsResponse(Response):
 
         self.parse_for_errors(QName_M('GetItemResponseMessage'))
 
-        self.items = []
-        ## FIXME: As we support additional item types we will add more such
-        ## loops.
-        for cxml in self.node.iter(QName_T('Contact')):
-            self.items.append(Contact(self, resp_node=cxml))
+        self.items = self.build_items()
 
 ##
 ## UpdateItems
@@ -449,6 +929,10 @@ class UpdateItemsRequest(Request):
     returned changekeys back to the source item objects
     """
 
+    stream_tag = QName_T('Contact')
+    batch_arg = 'items'
+    idempotent = False
+
     def __init__ (self, ews, **kwargs):
         Request.__init__(self, ews, template=utils.REQ_UPDATE_ITEM)
         self.kwargs = kwargs
@@ -461,13 +945,16 @@ class UpdateItemsRequest(Request):
     ## Implement the abstract methods
     ##
 
-    def execute (self):
-        self.resp_node = self.request_server(debug=False)
-        self.resp_obj = UpdateItemsResponse(self, self.resp_node)
+    def process_response (self, node):
+        self.resp_obj = UpdateItemsResponse(self, node)
         self.update_change_keys()
 
         return self.resp_obj
 
+    @staticmethod
+    def item_size (item):
+        return len(builders.item_change(item))
+
     def update_change_keys (self):
         for resp_item in self.resp_obj.items:
             iid = resp_item.itemid.value
@@ -489,11 +976,7 @@ class UpdateItemsResponse(Response):
 
         self.parse_for_errors(QName_M('UpdateItemResponseMessage'))
 
-        self.items = []
-        ## FIXME: As we support additional item types we will add more such
-        ## loops.
-        for cxml in self.node.iter(QName_T('Contact')):
-            self.items.append(Contact(self, resp_node=cxml))
+        self.items = self.build_items()
 
 ##
 ## SyncFolder
@@ -515,9 +998,8 @@ class SyncFolderItemsRequest(Request):
     ## Implement the abstract methods
     ##
 
-    def execute (self):
-        self.resp_node = self.request_server(debug=False)
-        self.resp_obj = SyncFolderItemsResponse(self, self.resp_node)
+    def process_response (self, node):
+        self.resp_obj = SyncFolderItemsResponse(self, node)
 
         return self.resp_obj
 
@@ -533,24 +1015,16 @@ class SyncFolderItemsResponse(Response):
         node is a parsed XML Element containing the response. FIXME
         """
 
-        find_child = SoapClient.find_first_child
+        ews = self.req.ews
+        scan = self.scan
 
         self.parse_for_errors(QName_M('SyncFolderItemsResponseMessage'))
         self.snarf_includes_last()
-        self.sync_state = find_child(node, QName_M('SyncState'))
-
-        self.news = []
-        self.mods = []
-        self.dels = []
-
-        for create in node.iter(QName_T('Create')):
-            for child in create:
-                self.news.append(Contact(self.req.ews, resp_node=child))
+        self.sync_state = scan.sync_state
 
-        for create in node.iter(QName_T('Update')):
-            for child in create:
-                self.mods.append(Contact(self.req.ews, resp_node=child))
+        self.news = [make_contact(ews, child) for child in scan.creates]
+        self.mods = [make_contact(ews, child) for child in scan.updates]
+        self.dels = [make_contact(ews, child) for child in scan.deletes]
 
-        for create in node.iter(QName_T('Delete')):
-            for child in create:
-                self.dels.append(Contact(self.req.ews, resp_node=child))
+    def item_count (self):
+        return len(self.news) + len(self.mods) + len(self.dels)
@@ -0,0 +1,185 @@
+##
+## Created : Sun Oct 18 10:12:03 IST 2026
+##
+## Copyright (C) 2026 Sriram Karra <karra.etc@gmail.com>
+##
+## This file is part of pyews
+##
+## pyews is free software: you can redistribute it and/or modify it under
+## the terms of the GNU Affero General Public License as published by the
+## Free Software Foundation, version 3 of the License
+##
+## pyews is distributed in the hope that it will be useful, but WITHOUT
+## ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+## FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero General Public
+## License for more details.
+##
+## You should have a copy of the license in the doc/ directory of pyews.  If
+## not, see <http://www.gnu.org/licenses/>.
+
+##
+## Exchange throttles clients that are too chatty. When it does so it either
+## answers with a ErrorServerBusy response code (as a SOAP Fault or as a
+## per-message error) along with a BackOffMilliseconds hint, or the front
+## end simply returns a HTTP 503 / 429. The RetryPolicy here decides which
+## errors are worth retrying and how long to wait before doing so.
+##
+## Requests that change things on the server - creating, updating or
+## deleting items - are not idempotent: a read timeout or a 504 from a
+## proxy says nothing about whether the server went ahead with the request,
+## and trying again could create the same items twice. Those are retried
+## only for errors that show the server did not run the request at all.
+##
+
+import logging, random, threading
+
+from   pyews.soap       import SoapConnectionError, SoapHTTPError
+from   pyews.soap       import HTTP_ERROR_STATUSES
+from   pyews.ews.errors import EWSMessageError, EWSResponseError
+
+## EWS response codes that indicate a transient condition on the server
+RETRYABLE_CODES = frozenset([
+    'ErrorServerBusy',
+    'ErrorTimeoutExpired',
+    'ErrorInternalServerTransientError',
+    'ErrorMailboxStoreUnavailable',
+    'ErrorMailboxMoveInProgress',
+    'ErrorConnectionFailed',
+    'ErrorTooManyObjectsOpened',
+    ])
+
+## The response codes and HTTP statuses with which the server turns away a
+## request without running it. Only these are retried for requests that are
+## not idempotent.
+UNSENT_CODES = frozenset(['ErrorServerBusy'])
+UNSENT_HTTP_STATUSES = frozenset([429, 503])
+
+class RetryPolicy(object):
+    """
+    Jittered exponential backoff with a retry budget. A single policy object
+    is typically shared by all the requests of a job (a ExchangeService, in
+    practice), and the budget caps the total number of retries across all of
+    them. Call reset() to start a new job.
+
+    The policy object is thread safe.
+    """
+
+    def __init__ (self, max_attempts=5, base_delay=1.0, max_delay=60.0,
+                  budget=100, max_wait=600.0):
+        """
+        max_attempts is the maximum number of times a request is sent,
+        including the first one. The n-th retry waits a random time between 0
+        and min(max_delay, base_delay * 2**n) seconds, unless the server told
+        us how long to back off, in which case we wait for that long plus a
+        bit of jitter. If the server asks for more than max_wait seconds we
+        give up right away.
+        """
+
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.budget = budget
+        self.max_wait = max_wait
+
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset (self):
+        with self.lock:
+            self.retries = 0
+            self.gave_up = 0
+            self.wait_time = 0.0
+            self.by_reason = {}
+
+    def classify (self, err, idempotent=True):
+        """
+        Return a (retryable, hint, reason) tuple for the given exception.
+        hint is the backoff time in seconds suggested by the server, and
+        None if it did not suggest one. For a request that is not idempotent
+        only the errors that show it was not run are retryable.
+        """
+
+        if idempotent:
+            codes, statuses = RETRYABLE_CODES, HTTP_ERROR_STATUSES
+        else:
+            codes, statuses = UNSENT_CODES, UNSENT_HTTP_STATUSES
+
+        if isinstance(err, SoapConnectionError):
+            return idempotent or not err.sent, None, 'ConnectionError'
+
+        if isinstance(err, SoapHTTPError):
+            return (err.status_code in statuses, err.retry_after,
+                    'HTTP%d' % err.status_code)
+
+        if isinstance(err, EWSMessageError):
+            resp = err.resp_obj
+            hint = resp.back_off_ms / 1000.0 if resp.back_off_ms else None
+            return (resp.fault_resp_code in codes, hint,
+                    resp.fault_resp_code)
+
+        if isinstance(err, EWSResponseError):
+            ## Only when none of the messages went through - otherwise
+            ## retrying the request would repeat work that was done.
+            resp = err.resp_obj
+            if resp.suc_cnt > 0 or resp.war_cnt > 0 or resp.err_cnt == 0:
+                return False, None, None
+
+            err_codes = set([e.resp_code for e in resp.errors.itervalues()])
+            if not err_codes.issubset(codes):
+                return False, None, None
+
+            hints = [e.back_off_ms for e in resp.errors.itervalues()
+                     if e.back_off_ms]
+            hint = max(hints) / 1000.0 if len(hints) > 0 else None
+            return True, hint, ','.join(sorted(err_codes))
+
+        return False, None, None
+
+    def next_delay (self, err, attempt, idempotent=True):
+        """
+        err is the error hit on the attempt-th try (counting from 0) of a
+        request. Returns the number of seconds to wait before trying again, or
+        None if the error should not be retried. Updates the counters.
+        """
+
+        retryable, hint, reason = self.classify(err, idempotent)
+        if not retryable:
+            return None
+
+        with self.lock:
+            if (attempt + 1 >= self.max_attempts or
+                self.retries >= self.budget or
+                (hint is not None and hint > self.max_wait)):
+                self.gave_up += 1
+                logging.warning('RetryPolicy: giving up after %d attempts '
+                                '(%s). Retries so far: %d of %d', attempt + 1,
+                                reason, self.retries, self.budget)
+                return None
+
+            if hint is not None:
+                delay = hint + random.uniform(0, self.base_delay)
+            else:
+                cap = min(self.max_delay, self.base_delay * (2 ** attempt))
+                delay = random.uniform(0, cap)
+
+            self.retries += 1
+            self.wait_time += delay
+            self.by_reason[reason] = self.by_reason.get(reason, 0) + 1
+
+        logging.info('RetryPolicy: %s on attempt %d; retrying in %.2fs',
+                     reason, attempt + 1, delay)
+        return delay
+
+    def counters (self):
+        """
+        Return a snapshot of the retry counters as a dictionary.
+        """
+
+        with self.lock:
+            return {
+                'retries'   : self.retries,
+                'gave_up'   : self.gave_up,
+                'wait_time' : self.wait_time,
+                'budget_left' : max(0, self.budget - self.retries),
+                'by_reason' : dict(self.by_reason),
+                }
@@ -0,0 +1,179 @@
+##
+## Created : Sun Oct 18 14:48:30 IST 2026
+##
+## Copyright (C) 2026 Sriram Karra <karra.etc@gmail.com>
+##
+## This file is part of pyews
+##
+## pyews is free software: you can redistribute it and/or modify it under
+## the terms of the GNU Affero General Public License as published by the
+## Free Software Foundation, version 3 of the License
+##
+## pyews is distributed in the hope that it will be useful, but WITHOUT
+## ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+## FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero General Public
+## License for more details.
+##
+## You should have a copy of the license in the doc/ directory of pyews.  If
+## not, see <http://www.gnu.org/licenses/>.
+
+##
+## Where does the time go in a request? When a service has one or more
+## timing sinks, every Request it executes fills in a RequestTimings object
+## with the time spent in each phase, and hands it to the sinks once the
+## request is done. A sink is any object with a record(timings) method. With
+## no sinks (the default) none of this costs anything beyond a check or two
+## per request.
+##
+##     stats = AggregateSink()
+##     ews.timing_sinks.append(stats)
+##     ...
+##     print stats.report()
+##
+
+import logging, threading, time
+
+class RequestTimings(object):
+    """
+    Per phase durations (in seconds) and sizes for a single execution of a
+    request, summed over all the attempts if it had to be retried:
+
+    - render    : generating the request xml from the template. A streamed
+                  body is generated while it is sent, and that time is
+                  taken out of the network time.
+    - serialize : cleaning up and encoding (and compressing) the request
+    - network   : waiting on the server, sending and receiving
+    - parse     : decompressing and parsing the response xml
+    - build     : building the Response and item objects from the xml
+    - retry_wait: sleeping between attempts
+    - total     : wall clock time for the whole thing
+    """
+
+    PHASES = ['render', 'serialize', 'network', 'parse', 'build',
+              'retry_wait']
+    COUNTS = ['req_bytes', 'req_wire_bytes', 'resp_bytes', 'resp_wire_bytes',
+              'items']
+
+    def __init__ (self, name):
+        self.name = name
+        self.start = time.time()
+        self.total = 0.0
+        self.attempts = 0
+        self.error = None
+
+        for f in self.PHASES:
+            setattr(self, f, 0.0)
+        for f in self.COUNTS:
+            setattr(self, f, 0)
+
+        ## Items built while the response is being parsed (see
+        ## Request.on_stream_elem) are timed as build, and that time has
+        ## to be taken out of the parse time reported by the SoapClient.
+        self.inline_build = 0.0
+        ## Likewise for the parts of a streamed request body rendered while
+        ## it is being sent (see Request.render), and the network time.
+        self.inline_render = 0.0
+
+    def add_transfer (self, stats):
+        """
+        Add in the timings and byte counts from a SoapTransferStats. This is
+        done for every attempt, including the ones that failed.
+        """
+
+        self.serialize += stats.serialize_time
+        self.network += max(0.0, stats.network_time - self.inline_render)
+        self.parse += max(0.0, stats.parse_time - self.inline_build)
+        self.inline_build = 0.0
+        self.inline_render = 0.0
+
+        self.req_bytes += stats.req_bytes
+        self.req_wire_bytes += stats.req_wire_bytes
+        self.resp_bytes += stats.resp_bytes
+        self.resp_wire_bytes += stats.resp_wire_bytes
+
+    def as_dict (self):
+        d = {'name' : self.name, 'total' : self.total,
+             'attempts' : self.attempts, 'error' : self.error}
+        for f in self.PHASES + self.COUNTS:
+            d[f] = getattr(self, f)
+
+        return d
+
+    def __str__ (self):
+        ph = ' '.join(['%s=%.1fms' % (f, 1000 * getattr(self, f))
+                       for f in self.PHASES])
+        return ('%s: total=%.1fms %s; %d items; req %d bytes (%d on wire); '
+                'resp %d bytes (%d on wire); %d attempt(s)%s' %
+                (self.name, 1000 * self.total, ph, self.items, self.req_bytes,
+                 self.req_wire_bytes, self.resp_bytes, self.resp_wire_bytes,
+                 self.attempts, '; failed: %s' % self.error if self.error
+                 else ''))
+
+class LoggingSink(object):
+    """
+    Log a line with the timings of every request.
+    """
+
+    def __init__ (self, level=logging.INFO):
+        self.level = level
+
+    def record (self, timings):
+        logging.log(self.level, 'Timings: %s', timings)
+
+class AggregateSink(object):
+    """
+    Keep running totals of the timings per request type. The sink is
+    thread safe, so a single one can be shared across services.
+    """
+
+    def __init__ (self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset (self):
+        with self.lock:
+            self.totals = {}
+
+    def record (self, timings):
+        with self.lock:
+            agg = self.totals.get(timings.name)
+            if agg is None:
+                agg = dict([(f, 0) for f in (['count', 'errors', 'attempts',
+                                               'total', 'max_total'] +
+                                              RequestTimings.PHASES +
+                                              RequestTimings.COUNTS)])
+                self.totals[timings.name] = agg
+
+            agg['count'] += 1
+            agg['attempts'] += timings.attempts
+            agg['total'] += timings.total
+            agg['max_total'] = max(agg['max_total'], timings.total)
+            if timings.error is not None:
+                agg['errors'] += 1
+
+            for f in RequestTimings.PHASES + RequestTimings.COUNTS:
+                agg[f] += getattr(timings, f)
+
+    def snapshot (self):
+        """
+        Return a copy of the totals: a dictionary keyed on request type name
+        """
+
+        with self.lock:
+            return dict([(k, dict(v)) for k, v in self.totals.iteritems()])
+
+    def report (self):
+        """
+        A table with one line per request type, with the total time spent in
+        each phase in milliseconds.
+        """
+
+        cols = ['total'] + RequestTimings.PHASES
+        lines = ['%-24s %6s %7s ' % ('Request', 'count', 'items') +
+                 ' '.join(['%10s' % c for c in cols])]
+
+        for name, agg in sorted(self.snapshot().iteritems()):
+            lines.append('%-24s %6d %7d ' % (name, agg['count'], agg['items']) +
+                         ' '.join(['%10.1f' % (1000 * agg[c]) for c in cols]))
+
+        return '\n'.join(lines)
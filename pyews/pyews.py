@@ -26,7 +26,7 @@ from   ews.autodiscover import EWSAutoDiscover, ExchangeAutoDiscoverError
 from   ews.data         import DistinguishedFolderId, WellKnownFolderName
 from   ews.data         import FolderClass
 from   ews.errors       import EWSMessageError, EWSCreateFolderError
-from   ews.errors       import EWSDeleteFolderError
+from   ews.errors       import EWSDeleteFolderError, EWSBatchError
 from   ews.folder       import Folder
 from   ews.contact      import Contact
 
@@ -38,8 +38,13 @@ from ews.request_response import FindItemsLMTRequest, FindItemsLMTResponse
 from ews.request_response import UpdateItemsRequest, UpdateItemsResponse
 from ews.request_response import SyncFolderItemsRequest, SyncFolderItemsResponse
 
-from   tornado import template
-from   soap import SoapClient, SoapMessageError, QName_T
+from ews.request_response import GetFolderRequest, FindFoldersRequest
+from ews.retry            import RetryPolicy
+from ews.batching         import MergedResponse, split_batches
+from ews.executor         import RequestExecutor
+
+from   tornado import gen, locks
+from   soap import SoapClient, AsyncSoapClient, SoapMessageError, QName_T
 
 USER = u''
 PWD  = u''
@@ -64,7 +69,63 @@ class ExchangeService(object):
         self.ews_ad = None
         self.credentials = None
         self.root_folder = None
-        self.loader = template.Loader(utils.REQUESTS_DIR)
+
+        ## Compiled templates are shared with all other services in the
+        ## process. Call utils.warm_templates() at start up to compile them
+        ## ahead of the first request.
+        self.loader = utils.template_loader()
+
+        ## If True, item bearing responses are parsed incrementally as they
+        ## arrive and the items are built while the rest of the response is
+        ## still coming in. This caps the memory used for large folders.
+        self.stream_responses = False
+
+        ## Governs how transient server errors and throttling are retried.
+        ## Set to None to fail on the first error.
+        self.retry_policy = RetryPolicy()
+
+        ## Upper bound on the number of requests the bulk methods keep in
+        ## flight at the same time. See execute_requests()
+        self.max_concurrency = 4
+
+        ## Objects with a record(timings) method that get the per phase
+        ## timings of every request executed. See pyews.ews.timing
+        self.timing_sinks = []
+
+        ## Requests are sent with the white space between elements stripped
+        ## out. Set this to False to send them pretty printed instead, which
+        ## is a lot more expensive.
+        self.compact_requests = True
+
+        ## Build requests with the functions in ews.builders rather than
+        ## by rendering the templates. Same xml, much less work.
+        self.request_builders = True
+
+        ## CreateItems and UpdateItems requests with at least this many items
+        ## are serialized while they are being sent, with chunked transfer
+        ## encoding, so the whole body is never held in memory. Set to None
+        ## to always send the body in one piece.
+        self.stream_request_items = 500
+
+        ## CreateItems, UpdateItems and DeleteItems split the items they are
+        ## given into requests of at most max_request_items items and about
+        ## max_request_bytes bytes each, to stay clear of the maximum request
+        ## size of the server and of timeouts. None means no limit.
+        self.max_request_items = 1000
+        self.max_request_bytes = 8 * 1024 * 1024
+
+        ## Whether request and response payloads are written to the debug
+        ## log. None leaves it to each request type (see Request.debug);
+        ## True or False turns it on or off for all requests. Either way
+        ## nothing is formatted, or even kept around, unless the root
+        ## logger is enabled for DEBUG.
+        self.log_payloads = None
+
+        ## Build the contacts in responses as LazyContacts, which decode
+        ## each field from the response only when it is first used. Worth
+        ## turning on when listing a large number of contacts only to look
+        ## at their ids and change keys.
+        self.lazy_contacts = False
 
     ##
     ## First the methods that are similar to the EWS Managed API. The names might
@@ -136,24 +197,11 @@ class ExchangeService(object):
         logging.info('pimdb_ex:FindItems() - fetching items in folder %s...',
                      folder.DisplayName)
 
-        i = 0
-        ret = []
-        while True:
-            req = FindItemsRequest(self, batch_size=self.batch_size(),
-                                   offset=i, folder_id=folder.Id)
-            resp = req.execute()
-            shells = resp.items
-            if shells is not None and len(shells) > 0:
-                ret += shells
-
-            if resp.includes_last:
-                break
-
-            i += self.batch_size()
-            ## just a safety net to avoid inifinite loops
-            if i >= folder.TotalCount:
-                logging.warning('pimdb_ex.FindItems(): Breaking strange loop')
-                break
+        ## We know how many items there are in the folder, so all the pages
+        ## can be asked for in one go.
+        bs = self.batch_size()
+        pages = max(1, (folder.TotalCount + bs - 1) // bs)
+        ret = self._find_items(FindItemsRequest, folder, pages)
 
         logging.info('pimdb_ex:FindItems() - fetching items in folder %s...done',
                      folder.DisplayName)
@@ -180,24 +228,7 @@ class ExchangeService(object):
         logging.info('pimdb_ex:FindItemsLMT() - fetching items in folder %s...',
                      folder.DisplayName)
 
-        i = 0
-        ret = []
-        while True:
-            req = FindItemsLMTRequest(self, batch_size=self.batch_size(),
-                                      offset=i, folder_id=folder.Id, lmt=lmt)
-            resp = req.execute()
-            shells = resp.items
-            if shells is not None and len(shells) > 0:
-                ret += shells
-
-            if resp.includes_last:
-                break
-
-            i += self.batch_size()
-            ## just a safety net to avoid inifinite loops
-            if i >= folder.TotalCount:
-                logging.warning('pimdb_ex.FindItemsLMT(): Breaking strange loop')
-                break
+        ret = self._find_items(FindItemsLMTRequest, folder, 1, lmt=lmt)
 
         logging.info('pimdb_ex:FindItemsLMT() - fetching items in folder %s...done',
                      folder.DisplayName)
@@ -209,24 +240,28 @@ class ExchangeService(object):
         itemids is an array of itemids, and we will fetch that stuff and
         return an array of Item objects.
 
-        FIXME: Need to make this work in batches to ensure data is not too
-        much.
+        The items are fetched in batches of batch_size(), with up to
+        max_concurrency batches in flight at a time.
         """
 
         logging.info('pimdb_ex:GetItems() - fetching items....')
-        req = GetItemsRequest(self, itemids=itemids,
-                              custom_eprops_xml=eprops_xml)
-        resp = req.execute()
+        bs = self.batch_size()
+        reqs = [GetItemsRequest(self, itemids=itemids[i:i+bs],
+                                custom_eprops_xml=eprops_xml)
+                for i in range(0, max(len(itemids), 1), bs)]
+
+        ret = []
+        for resp in self.execute_requests(reqs):
+            ret += resp.items
         logging.info('pimdb_ex:GetItems() - fetching items...done')
 
-        return resp.items
+        return ret
 
     def CreateItems (self, folder_id, items):
         """Create items in the exchange store."""
 
         logging.info('pimdb_ex:CreateItems() - creating items....')
-        req = CreateItemsRequest(self, folder_id=folder_id, items=items)
-        resp = req.execute()
+        self._execute_bulk(CreateItemsRequest, items, folder_id=folder_id)
 
         logging.info('pimdb_ex:CreateItems() - creating items....done')
 
@@ -234,10 +269,10 @@ class ExchangeService(object):
         """Delete items in the exchange store."""
 
         logging.info('pimdb_ex:DeleteItems() - deleting items....')
-        req = DeleteItemsRequest(self, itemids=itemids)
+        resp = self._execute_bulk(DeleteItemsRequest, itemids)
         logging.info('pimdb_ex:DeleteItems() - deleting items....done')
 
-        return req.execute()
+        return resp
 
     def UpdateItems (self, items):
         """
@@ -246,8 +281,7 @@ class ExchangeService(object):
 
         logging.info('pimdb_ex:UpdateItems() - updating items....')
 
-        req = UpdateItemsRequest(self, items=items)
-        resp = req.execute()
+        resp = self._execute_bulk(UpdateItemsRequest, items)
 
         logging.info('pimdb_ex:UpdateItems() - updating items....done')
         return resp.items
@@ -276,16 +310,65 @@ class ExchangeService(object):
     ## Other external methods
     ##
 
-    def init_soap_client (self):
+    def execute_requests (self, reqs, ordered=True, return_exceptions=False):
+        """
+        Execute the given Request objects concurrently, with at most
+        max_concurrency of them in flight at a time. If ordered is True a
+        list of responses is returned in the same order as reqs. Otherwise
+        this returns a generator of (index, response) tuples in the order in
+        which the requests complete. See ews.executor.RequestExecutor for
+        return_exceptions.
+        """
+
+        executor = RequestExecutor(self.max_concurrency)
+        if ordered:
+            return executor.map(reqs, return_exceptions)
+        else:
+            return executor.as_completed(reqs, return_exceptions)
+
+    def execute_batched (self, req_class, values, **kwargs):
+        """
+        Split values - a list of items or item ids - into batches that stay
+        under max_request_items and max_request_bytes, and execute a
+        req_class request for each of them (see execute_requests()). The
+        remaining keyword arguments are passed on to every request. Returns
+        the responses put together in a ews.batching.MergedResponse. A batch
+        whose request raises an exception does not stop the others; it ends
+        up in the failed_batches of the response.
+        """
+
+        reqs, batches = self._batch_requests(req_class, values, kwargs)
+        return MergedResponse(self.execute_requests(reqs,
+                                                    return_exceptions=True),
+                              batches)
+
+    def init_soap_client (self, **kwargs):
+        """
+        Set up the SoapClient used to talk to the server. Any keyword
+        arguments are passed through to SoapClient - for e.g. the host_pools,
+        max_per_host and idle_timeout settings of the keep-alive connection
+        pool that is shared by all services using the same Url, or the
+        user_rate and endpoint_rate limits on requests per second.
+        """
+
         self.soap = SoapClient(self.Url, user=self.credentials.user,
-                               pwd=self.credentials.pwd)
+                               pwd=self.credentials.pwd, **kwargs)
 
-    def send (self, req, debug=False):
+    def send (self, req, debug=False, stream_tag=None, on_elem=None,
+              timings=None):
         """
         Will raise a SoapConnectionError if there is a connection problem.
         """
 
-        return self.soap.send(req, debug)
+        return self.soap.send(req, debug, stream_tag, on_elem, timings)
+
+    def rate_limit_fill (self):
+        """
+        How much of the client side request budget is left right now, as a
+        fraction between 0.0 and 1.0. See SoapClientBase.rate_limit_fill()
+        """
+
+        return self.soap.rate_limit_fill()
 
     def get_distinguished_folder (self, name):
         elem = u'<t:DistinguishedFolderId Id="%s"/>' % name
@@ -313,6 +396,93 @@ class ExchangeService(object):
         res = re.match('(.*)Exchange.asmx$', url)
         return res.group(1) + 'Services.wsdl'
 
+    def _find_items (self, req_class, folder, pages, **kwargs):
+        """
+        Page through all the items in folder using the given FindItems
+        request class. The first 'pages' pages are requested concurrently,
+        and then we keep going one page at a time till the server says we
+        have seen the last item.
+        """
+
+        bs = self.batch_size()
+        reqs = [req_class(self, batch_size=bs, offset=i, folder_id=folder.Id,
+                          **kwargs) for i in range(0, pages * bs, bs)]
+
+        ret = []
+        for resp in self.execute_requests(reqs):
+            shells = resp.items
+            if shells is not None and len(shells) > 0:
+                ret += shells
+
+        i = (pages - 1) * bs
+        while not resp.includes_last:
+            i += bs
+            ## just a safety net to avoid inifinite loops
+            if i >= folder.TotalCount:
+                logging.warning('pimdb_ex._find_items(): Breaking strange loop')
+                break
+
+            resp = req_class(self, batch_size=bs, offset=i,
+                             folder_id=folder.Id, **kwargs).execute()
+            shells = resp.items
+            if shells is not None and len(shells) > 0:
+                ret += shells
+
+        return ret
+
+    def _batch_requests (self, req_class, values, kwargs):
+        batches = split_batches(values, req_class.item_size,
+                                self.max_request_items, self.max_request_bytes)
+        if len(batches) > 1:
+            logging.debug('%s: %d items split into %d requests',
+                          req_class.__name__,
+                          sum([len(batch) for offset, batch in batches]),
+                          len(batches))
+
+        reqs = []
+        for offset, batch in batches:
+            args = dict(kwargs)
+            args[req_class.batch_arg] = batch
+            reqs.append(req_class(self, **args))
+
+        return reqs, batches
+
+    def _execute_bulk (self, req_class, values, **kwargs):
+        """
+        Run a CreateItems, UpdateItems or DeleteItems call. When the values
+        fit in a single request that request is simply executed: its own
+        response is returned, and its errors are raised, same as before
+        these calls were split into batches. Larger calls return the
+        MergedResponse of execute_batched(), after _check_batches().
+        """
+
+        reqs, batches = self._batch_requests(req_class, values, kwargs)
+        if len(reqs) == 1:
+            return reqs[0].execute()
+
+        resp = MergedResponse(self.execute_requests(reqs,
+                                                    return_exceptions=True),
+                              batches)
+        self._check_batches(resp)
+
+        return resp
+
+    def _check_batches (self, resp):
+        """
+        Raise an error if any of the batches of the MergedResponse resp
+        failed. When all of them did there is nothing to be salvaged, and the
+        error of the first one is raised as it is; otherwise a EWSBatchError
+        with the results of the others.
+        """
+
+        if len(resp.failed_batches) == 0:
+            return
+
+        if len(resp.responses) == 0:
+            raise resp.failed_batches[0][2]
+
+        raise EWSBatchError(resp)
+
     ## FIXME: To be removed once all the requests become classes
     def _render_template (self, name, **kwargs):
         return self.loader.load(name).generate(**kwargs)
@@ -337,3 +507,203 @@ class ExchangeService(object):
     def Url (self, url):
         self._Url = url
         self.wsdl_url = self._wsdl_url()
+
+class AsyncExchangeService(ExchangeService):
+    """
+    A non blocking ExchangeService. The item and folder methods below are
+    tornado coroutines - they can be yielded from other coroutines, or
+    awaited from asyncio code under Python 3 - so a single process can have
+    many EWS calls in flight at the same time. The requests are rendered and
+    the responses parsed by the very same Request and Response classes as
+    the blocking service; only the transport differs. Calls that send
+    several requests, like the blocking ones, keep at most max_concurrency
+    of them in flight at a time.
+
+    Responses are always parsed incrementally as they arrive.
+    """
+
+    def __init__ (self):
+        ExchangeService.__init__(self)
+        self.stream_responses = True
+
+    def init_soap_client (self, **kwargs):
+        """
+        Keyword arguments are passed through to AsyncSoapClient.
+        """
+
+        self.soap = AsyncSoapClient(self.Url, user=self.credentials.user,
+                                    pwd=self.credentials.pwd, **kwargs)
+
+    @gen.coroutine
+    def GetFolder (self, wkfn):
+        """
+        Asynchronous version of Folder.bind()
+        """
+
+        req = GetFolderRequest(self, folder_name=wkfn)
+        resp = yield req.execute_async()
+        raise gen.Return(Folder(self, wkfn, resp.folder_node))
+
+    @gen.coroutine
+    def get_root_folder (self):
+        if not self.root_folder:
+            self.root_folder = yield self.GetFolder(
+                WellKnownFolderName.MsgFolderRoot)
+        raise gen.Return(self.root_folder)
+
+    @gen.coroutine
+    def FindFolders (self, folder, types=None, recursive=False):
+        """
+        Asynchronous version of Folder.FindFolders()
+        """
+
+        req = FindFoldersRequest(self, folder_ids=[(folder.Id, folder.ChangeKey)],
+                                 traversal='Deep' if recursive else 'Shallow')
+        resp = yield req.execute_async()
+        if types is not None:
+            raise gen.Return([x for x in resp.folders if x.FolderClass in types])
+        else:
+            raise gen.Return(resp.folders)
+
+    @gen.coroutine
+    def FindItems (self, folder, eprops_xml=[], ids_only=False):
+        bs = self.batch_size()
+        pages = max(1, (folder.TotalCount + bs - 1) // bs)
+        ret = yield self._find_items(FindItemsRequest, folder, pages)
+
+        if len(ret) > 0 and ids_only == False:
+            ret = yield self.GetItems([x.itemid for x in ret],
+                                      eprops_xml=eprops_xml)
+        raise gen.Return(ret)
+
+    @gen.coroutine
+    def FindItemsLMT (self, folder, lmt):
+        ret = yield self._find_items(FindItemsLMTRequest, folder, 1, lmt=lmt)
+        raise gen.Return(ret)
+
+    @gen.coroutine
+    def GetItems (self, itemids, eprops_xml=[]):
+        bs = self.batch_size()
+        reqs = [GetItemsRequest(self, itemids=itemids[i:i+bs],
+                                custom_eprops_xml=eprops_xml)
+                for i in range(0, max(len(itemids), 1), bs)]
+
+        ret = []
+        resps = yield self.execute_requests(reqs)
+        for resp in resps:
+            ret += resp.items
+        raise gen.Return(ret)
+
+    @gen.coroutine
+    def CreateItems (self, folder_id, items):
+        yield self._execute_bulk(CreateItemsRequest, items,
+                                 folder_id=folder_id)
+
+    @gen.coroutine
+    def DeleteItems (self, itemids):
+        resp = yield self._execute_bulk(DeleteItemsRequest, itemids)
+        raise gen.Return(resp)
+
+    @gen.coroutine
+    def UpdateItems (self, items):
+        resp = yield self._execute_bulk(UpdateItemsRequest, items)
+        raise gen.Return(resp.items)
+
+    @gen.coroutine
+    def execute_requests (self, reqs, return_exceptions=False):
+        """
+        Coroutine version of ExchangeService.execute_requests(). Executes
+        the given Request objects with at most max_concurrency of them in
+        flight at a time, and returns the list of their responses in the
+        same order as reqs. If a request raises an exception, that is raised
+        to the caller - unless return_exceptions is True, in which case the
+        exception takes the place of the response of the request.
+        """
+
+        slots = locks.Semaphore(max(1, self.max_concurrency))
+
+        @gen.coroutine
+        def run (req):
+            with (yield slots.acquire()):
+                try:
+                    resp = yield req.execute_async()
+                except Exception as e:
+                    if not return_exceptions:
+                        raise
+                    resp = e
+
+            raise gen.Return(resp)
+
+        resps = yield [run(req) for req in reqs]
+        raise gen.Return(resps)
+
+    @gen.coroutine
+    def execute_batched (self, req_class, values, **kwargs):
+        """
+        Same as ExchangeService.execute_batched()
+        """
+
+        reqs, batches = self._batch_requests(req_class, values, kwargs)
+        results = yield self.execute_requests(reqs, return_exceptions=True)
+        raise gen.Return(MergedResponse(results, batches))
+
+    @gen.coroutine
+    def _execute_bulk (self, req_class, values, **kwargs):
+        """
+        Same as ExchangeService._execute_bulk()
+        """
+
+        reqs, batches = self._batch_requests(req_class, values, kwargs)
+        if len(reqs) == 1:
+            resp = yield reqs[0].execute_async()
+            raise gen.Return(resp)
+
+        results = yield self.execute_requests(reqs, return_exceptions=True)
+        resp = MergedResponse(results, batches)
+        self._check_batches(resp)
+
+        raise gen.Return(resp)
+
+    @gen.coroutine
+    def SyncFolderItems (self, folder_id, sync_state):
+        req = SyncFolderItemsRequest(self, folder_id=folder_id,
+                                     sync_state=sync_state,
+                                     batch_size=self.batch_size())
+        resp = yield req.execute_async()
+        raise gen.Return(resp)
+
+    ##
+    ## Internal routines
+    ##
+
+    @gen.coroutine
+    def _find_items (self, req_class, folder, pages, **kwargs):
+        """
+        Same as ExchangeService._find_items()
+        """
+
+        bs = self.batch_size()
+        reqs = [req_class(self, batch_size=bs, offset=i, folder_id=folder.Id,
+                          **kwargs) for i in range(0, pages * bs, bs)]
+
+        ret = []
+        resps = yield self.execute_requests(reqs)
+        for resp in resps:
+            if resp.items is not None and len(resp.items) > 0:
+                ret += resp.items
+
+        i = (pages - 1) * bs
+        while not resp.includes_last:
+            i += bs
+            ## just a safety net to avoid inifinite loops
+            if i >= folder.TotalCount:
+                logging.warning('AsyncExchangeService: Breaking strange loop')
+                break
+
+            req = req_class(self, batch_size=bs, offset=i,
+                            folder_id=folder.Id, **kwargs)
+            resp = yield req.execute_async()
+            if resp.items is not None and len(resp.items) > 0:
+                ret += resp.items
+
+        raise gen.Return(ret)
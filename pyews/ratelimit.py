@@ -0,0 +1,170 @@
+##
+## Created : Sun Oct 18 12:31:55 IST 2026
+##
+## Copyright (C) 2026 Sriram Karra <karra.etc@gmail.com>
+##
+## This file is part of pyews
+##
+## pyews is free software: you can redistribute it and/or modify it under
+## the terms of the GNU Affero General Public License as published by the
+## Free Software Foundation, version 3 of the License
+##
+## pyews is distributed in the hope that it will be useful, but WITHOUT
+## ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+## FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero General Public
+## License for more details.
+##
+## You should have a copy of the license in the doc/ directory of pyews.  If
+## not, see <http://www.gnu.org/licenses/>.
+
+##
+## Exchange Online hands out a budget of EWS requests per user, and once a
+## client overruns it, it is throttled for minutes at a time. It is much
+## cheaper to pace ourselves on the client side. The token buckets here are
+## kept in a process wide registry so that all the clients that share a
+## mailbox or an endpoint also share its budget.
+##
+
+import threading, time
+
+class TokenBucket(object):
+    """
+    A thread safe token bucket that fills up at 'rate' tokens a second, up
+    to a maximum of 'burst' tokens. Every request takes away one token, so
+    rate has to be positive and burst at least 1; anything else would keep
+    the requests waiting forever.
+    """
+
+    def __init__ (self, rate, burst=None):
+        self.rate = float(rate)
+        self.burst = float(burst if burst is not None else max(1, rate))
+        if not self.rate > 0:
+            raise ValueError('Rate of a TokenBucket has to be positive: %s' %
+                             rate)
+        if not self.burst >= 1:
+            raise ValueError('Burst of a TokenBucket has to be at least 1: '
+                             '%s' % burst)
+
+        self.tokens = self.burst
+        self.last = time.time()
+        self.lock = threading.Lock()
+
+    def reserve (self, n=1):
+        """
+        Take n tokens out of the bucket and return the number of seconds the
+        caller has to wait before going ahead. The tokens are taken right
+        away even if the bucket does not have enough of them, which means
+        later callers queue up behind this one.
+        """
+
+        with self.lock:
+            self._refill()
+            self.tokens -= n
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / self.rate
+
+    def acquire (self, n=1):
+        """
+        Block till n tokens are available, and take them.
+        """
+
+        wait = self.reserve(n)
+        if wait > 0:
+            time.sleep(wait)
+
+    def fill_level (self):
+        """
+        Return the number of tokens available right now as a fraction of the
+        bucket size. 0.0 means the next request will be held back.
+        """
+
+        with self.lock:
+            self._refill()
+            return max(0.0, self.tokens) / self.burst
+
+    def _refill (self):
+        now = time.time()
+        self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+        self.last = now
+
+class RateLimiter(object):
+    """
+    Paces requests to a EWS endpoint. There can be a bucket for the endpoint
+    url as a whole, and another for the credential (user) being used; a
+    request has to get past both of them. Either can be None.
+    """
+
+    def __init__ (self, endpoint_bucket=None, user_bucket=None):
+        self.buckets = [b for b in (endpoint_bucket, user_bucket)
+                        if b is not None]
+        self.endpoint_bucket = endpoint_bucket
+        self.user_bucket = user_bucket
+
+    def reserve (self):
+        """
+        Take a token from all the buckets and return the time to wait in
+        seconds before sending the request.
+        """
+
+        wait = 0.0
+        for b in self.buckets:
+            wait = max(wait, b.reserve())
+
+        return wait
+
+    def acquire (self):
+        wait = self.reserve()
+        if wait > 0:
+            time.sleep(wait)
+
+    def fill_level (self):
+        """
+        The fill level of the emptiest of the buckets. See
+        TokenBucket.fill_level()
+        """
+
+        if len(self.buckets) == 0:
+            return 1.0
+
+        return min([b.fill_level() for b in self.buckets])
+
+class RateLimiterRegistry(object):
+    """
+    Process wide registry of token buckets keyed on the endpoint url, and on
+    the (url, user) pair. The rate and burst of a bucket are fixed by whoever
+    asks for it first.
+    """
+
+    def __init__ (self):
+        self.lock = threading.Lock()
+        self.buckets = {}
+
+    def get_limiter (self, url, user, endpoint_rate=None, endpoint_burst=None,
+                     user_rate=None, user_burst=None):
+        """
+        Return a RateLimiter for requests to url as user. A rate of None
+        means that requests are not paced at that level.
+        """
+
+        eb = None
+        if endpoint_rate is not None:
+            eb = self._get_bucket(('endpoint', url), endpoint_rate,
+                                  endpoint_burst)
+
+        ub = None
+        if user_rate is not None:
+            ub = self._get_bucket(('user', url, user), user_rate, user_burst)
+
+        return RateLimiter(eb, ub)
+
+    def _get_bucket (self, key, rate, burst):
+        with self.lock:
+            b = self.buckets.get(key)
+            if b is None:
+                b = TokenBucket(rate, burst)
+                self.buckets[key] = b
+
+            return b
+
+rate_limiters = RateLimiterRegistry()
@@ -17,35 +17,86 @@
 ## You should have a copy of the license in the doc/ directory of pyews.  If
 ## not, see <http://www.gnu.org/licenses/>.
 
-import logging, re, requests
+import errno, logging, re, requests, socket, threading, time, zlib
+from   requests.adapters import HTTPAdapter
 from   requests.auth import HTTPBasicAuth
-import xml.etree.ElementTree as ET
-import utils
-from   utils import pretty_xml
+from   requests.packages.urllib3.exceptions import HTTPError as Urllib3Error
+from   requests.packages.urllib3.exceptions import MaxRetryError
+from   requests.packages.urllib3.exceptions import ConnectTimeoutError
+from   tornado import gen, httpclient, httputil
+from   ratelimit import rate_limiters
+from   transport import HTTPTransport
+import utils, xmlbackend
+from   utils import LazyPrettyXml
 
 E_NAMESPACE = 'http://schemas.microsoft.com/exchange/services/2006/errors'
 M_NAMESPACE = 'http://schemas.microsoft.com/exchange/services/2006/messages'
 S_NAMESPACE = 'http://schemas.xmlsoap.org/soap/envelope/'
 T_NAMESPACE = 'http://schemas.microsoft.com/exchange/services/2006/types'
 
+##
+## Qualified names are asked for over and over again while parsing responses.
+## They are made once, interned, and kept in a registry per namespace, so
+## that asking for one does not allocate anything, and comparing them with
+## each other is mostly a matter of comparing pointers.
+##
+
+class QNames(dict):
+    """
+    The interned qualified names in a namespace, made on first use:
+    QNames(T_NAMESPACE)['Contact'] is '{<types namespace>}Contact'
+    """
+
+    def __init__ (self, namespace):
+        dict.__init__(self)
+        self.namespace = namespace
+
+    def __missing__ (self, name):
+        qname = '{%s}%s' % (self.namespace, name)
+        if isinstance(qname, str):
+            qname = intern(qname)
+
+        self[name] = qname
+        return qname
+
+QN_E = QNames(E_NAMESPACE)
+QN_M = QNames(M_NAMESPACE)
+QN_S = QNames(S_NAMESPACE)
+QN_T = QNames(T_NAMESPACE)
+
+_qnames = {E_NAMESPACE : QN_E, M_NAMESPACE : QN_M, S_NAMESPACE : QN_S,
+           T_NAMESPACE : QN_T}
+
+_UNQNAME_RE = re.compile('{.*}(.*)')
+_unqnames = {}
+
 def unQName (name):
-    res = re.match('{.*}(.*)', name)
-    return name if res is None else res.group(1)
+    local = _unqnames.get(name)
+    if local is None:
+        res = _UNQNAME_RE.match(name)
+        local = name if res is None else res.group(1)
+        _unqnames[name] = local
+
+    return local
 
 def QName (namespace, name):
-    return '{%s}%s' % (namespace, name)
+    qnames = _qnames.get(namespace)
+    if qnames is None:
+        qnames = _qnames.setdefault(namespace, QNames(namespace))
+
+    return qnames[name]
 
 def QName_E (name):
-    return QName(E_NAMESPACE, name)
+    return QN_E[name]
 
 def QName_M (name):
-    return QName(M_NAMESPACE, name)
+    return QN_M[name]
 
 def QName_S (name):
-    return QName(S_NAMESPACE, name)
+    return QN_S[name]
 
 def QName_T (name):
-    return QName(T_NAMESPACE, name)
+    return QN_T[name]
 
 class SoapMessageError(Exception):
     def __init__ (self, code, xml_resp=None, node=None):
@@ -58,38 +109,711 @@ class SoapMessageError(Exception):
         self.resp_code = code
 
 class SoapConnectionError(Exception):
-    pass
+    """
+    Raised when the request or the response is lost on the way. sent is
+    False only when we know the request never got to the server - the
+    connection could not be made in the first place - so sending it again
+    cannot repeat anything the server did.
+    """
+
+    def __init__ (self, err=None, sent=True):
+        Exception.__init__(self, err)
+        self.sent = sent
+
+## The socket errors on connect() that tell us nothing went out
+CONNECT_ERRNOS = frozenset([errno.ECONNREFUSED, errno.EHOSTUNREACH,
+                            errno.ENETUNREACH])
+
+## The timeouts of the tornado http client that hit before the request was
+## sent
+ASYNC_UNSENT_TIMEOUTS = frozenset(['Timeout while connecting',
+                                   'Timeout in request queue'])
+
+def request_unsent (err):
+    """
+    True if err, raised by requests or returned by the tornado http client,
+    shows that the connection to the server could not be made and the
+    request was never sent.
+    """
+
+    if isinstance(err, requests.exceptions.ConnectTimeout):
+        return True
+
+    if isinstance(err, requests.exceptions.ConnectionError):
+        ## requests raises a plain ConnectionError when the connection is
+        ## refused, with the urllib3 error that says so tucked away inside
+        reason = err.args[0] if len(err.args) > 0 else None
+        return (isinstance(reason, MaxRetryError) and
+                isinstance(reason.reason, ConnectTimeoutError))
+
+    if isinstance(err, httpclient.HTTPError):
+        return err.code == 599 and err.message in ASYNC_UNSENT_TIMEOUTS
+
+    if isinstance(err, socket.gaierror):
+        return True
+
+    if isinstance(err, socket.error):
+        return err.errno in CONNECT_ERRNOS
+
+    return False
+
+class SoapHTTPError(Exception):
+    """
+    Raised when the server answers with an HTTP status that does not carry a
+    SOAP response at all - for e.g. 429 or 503 when it is throttling us, or
+    is otherwise unavailable. retry_after is the value of the Retry-After
+    header in seconds, if the server sent one.
+    """
+
+    def __init__ (self, status_code, retry_after=None, text=None):
+        self.status_code = status_code
+        self.retry_after = retry_after
+        self.text = text
+
+    def __str__ (self):
+        return 'HTTP status %d (Retry-After: %s)' % (self.status_code,
+                                                     self.retry_after)
+
+## Statuses for which the body is not worth parsing
+HTTP_ERROR_STATUSES = frozenset([429, 502, 503, 504])
+
+##
+## Connection pooling
+##
+
+DEFAULT_HOST_POOLS   = 10
+DEFAULT_MAX_PER_HOST = 10
+DEFAULT_IDLE_TIMEOUT = 90                # seconds
+
+class SoapConnectionPool(object):
+    """
+    Process wide registry of keep-alive HTTP connection pools, one per
+    service url. Every SoapClient that talks to the same url shares the
+    sockets of a single pool, so consecutive requests reuse an established
+    TCP+TLS connection instead of doing the handshakes all over again.
+
+    The pool settings are fixed by whoever first asks for a given url;
+    later callers get the existing pool as is.
+    """
+
+    class Entry(object):
+        def __init__ (self, adapter, idle_timeout):
+            self.adapter = adapter
+            self.idle_timeout = idle_timeout
+            self.last_used = time.time()
+
+    def __init__ (self):
+        self.lock = threading.Lock()
+        self.entries = {}
+
+    def get_adapter (self, url, host_pools=DEFAULT_HOST_POOLS,
+                     max_per_host=DEFAULT_MAX_PER_HOST,
+                     idle_timeout=DEFAULT_IDLE_TIMEOUT):
+        """
+        Return the shared requests HTTPAdapter for url, creating it if
+        required. max_per_host is the number of connections kept to a host,
+        and is a hard cap: when all of them are busy, further requests block
+        till one is returned.
+
+        host_pools is not a number of connections. It is the number of
+        hosts the adapter keeps a pool of max_per_host connections for (the
+        pool_connections of requests). All the requests of an adapter go to
+        the host of url, so this only matters when the server redirects us
+        elsewhere.
+        """
+
+        with self.lock:
+            entry = self.entries.get(url)
+            if entry is None:
+                adapter = HTTPAdapter(pool_connections=host_pools,
+                                      pool_maxsize=max_per_host,
+                                      pool_block=True)
+                entry = self.Entry(adapter, idle_timeout)
+                self.entries[url] = entry
+
+            return entry.adapter
+
+    def touch (self, url):
+        """
+        Mark the pool for url as being in use right now. If it has been
+        lying idle for longer than its idle timeout, the pooled sockets are
+        dropped first, as the server will have most likely closed them on its
+        side anyway.
+        """
+
+        with self.lock:
+            entry = self.entries.get(url)
+            if entry is None:
+                return
+
+            now = time.time()
+            if (entry.idle_timeout is not None and
+                now - entry.last_used > entry.idle_timeout):
+                logging.debug('SoapConnectionPool: recycling idle pool for %s',
+                              url)
+                entry.adapter.close()
+            entry.last_used = now
+
+    def release (self, url):
+        """
+        Mark the pool for url as used up to now. To be called once a response
+        has been read, so that the time a slow request spent in flight does
+        not count as idle time, and the connection it has just handed back is
+        not taken for a stale one.
+        """
+
+        with self.lock:
+            entry = self.entries.get(url)
+            if entry is not None:
+                entry.last_used = time.time()
+
+    def close (self, url=None):
+        """
+        Close all the pooled connections to the given url, or to all urls if
+        url is None.
+        """
+
+        with self.lock:
+            urls = [url] if url is not None else self.entries.keys()
+            for u in urls:
+                entry = self.entries.pop(u, None)
+                if entry is not None:
+                    entry.adapter.close()
+
+connection_pool = SoapConnectionPool()
+
+##
+## Transfer accounting
+##
+
+class SoapTransferStats(object):
+    """
+    Byte counts for a request / response exchange with the server. The
+    *_bytes members are the sizes of the xml payloads, and the *_wire_bytes
+    members are what actually went over the network after compression.
+
+    If timed is True the client also measures the time (in seconds) spent
+    encoding the request, on the network, and parsing the response.
+    """
+
+    def __init__ (self, req_bytes=0, req_wire_bytes=0, resp_bytes=0,
+                  resp_wire_bytes=0, timed=False):
+        self.req_bytes = req_bytes
+        self.req_wire_bytes = req_wire_bytes
+        self.resp_bytes = resp_bytes
+        self.resp_wire_bytes = resp_wire_bytes
+
+        self.timed = timed
+        self.serialize_time = 0.0
+        self.network_time = 0.0
+        self.parse_time = 0.0
+
+    @property
+    def bytes_saved (self):
+        return ((self.req_bytes - self.req_wire_bytes) +
+                (self.resp_bytes - self.resp_wire_bytes))
+
+    def add (self, other):
+        self.req_bytes += other.req_bytes
+        self.req_wire_bytes += other.req_wire_bytes
+        self.resp_bytes += other.resp_bytes
+        self.resp_wire_bytes += other.resp_wire_bytes
+        self.serialize_time += other.serialize_time
+        self.network_time += other.network_time
+        self.parse_time += other.parse_time
+
+    def __str__ (self):
+        return ('Request: %d bytes (%d on wire); Response: %d bytes '
+                '(%d on wire); Saved: %d bytes' %
+                (self.req_bytes, self.req_wire_bytes, self.resp_bytes,
+                 self.resp_wire_bytes, self.bytes_saved))
+
+RESP_CHUNK_SIZE = 64 * 1024
+
+class SoapResponseFeeder(object):
+    """
+    Accepts a response body as a series of raw chunks as they come off the
+    wire, decompresses them if required, and feeds the xml into an
+    incremental parser. Byte counts are tallied up in the given
+    SoapTransferStats object. close() returns the parsed root element.
+    """
+
+    def __init__ (self, stats, debug=False, target=None):
+        self.stats = stats
+        if isinstance(target, SoapStreamTarget):
+            self.parser = target.parser()
+        else:
+            self.parser = xmlbackend.XMLParser(target=target)
+        self.text = [] if debug else None
+        self.dec = None
+
+    def set_encoding (self, enc):
+        enc = enc.lower() if enc else ''
+        if enc == 'gzip':
+            self.dec = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        elif enc == 'deflate':
+            self.dec = zlib.decompressobj(zlib.MAX_WBITS)
+        else:
+            self.dec = None
+
+    def feed (self, chunk):
+        if self.stats.timed:
+            t = time.time()
+
+        self.stats.resp_wire_bytes += len(chunk)
+        if self.dec is not None:
+            chunk = self.dec.decompress(chunk)
+        self._feed_xml(chunk)
+
+        if self.stats.timed:
+            self.stats.parse_time += time.time() - t
+
+    def close (self):
+        if self.stats.timed:
+            t = time.time()
+
+        if self.dec is not None:
+            self._feed_xml(self.dec.flush())
+
+        if self.text is not None:
+            logging.debug('%s', LazyPrettyXml(''.join(self.text)))
+
+        node = self.parser.close()
+
+        if self.stats.timed:
+            self.stats.parse_time += time.time() - t
+
+        return node
+
+    def _feed_xml (self, chunk):
+        self.stats.resp_bytes += len(chunk)
+        if self.text is not None:
+            self.text.append(chunk)
+        self.parser.feed(chunk)
+
+class SoapStreamTarget(object):
+    """
+    A parser target that builds the usual element tree, except that every
+    element with the given tag is handed to a callback as soon as its end
+    tag has been parsed. The element is then cleared and dropped from the
+    tree, so the memory held at any point is bounded by the size of a single
+    such element and not by the size of the whole response. If the callback
+    returns True it is keeping the element for itself, and the element is
+    only dropped from the tree, not cleared.
+    """
+
+    def __init__ (self, tag, callback):
+        self.tag = tag
+        self.callback = callback
+        self.builder = xmlbackend.TreeBuilder()
+        self.stack = []
+
+    def start (self, tag, attrib):
+        elem = self.builder.start(tag, attrib)
+        self.stack.append(elem)
+        return elem
+
+    def data (self, data):
+        self.builder.data(data)
+
+    def end (self, tag):
+        elem = self.builder.end(tag)
+        self.stack.pop()
+
+        if tag == self.tag:
+            if not self.callback(elem):
+                elem.clear()
+            if len(self.stack) > 0:
+                self.stack[-1].remove(elem)
+
+        return elem
+
+    def close (self):
+        return self.builder.close()
+
+    def parser (self):
+        """
+        An incremental parser that does what this target is for. lxml can
+        pick out the elements by itself, so with lxml the parser does not
+        call back into python for every start and end tag.
+        """
+
+        pull = xmlbackend.XMLPullParser(self.tag)
+        if pull is not None:
+            return SoapStreamPullParser(pull, self.callback)
+
+        return xmlbackend.XMLParser(target=self)
+
+class SoapStreamPullParser(object):
+    """
+    Does the job of a parser with a SoapStreamTarget using a pull parser
+    that reports the elements the target is interested in.
+    """
+
+    def __init__ (self, pull, callback):
+        self.pull = pull
+        self.callback = callback
+
+    def feed (self, data):
+        self.pull.feed(data)
+        self._dispatch()
+
+    def close (self):
+        root = self.pull.close()
+        self._dispatch()
+
+        return root
+
+    def _dispatch (self):
+        for event, elem in self.pull.read_events():
+            parent = elem.getparent()
+            if not self.callback(elem):
+                elem.clear()
+            if parent is not None:
+                parent.remove(elem)
+
+class SoapClientBase(object):
+    """
+    The bits that are common to the blocking SoapClient and the non blocking
+    AsyncSoapClient: preparing the request body and headers, and keeping
+    tabs on the bytes transferred.
+    """
+
+    def __init__ (self, service_url, user, pwd, compress_requests=False,
+                  compress_responses=False, timeout=None, user_rate=None,
+                  user_burst=None, endpoint_rate=None, endpoint_burst=None):
+        """
+        If compress_requests is True the request bodies are sent gzip
+        compressed; note that the server has to be configured to accept
+        those. If compress_responses is True we ask for a gzip or deflate
+        encoded response and decompress it on the fly while parsing it.
+
+        timeout is in seconds, and is None (wait forever) by default.
+
+        user_rate and endpoint_rate, if not None, cap the number of requests
+        per second sent with the given credentials, and to the service url
+        respectively, across all clients in the process. The *_burst
+        arguments are the number of requests that can go out back to back
+        before the pacing kicks in. See pyews.ratelimit
+        """
 
-class SoapClient(object):
-    def __init__ (self, service_url, user, pwd):
         self.url = service_url
         self.user = user
         self.pwd = pwd
+        self.compress_requests = compress_requests
+        self.compress_responses = compress_responses
+        self.timeout = timeout
+        self.limiter = rate_limiters.get_limiter(service_url, user,
+                                                 endpoint_rate, endpoint_burst,
+                                                 user_rate, user_burst)
+
+        self.last_stats = None
+        self.total_stats = SoapTransferStats()
+        self.stats_lock = threading.Lock()
+
+    def rate_limit_fill (self):
+        """
+        Return the fill level of the rate limiter as a fraction between 0.0
+        and 1.0. Callers can use this to hold back background work when the
+        budget is running low. Always 1.0 when rate limiting is not on.
+        """
+
+        return self.limiter.fill_level()
+
+    def prepare (self, request, timed=False):
+        """
+        Returns a (body, headers, stats) tuple for the given request xml. If
+        timed is True the returned stats object will collect timings.
+
+        request can also be an iterable of strings, in which case the body
+        returned is a generator that encodes (and compresses) the chunks as
+        they are sent out. The request byte counts and serialize time in
+        stats are only complete once the body has been sent.
+        """
+
+        if not isinstance(request, basestring):
+            return self.prepare_chunked(request, timed)
+
+        if timed:
+            t = time.time()
+
+        if isinstance(request, unicode):
+            request = request.encode('utf-8')
+
+        stats = SoapTransferStats(req_bytes=len(request), timed=timed)
+        headers = {'Content-Type':'text/xml; charset=utf-8',
+                   "Accept": "text/xml"}
+
+        if self.compress_requests:
+            request = SoapClientBase.gzip(request)
+            headers['Content-Encoding'] = 'gzip'
+        stats.req_wire_bytes = len(request)
+
+        if self.compress_responses:
+            headers['Accept-Encoding'] = 'gzip, deflate'
+
+        if timed:
+            stats.serialize_time = time.time() - t
+
+        return request, headers, stats
+
+    def prepare_chunked (self, chunks, timed=False):
+        stats = SoapTransferStats(timed=timed)
+        headers = {'Content-Type':'text/xml; charset=utf-8',
+                   "Accept": "text/xml"}
+
+        if self.compress_requests:
+            headers['Content-Encoding'] = 'gzip'
+
+        if self.compress_responses:
+            headers['Accept-Encoding'] = 'gzip, deflate'
+
+        return (self._iter_body(chunks, stats, self.compress_requests),
+                headers, stats)
+
+    @staticmethod
+    def _iter_body (chunks, stats, compress):
+        z = None
+        if compress:
+            z = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED,
+                                 16 + zlib.MAX_WBITS)
+
+        ## Only our own work is serialize time; producing the chunks is not
+        for chunk in chunks:
+            if stats.timed:
+                t = time.time()
+
+            if isinstance(chunk, unicode):
+                chunk = chunk.encode('utf-8')
+            stats.req_bytes += len(chunk)
+
+            if z is not None:
+                chunk = z.compress(chunk)
+
+            if stats.timed:
+                stats.serialize_time += time.time() - t
+
+            if len(chunk) > 0:
+                stats.req_wire_bytes += len(chunk)
+                yield chunk
+
+        if z is not None:
+            chunk = z.flush()
+            stats.req_wire_bytes += len(chunk)
+            yield chunk
+
+    @staticmethod
+    def gzip (data):
+        z = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED,
+                             16 + zlib.MAX_WBITS)
+        return z.compress(data) + z.flush()
+
+    @staticmethod
+    def http_error (code, headers, text):
+        ra = headers.get('Retry-After')
+        return SoapHTTPError(code, int(ra) if ra and ra.isdigit() else None,
+                             text)
+
+    def _record_stats (self, stats, timings=None):
+        self.last_stats = stats
+        with self.stats_lock:
+            self.total_stats.add(stats)
+
+        if timings is not None:
+            timings.add_transfer(stats)
+
+        if stats.bytes_saved > 0:
+            logging.debug('SoapClient: %s', stats)
+
+class SoapClient(SoapClientBase):
+    def __init__ (self, service_url, user, pwd, host_pools=DEFAULT_HOST_POOLS,
+                  max_per_host=DEFAULT_MAX_PER_HOST,
+                  idle_timeout=DEFAULT_IDLE_TIMEOUT, transport=None, **kwargs):
+        """
+        host_pools, max_per_host and idle_timeout configure the keep-alive
+        connection pool for service_url; see SoapConnectionPool.get_adapter()
+
+        transport is what actually gets the request to the server and the
+        response back; it defaults to a HTTPTransport. See pyews.transport
+        for ways to record and replay the exchanges instead.
+
+        Other keyword arguments are as for SoapClientBase
+        """
+
+        SoapClientBase.__init__(self, service_url, user, pwd, **kwargs)
         self.auth = HTTPBasicAuth(user, pwd)
 
-    def send (self, request, debug=False):
+        ## Each client gets its own session so that cookies do not leak
+        ## across mailboxes, but the underlying connections are shared with
+        ## all other clients of the same url.
+        adapter = connection_pool.get_adapter(service_url, host_pools,
+                                              max_per_host, idle_timeout)
+        self.session = requests.Session()
+        self.session.auth = self.auth
+        self.session.mount(service_url, adapter)
+
+        self.transport = transport if transport is not None else HTTPTransport()
+
+    def send (self, request, debug=False, stream_tag=None, on_elem=None,
+              timings=None):
         """
-        Send the given rquest to the server, and return the response text as
-        well as a parsed node object as a (resp.text, node) tuple.
+        Send the given request to the server, and return the parsed response
+        - the root element of the whole soap envelope, headers and all. The
+        response text itself is not kept around.
+
+        If stream_tag is not None the response is parsed incrementally as it
+        comes off the socket, and each element with that tag is passed to
+        on_elem as soon as it is complete. Such elements are dropped from the
+        returned tree, which then has the rest of the response. See
+        SoapStreamTarget.
+
+        If timings is not None, it should be a RequestTimings object, and the
+        time spent in encoding, on the network and in parsing is added to it
+        along with the byte counts - whether or not the request succeeds, so
+        that the timings of a retried request cover all its attempts.
 
-        The response text is the raw xml including the soap headers and stuff.
+        If debug is True the response is written to the log, provided the
+        logger is enabled for DEBUG at all.
         """
 
+        debug = debug and utils.debug_enabled()
+
+        self.limiter.acquire()
+        connection_pool.touch(self.url)
+
+        timed = timings is not None
+        request, headers, stats = self.prepare(request, timed)
+
+        stream = self.compress_responses or stream_tag is not None
+        target = None
+        if stream_tag is not None:
+            target = SoapStreamTarget(stream_tag, on_elem)
+
         try:
-            r = requests.post(self.url, auth=self.auth, data=request,
-                              headers={'Content-Type':'text/xml; charset=utf-8',
-                                       "Accept": "text/xml"})
-        except requests.exceptions.ConnectionError as e:
-            raise SoapConnectionError(e)
+            ## A streamed body is encoded while it is being sent, which is
+            ## not network time
+            if timed:
+                t = time.time()
+                st = stats.serialize_time
+
+            try:
+                r = self.transport.post(self, self.url, request, headers,
+                                        stream, self.timeout)
+            finally:
+                if timed:
+                    stats.network_time += ((time.time() - t) -
+                                           (stats.serialize_time - st))
+
+            ## Closing the response hands its connection back to the pool,
+            ## or for a replayed one, its mmap back to the system - whether
+            ## or not we got to read it.
+            try:
+                if r.status_code in HTTP_ERROR_STATUSES:
+                    self._error_body(r, stats)
+                    raise self.http_error(r.status_code, r.headers, r.text)
+
+                if stream:
+                    node = self._parse_stream(r, stats, debug, target)
+                else:
+                    node = self._parse_body(r, stats, debug)
+            finally:
+                r.close()
+        except (requests.exceptions.ConnectionError,
+                requests.exceptions.Timeout,
+                requests.exceptions.ChunkedEncodingError,
+                Urllib3Error) as e:
+            raise SoapConnectionError(e, sent=not request_unsent(e))
+        finally:
+            connection_pool.release(self.url)
+            self._record_stats(stats, timings)
+
+        return node
+
+    def _parse_stream (self, r, stats, debug=False, target=None):
+        """
+        Read the (possibly compressed) response body off the wire in chunks,
+        and feed the decompressed xml straight into the parser as it comes
+        in. The decoded body is never held in memory as a whole, unless we
+        need it for debug logging.
+
+        target, if not None, is a parser target object like SoapStreamTarget
+        """
+
+        feeder = SoapResponseFeeder(stats, debug, target)
+        feeder.set_encoding(r.headers.get('Content-Encoding'))
 
+        ## The time spent reading the body that is not spent in the parser
+        ## is network time
+        if stats.timed:
+            t = time.time()
+            pt = stats.parse_time
+
+        for chunk in r.raw.stream(RESP_CHUNK_SIZE, decode_content=False):
+            feeder.feed(chunk)
+
+        if stats.timed:
+            stats.network_time += ((time.time() - t) -
+                                   (stats.parse_time - pt))
+
+        return feeder.close()
+
+    def _parse_body (self, r, stats, debug=False):
+        """
+        Parse the response body in one go, once requests has read all of it.
+        """
+
+        if stats.timed:
+            t = time.time()
+
+        ## The parser gets the bytes as they came in and works out the
+        ## encoding from the xml declaration. r.text would have requests
+        ## guess the charset and make a decoded copy of the whole response
+        ## first.
+        body = r.content
+        stats.resp_bytes = len(body)
+        stats.resp_wire_bytes = SoapClient._wire_bytes(r, stats.resp_bytes)
         if debug:
-            logging.debug('%s', pretty_xml(r.text))
+            logging.debug('%s', LazyPrettyXml(body))
+        node = SoapClient.parse_xml(body)
+
+        if stats.timed:
+            stats.parse_time += time.time() - t
 
-        return SoapClient.parse_xml(r.text)
+        return node
+
+    @staticmethod
+    def _error_body (r, stats):
+        """
+        Count the body of an error response, which is read in one go
+        """
+
+        if stats.timed:
+            t = time.time()
+
+        stats.resp_bytes = len(r.content)
+        stats.resp_wire_bytes = SoapClient._wire_bytes(r, stats.resp_bytes)
+
+        if stats.timed:
+            stats.network_time += time.time() - t
+
+    @staticmethod
+    def _wire_bytes (r, default):
+        try:
+            return r.raw.tell() or default
+        except (AttributeError, IOError):
+            return default
 
     @staticmethod
     def parse_xml (soap_resp):
-        return ET.fromstring(soap_resp)
+        """
+        Parse the response xml. soap_resp should preferably be the raw bytes
+        of the response; a unicode string is encoded to UTF-8 first, as
+        the parser cannot take non-ASCII unicode text.
+        """
+
+        if isinstance(soap_resp, unicode):
+            soap_resp = soap_resp.encode('utf-8')
+        return xmlbackend.fromstring(soap_resp)
 
     @staticmethod
     def get_node_attribute (root, node, att):
@@ -123,14 +847,15 @@ class SoapClient(object):
     def get_node_detail (soap_resp, root, node):
         """
         From given soap response xml find the first occurrence of node and
-        return a tuple (node.text, node.attr, root)
+        return a tuple (node.text, node.attrib, root)
 
-        node should be a string. root should be an Element object if not
-        None. In the returned tuple node.text willbe a string, node.attrib
-        will be a dictionary.
+        node should be a string. root should be the already parsed response
+        as an Element object, or None to have soap_resp parsed. In the
+        returned tuple node.text will be a string, and node.attrib a
+        dictionary.
         """
 
-        if root is not None:
+        if root is None:
             root = SoapClient.parse_xml(soap_resp)
 
         if root is None:
@@ -141,3 +866,151 @@ class SoapClient(object):
                 return (i.text, i.attrib, root)
 
         return (None, None, root)
+
+## tornado insists on having a timeout, so this is what "no timeout" means
+## for AsyncSoapClient.
+ASYNC_TIMEOUT = 24 * 3600
+
+class AsyncSoapClient(SoapClientBase):
+    """
+    Non blocking counterpart of SoapClient built on the tornado
+    AsyncHTTPClient. send() is a coroutine; under Python 3 tornado runs on
+    top of the asyncio event loop, so it can be awaited from asyncio code as
+    well. Responses are parsed incrementally as the chunks arrive, just like
+    the streaming mode of SoapClient.
+
+    Note that the default tornado http client does not keep connections
+    alive. If pycurl is available, do
+
+        AsyncHTTPClient.configure('tornado.curl_httpclient.CurlAsyncHTTPClient')
+
+    before creating any clients to get pooled keep-alive connections.
+    """
+
+    def __init__ (self, service_url, user, pwd, max_clients=100, **kwargs):
+        """
+        max_clients is the number of requests that can be in flight at any
+        time; it only has an effect when the first client on a given IOLoop
+        is created, as tornado shares the http client per IOLoop. Other
+        keyword arguments are as for SoapClientBase
+        """
+
+        SoapClientBase.__init__(self, service_url, user, pwd, **kwargs)
+        self.http = httpclient.AsyncHTTPClient(max_clients=max_clients)
+
+    @gen.coroutine
+    def send (self, request, debug=False, stream_tag=None, on_elem=None,
+              timings=None):
+        """
+        Same as SoapClient.send(), except that this is a coroutine that
+        resolves to the parsed response.
+        """
+
+        debug = debug and utils.debug_enabled()
+
+        wait = self.limiter.reserve()
+        if wait > 0:
+            yield gen.sleep(wait)
+
+        timed = timings is not None
+        request, headers, stats = self.prepare(request, timed)
+
+        target = None
+        if stream_tag is not None:
+            target = SoapStreamTarget(stream_tag, on_elem)
+        head = _AsyncResponseHead(SoapResponseFeeder(stats, debug, target))
+
+        ## Streamed bodies go out with chunked transfer encoding. Note that
+        ## the curl based client does not support body_producer.
+        body, producer = request, None
+        if not isinstance(request, basestring):
+            body, producer = None, _body_producer(request)
+
+        req = httpclient.HTTPRequest(self.url, method='POST', body=body,
+                                     body_producer=producer,
+                                     headers=headers, auth_username=self.user,
+                                     auth_password=self.pwd, auth_mode='basic',
+                                     decompress_response=False,
+                                     connect_timeout=self.timeout or ASYNC_TIMEOUT,
+                                     request_timeout=self.timeout or ASYNC_TIMEOUT,
+                                     header_callback=head.on_header,
+                                     streaming_callback=head.on_chunk)
+        if timed:
+            t = time.time()
+            st = stats.serialize_time
+
+        try:
+            try:
+                r = yield self.http.fetch(req, raise_error=False)
+            except IOError as e:
+                raise SoapConnectionError(e, sent=not request_unsent(e))
+            finally:
+                ## The body is parsed as it comes in, and a streamed request
+                ## body encoded as it goes out, and neither is network time.
+                ## This also counts the time the request spent queued behind
+                ## others in the http client.
+                if timed:
+                    stats.network_time += ((time.time() - t) -
+                                           stats.parse_time -
+                                           (stats.serialize_time - st))
+
+            if r.code == 599:
+                raise SoapConnectionError(r.error,
+                                          sent=not request_unsent(r.error))
+
+            if r.code in HTTP_ERROR_STATUSES:
+                body = ''.join(head.error_body)
+                stats.resp_bytes = stats.resp_wire_bytes = len(body)
+                raise self.http_error(r.code, r.headers, body)
+
+            if head.error is not None:
+                raise head.error
+
+            node = head.feeder.close()
+        finally:
+            self._record_stats(stats, timings)
+
+        raise gen.Return(node)
+
+def _body_producer (chunks):
+    @gen.coroutine
+    def producer (write):
+        for chunk in chunks:
+            yield write(chunk)
+
+    return producer
+
+class _AsyncResponseHead(object):
+    """
+    Glue between the header and body callbacks of the tornado http client
+    and a SoapResponseFeeder. Bodies of error statuses are not fed to the
+    parser. Exceptions from the parser are held on to and raised once the
+    fetch completes, as raising them from inside the callbacks will not do
+    what we want.
+    """
+
+    def __init__ (self, feeder):
+        self.feeder = feeder
+        self.headers = httputil.HTTPHeaders()
+        self.code = None
+        self.error = None
+        self.error_body = []
+
+    def on_header (self, line):
+        if line.startswith('HTTP/'):
+            ## A new response, may be after a 100-continue or a redirect.
+            self.headers = httputil.HTTPHeaders()
+            self.code = int(line.split(' ', 2)[1])
+        elif line.strip():
+            self.headers.parse_line(line)
+        else:
+            self.feeder.set_encoding(self.headers.get('Content-Encoding'))
+
+    def on_chunk (self, chunk):
+        if self.code in HTTP_ERROR_STATUSES:
+            self.error_body.append(chunk)
+        elif self.error is None:
+            try:
+                self.feeder.feed(chunk)
+            except Exception as e:
+                self.error = e
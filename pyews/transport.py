@@ -0,0 +1,257 @@
+##
+## Created : Sun Oct 18 14:02:17 IST 2026
+##
+## Copyright (C) 2026 Sriram Karra <karra.etc@gmail.com>
+##
+## This file is part of pyews
+##
+## pyews is free software: you can redistribute it and/or modify it under
+## the terms of the GNU Affero General Public License as published by the
+## Free Software Foundation, version 3 of the License
+##
+## pyews is distributed in the hope that it will be useful, but WITHOUT
+## ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+## FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero General Public
+## License for more details.
+##
+## You should have a copy of the license in the doc/ directory of pyews.  If
+## not, see <http://www.gnu.org/licenses/>.
+
+##
+## A transport is what SoapClient uses to get a request body to the server
+## and the response back. The default HTTPTransport simply posts on the
+## client's requests session. RecordingTransport saves every exchange to a
+## directory, and ReplayTransport answers requests from such a directory
+## without touching the network. That way parsing and object construction
+## can be profiled with the network taken out of the picture.
+##
+## A transport has a single method:
+##
+##     post (client, url, data, headers, stream, timeout)
+##
+## which returns an object that behaves like a requests.Response as far as
+## SoapClient.send() is concerned: status_code, headers, content, text,
+## raw.stream(), raw.tell() and close().
+##
+
+import glob, hashlib, json, logging, mmap, os, re, threading, zlib
+from   requests.structures import CaseInsensitiveDict
+import utils
+
+class SoapReplayError(Exception):
+    """
+    Raised by ReplayTransport when there is no recorded response for a
+    request.
+    """
+    pass
+
+## Response headers worth keeping in a recording
+RECORDED_HEADERS = ['Content-Type', 'Content-Encoding', 'Retry-After']
+
+_TAG_RE = re.compile(r'<[^<>]+>')
+_IN_TAG_SPACE_RE = re.compile(r'\s+')
+_SPACE_BEFORE_END_RE = re.compile(r'\s+(/?>)$')
+
+def _normalize_tag (m):
+    t = _IN_TAG_SPACE_RE.sub(' ', m.group(0))
+    return _SPACE_BEFORE_END_RE.sub(r'\1', t)
+
+def normalize_request (data, headers=None):
+    """
+    Return the request body in a canonical form that is used to match
+    requests to recorded responses: decompressed, compacted as by
+    utils.compact_xml(), and with runs of white space inside tags collapsed.
+    This way a recording survives changes in the indentation of the request
+    templates. The text of elements is left alone, so requests that differ only in
+    the spacing of a value get responses of their own.
+    """
+
+    if not isinstance(data, basestring):
+        data = ''.join(data)
+
+    if headers is not None and headers.get('Content-Encoding') == 'gzip':
+        data = zlib.decompress(data, 16 + zlib.MAX_WBITS)
+
+    if isinstance(data, unicode):
+        data = data.encode('utf-8')
+
+    data = utils.compact_xml(data)
+    return _TAG_RE.sub(_normalize_tag, data)
+
+def request_key (data, headers=None):
+    return hashlib.sha1(normalize_request(data, headers)).hexdigest()
+
+class ReplayRaw(object):
+    """
+    Stands in for the urllib3 response in ReplayResponse.raw. buf is
+    anything that can be sliced and has a length - a string or a mmap.
+    """
+
+    def __init__ (self, buf):
+        self.buf = buf
+        self.pos = 0
+
+    def stream (self, amt, decode_content=False):
+        while self.pos < len(self.buf):
+            chunk = self.buf[self.pos:self.pos+amt]
+            self.pos += len(chunk)
+            yield chunk
+
+    def read (self, amt=None, decode_content=False):
+        end = len(self.buf) if amt is None else self.pos + amt
+        chunk = self.buf[self.pos:end]
+        self.pos += len(chunk)
+        return chunk
+
+    def tell (self):
+        return self.pos
+
+class ReplayResponse(object):
+    """
+    A response served from memory instead of the network. body is the
+    response as it came over the wire, i.e. still compressed if the
+    headers say so.
+    """
+
+    def __init__ (self, status_code, headers, body, closer=None):
+        self.status_code = status_code
+        self.headers = CaseInsensitiveDict(headers)
+        self.raw = ReplayRaw(body)
+        self.closer = closer
+        self._content = None
+
+    @property
+    def content (self):
+        if self._content is None:
+            body = self.raw.read()
+            enc = (self.headers.get('Content-Encoding') or '').lower()
+            if enc == 'gzip':
+                body = zlib.decompress(body, 16 + zlib.MAX_WBITS)
+            elif enc == 'deflate':
+                body = zlib.decompress(body)
+            self._content = body
+
+        return self._content
+
+    @property
+    def text (self):
+        return self.content.decode('utf-8')
+
+    def close (self):
+        if self.closer is not None:
+            self.closer()
+            self.closer = None
+
+class HTTPTransport(object):
+    """
+    Send requests over the network on the client's session.
+    """
+
+    def post (self, client, url, data, headers, stream, timeout):
+        return client.session.post(url, data=data, headers=headers,
+                                   stream=stream, timeout=timeout)
+
+class RecordingTransport(object):
+    """
+    Passes requests on to another transport and saves each request and its
+    response under 'directory' for ReplayTransport. The n-th response to a
+    given request goes into <key>.<n>.body, with the status and headers in
+    <key>.<n>.meta
+    """
+
+    def __init__ (self, directory, inner=None):
+        self.directory = directory
+        self.inner = inner if inner is not None else HTTPTransport()
+        self.lock = threading.Lock()
+        self.counts = {}
+
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def post (self, client, url, data, headers, stream, timeout):
+        ## A streamed request body can only be read once
+        if not isinstance(data, basestring):
+            data = ''.join(data)
+
+        ## Always stream, so we get to see the response body exactly as it
+        ## came off the wire.
+        r = self.inner.post(client, url, data, headers, True, timeout)
+        try:
+            body = r.raw.read(decode_content=False)
+        finally:
+            r.close()
+
+        resp_headers = dict([(h, r.headers[h]) for h in RECORDED_HEADERS
+                             if h in r.headers])
+        key = request_key(data, headers)
+
+        with self.lock:
+            n = self.counts.get(key, 0)
+            self.counts[key] = n + 1
+
+        base = os.path.join(self.directory, '%s.%d' % (key, n))
+        with open(base + '.body', 'wb') as f:
+            f.write(body)
+        with open(base + '.meta', 'w') as f:
+            json.dump({'status'  : r.status_code,
+                       'headers' : resp_headers,
+                       'url'     : url,
+                       'request' : normalize_request(data, headers)},
+                      f, indent=2)
+
+        logging.debug('RecordingTransport: saved %s (%d bytes)', base,
+                      len(body))
+
+        return ReplayResponse(r.status_code, resp_headers, body)
+
+class ReplayTransport(object):
+    """
+    Serve responses from a directory written by RecordingTransport. The
+    response bodies are memory mapped, so replaying costs next to nothing
+    and whatever time is spent in a request is down to parsing and
+    building the response objects.
+
+    If a request was recorded more than once the responses are handed out
+    in the order they were recorded, and the last one is repeated after
+    that. A request that was never recorded raises SoapReplayError.
+    """
+
+    def __init__ (self, directory):
+        self.directory = directory
+        self.lock = threading.Lock()
+        self.counts = {}
+        self.index = {}
+
+        for meta in glob.glob(os.path.join(directory, '*.meta')):
+            key, n = os.path.basename(meta).split('.')[:2]
+            self.index.setdefault(key, []).append((int(n), meta[:-5]))
+
+        for key in self.index:
+            self.index[key].sort()
+
+        logging.debug('ReplayTransport: %d requests recorded in %s',
+                      len(self.index), directory)
+
+    def post (self, client, url, data, headers, stream, timeout):
+        key = request_key(data, headers)
+        if key not in self.index:
+            raise SoapReplayError('No recorded response for request %s' % key)
+
+        with self.lock:
+            recs = self.index[key]
+            n = self.counts.get(key, 0)
+            self.counts[key] = n + 1
+            base = recs[min(n, len(recs) - 1)][1]
+
+        with open(base + '.meta') as f:
+            meta = json.load(f)
+
+        with open(base + '.body', 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            if size == 0:
+                return ReplayResponse(meta['status'], meta['headers'], '')
+
+            buf = mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ)
+
+        return ReplayResponse(meta['status'], meta['headers'], buf,
+                              closer=buf.close)
@@ -1,5 +1,7 @@
 
-import md5, os, re, urllib2, xml.dom.minidom
+import importlib, logging, md5, os, re, threading, urllib2
+import xmlbackend
+from   tornado import template
 
 CUR_DIR = os.path.dirname(os.path.realpath(__file__))
 REQUESTS_DIR = os.path.abspath(os.path.join(CUR_DIR, "templates"))
@@ -14,7 +16,7 @@ REQ_CREATE_FOLDER = template_fn("create_folder.xml")
 REQ_DELETE_FOLDER = template_fn("delete_folder.xml")
 REQ_BIND_FOLDER = template_fn("bind.xml")
 REQ_FIND_FOLDER_ID = template_fn("find_folder_id.xml")
-REQ_FIND_FOLDER_DI = template_fn("find_folder_distinguishd.xml")
+REQ_FIND_FOLDER_DI = template_fn("find_folder_distinguished.xml")
 REQ_FIND_ITEM = template_fn("find_item.xml")
 REQ_FIND_ITEM_LMT = template_fn("find_item_lmt.xml")
 REQ_GET_ITEM = template_fn("get_item.xml")
@@ -23,11 +25,163 @@ REQ_DELETE_ITEM = template_fn("delete_item.xml")
 REQ_UPDATE_ITEM = template_fn("update_item.xml")
 REQ_SYNC_FOLDER = template_fn("sync_folder.xml")
 
+## The templates used to build EWS requests. See warm_templates()
+REQ_TEMPLATES = [REQ_AUTODIS_EPS, REQ_GET_FOLDER, REQ_CREATE_FOLDER,
+                 REQ_DELETE_FOLDER, REQ_BIND_FOLDER, REQ_FIND_FOLDER_ID,
+                 REQ_FIND_FOLDER_DI, REQ_FIND_ITEM, REQ_FIND_ITEM_LMT,
+                 REQ_GET_ITEM, REQ_CREATE_ITEM, REQ_DELETE_ITEM,
+                 REQ_UPDATE_ITEM, REQ_SYNC_FOLDER]
+
+_loader = None
+_loader_lock = threading.Lock()
+
+def template_loader ():
+    """
+    Return the process wide tornado template Loader for the request
+    templates. The loader caches the compiled templates and is thread safe,
+    so all ExchangeService objects share this one and each template is
+    compiled only once in the life of the process.
+    """
+
+    global _loader
+
+    if _loader is None:
+        with _loader_lock:
+            if _loader is None:
+                _loader = template.Loader(REQUESTS_DIR)
+
+    return _loader
+
+def warm_templates (names=None):
+    """
+    Compile the given request templates - all of REQ_TEMPLATES by default -
+    along with the templates they extend, and load the modules they import.
+    Call this once at start up so that the first request of every service
+    does not pay for it. Returns the shared loader.
+    """
+
+    ## The base template imports these every time it is rendered; make sure
+    ## that is just a lookup in sys.modules.
+    importlib.import_module('pyews.ews.mapitags')
+    importlib.import_module('pyews.ews.data')
+
+    loader = template_loader()
+    for name in (names if names is not None else REQ_TEMPLATES):
+        loader.load(name)
+
+    return loader
+
 def pretty_xml (x):
-    x = xml.dom.minidom.parseString(x).toprettyxml()
-    lines = x.splitlines()
-    lines = [s for s in lines if not re.match(s.strip(), '^\s*$')]
-    return os.linesep.join(lines)
+    return xmlbackend.pretty_xml(x)
+
+_COMMENT_RE = re.compile(r'<!--.*?-->', re.DOTALL)
+_SPACE_AFTER_TAG_RE = re.compile(r'(<[^<>]*>)\s+(?=<(/?))')
+_TAG_RE = re.compile(r'<[^<>]*\n[^<>]*>')
+_NEWLINE_RE = re.compile(r'\s*\n\s*')
+_SPACE_BEFORE_END_RE = re.compile(r'\s+(/?>)$')
+
+def _space_after_tag (m):
+    ## White space between a start tag and the matching end tag is the text
+    ## of the element, and stays
+    tag = m.group(1)
+    if m.group(2) and tag[1] not in '/?!' and tag[-2] != '/':
+        return m.group(0)
+
+    return tag
+
+def _compact_tag (m):
+    t = _NEWLINE_RE.sub(' ', m.group(0))
+    return _SPACE_BEFORE_END_RE.sub(r'\1', t)
+
+def compact_xml (x):
+    """
+    Return x with comments and the white space between tags stripped out,
+    and line breaks inside tags folded. This is what goes on the wire; it
+    is a lot cheaper than pretty_xml(), which parses and rewrites the whole
+    document. Text content is left alone, including text that is all white
+    space, like that of <t:Notes>   </t:Notes>.
+    """
+
+    x = _COMMENT_RE.sub('', x)
+    x = _SPACE_AFTER_TAG_RE.sub(_space_after_tag, x)
+    x = _TAG_RE.sub(_compact_tag, x)
+    return x.strip()
+
+def utf8 (v):
+    """
+    v as a UTF-8 byte string. Byte strings are taken to be UTF-8 already.
+    Anything that is not a string is converted with str() first.
+    """
+
+    if isinstance(v, str):
+        return v
+    if isinstance(v, unicode):
+        return v.encode('utf-8')
+
+    v = str(v)
+    return v.encode('utf-8') if isinstance(v, unicode) else v
+
+def xml_text (v):
+    """
+    v as UTF-8 bytes, escaped for use as the text of an element. None is
+    the empty string. Most values have nothing to escape, so that is checked
+    for before doing any replacing.
+
+    The xml we generate is put together from such byte strings, so that it
+    can be sent as it is without being encoded again.
+    """
+
+    if v is None:
+        return ''
+
+    v = utf8(v)
+    if '&' in v or '<' in v or '>' in v:
+        v = v.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+
+    return v
+
+def xml_attr (v):
+    """
+    Same as xml_text(), but for use as an attribute value in double quotes.
+    """
+
+    if v is None:
+        return ''
+
+    v = utf8(v)
+    if '&' in v or '<' in v or '>' in v or '"' in v:
+        v = v.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+        v = v.replace('"', '&quot;')
+
+    return v
+
+def debug_enabled ():
+    """
+    True if a debug message would make it to the log. Check this before
+    doing any work that is only needed for debug output.
+    """
+
+    return logging.getLogger().isEnabledFor(logging.DEBUG)
+
+class LazyPrettyXml(object):
+    """
+    Wraps a xml string or Element so that it is pretty printed only when it
+    is converted to a string. Pass this to the logging calls, so that the
+    cost is incurred only if the message is actually logged.
+    """
+
+    def __init__ (self, x):
+        self.x = x
+
+    def __str__ (self):
+        x = self.x
+        if xmlbackend.iselement(x):
+            x = xmlbackend.tostring(x)
+
+        try:
+            return pretty_xml(x).encode('utf-8')
+        except Exception:
+            return x if isinstance(x, str) else x.encode('utf-8')
 
 def pretty_eid (x):
     """
@@ -0,0 +1,173 @@
+##
+## Created : Sun Oct 18 23:12:05 IST 2026
+##
+## Copyright (C) 2026 Sriram Karra <karra.etc@gmail.com>
+##
+## This file is part of pyews
+##
+## pyews is free software: you can redistribute it and/or modify it under
+## the terms of the GNU Affero General Public License as published by the
+## Free Software Foundation, version 3 of the License
+##
+## pyews is distributed in the hope that it will be useful, but WITHOUT
+## ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+## FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero General Public
+## License for more details.
+##
+## You should have a copy of the license in the doc/ directory of pyews.  If
+## not, see <http://www.gnu.org/licenses/>.
+
+##
+## All the xml parsing - whole responses as well as the incremental parsing
+## of streamed ones - and the serialization of parsed elements for the logs
+## goes through this module, so the ElementTree implementation underneath
+## can be swapped out. The backends, from the fastest down:
+##
+##     lxml         : if the lxml package is installed
+##     cElementTree : the C version of ElementTree from the standard library
+##     ElementTree  : the pure python one
+##
+## The fastest one available is picked when the module is loaded, unless
+## the PYEWS_XML_BACKEND environment variable names another one. use()
+## switches backends at run time. All of them produce element trees that
+## the rest of pyews can work with: tags in {namespace}name form, and no
+## comments or processing instructions.
+##
+## The requests themselves are put together as strings (see ews.builders),
+## and do not involve the backend at all.
+##
+
+import importlib, logging, os, xml.dom.minidom
+
+## The backends in order of preference, with the module for each
+BACKENDS = ['lxml', 'cElementTree', 'ElementTree']
+MODULES  = {
+    'lxml'         : 'lxml.etree',
+    'cElementTree' : 'xml.etree.cElementTree',
+    'ElementTree'  : 'xml.etree.ElementTree',
+}
+
+## The backend in use, and its etree module
+name  = None
+etree = None
+
+## libxml2, under lxml, refuses documents that nest too deep or have very
+## large text nodes, as a guard against hostile input. Set this to True to
+## lift those limits, if you trust the server and it sends responses that
+## run into them.
+HUGE_TREE = False
+
+def load (backend):
+    """
+    Return the etree module for the named backend, or None if it is not
+    available
+    """
+
+    try:
+        return importlib.import_module(MODULES[backend])
+    except ImportError:
+        return None
+
+def available ():
+    """
+    The names of the backends that can be used here, fastest first
+    """
+
+    return [b for b in BACKENDS if load(b) is not None]
+
+def use (backend=None):
+    """
+    Switch to the named backend. With no name pick the fastest one that is
+    available. Raises ValueError for an unknown backend and ImportError if
+    it is not installed. Returns the name of the backend.
+    """
+
+    global name, etree
+
+    if backend is None:
+        backend = available()[0]
+
+    if backend not in MODULES:
+        raise ValueError('Unknown xml backend: %s. Choose one of %s' %
+                         (backend, BACKENDS))
+
+    mod = load(backend)
+    if mod is None:
+        raise ImportError('xml backend %s is not available' % backend)
+
+    name, etree = backend, mod
+    logging.debug('xmlbackend: using %s', name)
+
+    return name
+
+def XMLParser (target=None):
+    """
+    An incremental parser, to be fed with feed() and finished with close().
+    Builds an element tree unless a parser target is given.
+    """
+
+    if name == 'lxml':
+        return etree.XMLParser(target=target, resolve_entities=False,
+                               remove_comments=True, remove_pis=True,
+                               huge_tree=HUGE_TREE)
+
+    ## cElementTree builds nothing when given target=None explicitly
+    if target is None:
+        target = etree.TreeBuilder()
+
+    return etree.XMLParser(target=target)
+
+def XMLPullParser (tag):
+    """
+    An incremental parser that lines up the end events of the elements with
+    the given tag, to be picked up with read_events(). Only lxml has one of
+    these; None for the other backends.
+    """
+
+    if name != 'lxml':
+        return None
+
+    return etree.XMLPullParser(events=('end',), tag=tag,
+                               resolve_entities=False, remove_comments=True,
+                               remove_pis=True, huge_tree=HUGE_TREE)
+
+def TreeBuilder ():
+    return etree.TreeBuilder()
+
+def fromstring (data):
+    """
+    Parse the xml in the byte string data and return the root element
+    """
+
+    if name == 'lxml':
+        return etree.fromstring(data, XMLParser())
+
+    return etree.fromstring(data)
+
+def tostring (elem):
+    return etree.tostring(elem)
+
+def iselement (x):
+    return etree.iselement(x)
+
+def pretty_xml (x):
+    """
+    Indent the xml in the string x, one element to a line
+    """
+
+    if name == 'lxml':
+        if isinstance(x, unicode):
+            x = x.encode('utf-8')
+
+        parser = etree.XMLParser(resolve_entities=False, huge_tree=HUGE_TREE,
+                                 remove_blank_text=True)
+        x = etree.tostring(etree.fromstring(x, parser), pretty_print=True,
+                           encoding=unicode)
+    else:
+        x = xml.dom.minidom.parseString(x).toprettyxml()
+
+    lines = x.splitlines()
+    lines = [s for s in lines if s.strip()]
+    return os.linesep.join(lines)
+
+use(os.environ.get('PYEWS_XML_BACKEND') or None)
@@ -0,0 +1,111 @@
+##
+## Created : Sun Oct 18 23:40:52 IST 2026
+##
+## Copyright (C) 2026 Sriram Karra <karra.etc@gmail.com>
+##
+## This file is part of pyews
+##
+## pyews is free software: you can redistribute it and/or modify it under
+## the terms of the GNU Affero General Public License as published by the
+## Free Software Foundation, version 3 of the License
+##
+## pyews is distributed in the hope that it will be useful, but WITHOUT
+## ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+## FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero General Public
+## License for more details.
+##
+## You should have a copy of the license in the doc/ directory of pyews.  If
+## not, see <http://www.gnu.org/licenses/>.
+
+##
+## Compare the xml backends (see pyews/xmlbackend.py) on a large GetItems
+## response from the mock server. For each backend that is installed this
+## times, in MB of response xml per second:
+##
+##     parse  : parsing the whole response in one go
+##     stream : feeding it in chunks to the incremental parser, handing off
+##              every Contact element as it completes
+##     build  : the stream, plus building a Contact from each element
+##     dump   : serializing the parsed response back to a string
+##
+##     python tests/bench_xml.py --items 5000 --rounds 5
+##
+
+import argparse, os, sys, time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..'))
+
+from   mock_server       import MockEWSServer
+from   pyews             import xmlbackend
+from   pyews.soap        import SoapResponseFeeder, SoapStreamTarget
+from   pyews.soap        import SoapTransferStats, RESP_CHUNK_SIZE, QName_T
+from   pyews.ews         import builders
+from   pyews.ews.contact import Contact
+
+def get_items_response (n):
+    server = MockEWSServer(size=n)
+    ids = ['mock-item-%08d' % i for i in range(1, n+1)]
+    xml, count = server.dispatch(builders.get_items(ids))
+
+    return xml.encode('utf-8') if isinstance(xml, unicode) else xml
+
+def stream (resp, callback):
+    target = SoapStreamTarget(QName_T('Contact'), callback)
+    feeder = SoapResponseFeeder(SoapTransferStats(), target=target)
+    for i in range(0, len(resp), RESP_CHUNK_SIZE):
+        feeder.feed(resp[i:i+RESP_CHUNK_SIZE])
+
+    return feeder.close()
+
+def run_parse (resp):
+    xmlbackend.fromstring(resp)
+
+def run_stream (resp):
+    stream(resp, lambda elem: None)
+
+def run_build (resp):
+    contacts = []
+    stream(resp, lambda elem: contacts.append(Contact(None, resp_node=elem)))
+
+def run_dump (resp):
+    xmlbackend.tostring(run_dump.root)
+
+BENCHMARKS = [('parse', run_parse), ('stream', run_stream),
+              ('build', run_build), ('dump', run_dump)]
+
+def best_of (rounds, fn, resp):
+    best = None
+    for i in range(rounds):
+        t = time.time()
+        fn(resp)
+        t = time.time() - t
+        best = t if best is None else min(best, t)
+
+    return best
+
+def main (argv=None):
+    p = argparse.ArgumentParser(description='Benchmark the xml backends')
+    p.add_argument('--items', type=int, default=2000,
+                   help='Number of contacts in the GetItems response')
+    p.add_argument('--rounds', type=int, default=3,
+                   help='Number of runs of each benchmark; the best counts')
+    p.add_argument('--backends', nargs='*', default=None,
+                   help='Backends to compare; all available ones by default')
+    args = p.parse_args(argv)
+
+    resp = get_items_response(args.items)
+    mb = len(resp) / (1024.0 * 1024.0)
+    print 'GetItems response with %d contacts: %.1f MB' % (args.items, mb)
+    print '%-14s ' % 'MB/s' + ' '.join(['%8s' % b for b, fn in BENCHMARKS])
+
+    for backend in (args.backends or xmlbackend.available()):
+        xmlbackend.use(backend)
+        run_dump.root = xmlbackend.fromstring(resp)
+
+        times = [best_of(args.rounds, fn, resp) for b, fn in BENCHMARKS]
+        print '%-14s ' % backend + ' '.join(['%8.1f' % (mb / t)
+                                             for t in times])
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+##
+## Created : Sun Oct 18 20:54:32 IST 2026
+##
+## Copyright (C) 2026 Sriram Karra <karra.etc@gmail.com>
+##
+## This file is part of pyews
+##
+## pyews is free software: you can redistribute it and/or modify it under
+## the terms of the GNU Affero General Public License as published by the
+## Free Software Foundation, version 3 of the License
+##
+## pyews is distributed in the hope that it will be useful, but WITHOUT
+## ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+## FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero General Public
+## License for more details.
+##
+## You should have a copy of the license in the doc/ directory of pyews.  If
+## not, see <http://www.gnu.org/licenses/>.
+
+##
+## Shared bits for the tests that run pyews against the in process mock
+## server (see mock_server.py):
+##
+##     python -m pytest tests
+##
+
+import pytest
+
+from   tests.mock_server import MockEWSServer
+from   pyews.pyews       import ExchangeService, WebCredentials
+
+## The id of the contacts folder of the mock mailbox
+CONTACTS_FID = 'mock-contacts'
+
+def make_service (url, **kwargs):
+    """
+    A ExchangeService talking to the mock server at url. Keyword arguments
+    go to init_soap_client()
+    """
+
+    ews = ExchangeService()
+    ews.credentials = WebCredentials('user@example.com', 'secret')
+    ews.Url = url
+    ews.init_soap_client(**kwargs)
+
+    return ews
+
+@pytest.fixture
+def mock_server (request):
+    """
+    A running MockEWSServer. Tests can pass arguments for it with the
+    mock_server_args marker, for e.g.
+
+        @pytest.mark.mock_server_args(size=10, throttle_rate=5)
+    """
+
+    marker = request.node.get_closest_marker('mock_server_args')
+    kwargs = marker.kwargs if marker is not None else {}
+
+    server = MockEWSServer(**kwargs)
+    server.start()
+    yield server
+    server.stop()
+
+def pytest_configure (config):
+    config.addinivalue_line('markers', 'mock_server_args(**kwargs): '
+                            'arguments for the mock_server fixture')
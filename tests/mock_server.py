@@ -0,0 +1,907 @@
+##
+## Created : Sun Oct 18 13:05:41 IST 2026
+##
+## Copyright (C) 2026 Sriram Karra <karra.etc@gmail.com>
+##
+## This file is part of pyews
+##
+## pyews is free software: you can redistribute it and/or modify it under
+## the terms of the GNU Affero General Public License as published by the
+## Free Software Foundation, version 3 of the License
+##
+## pyews is distributed in the hope that it will be useful, but WITHOUT
+## ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+## FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero General Public
+## License for more details.
+##
+## You should have a copy of the license in the doc/ directory of pyews.  If
+## not, see <http://www.gnu.org/licenses/>.
+
+##
+## A stand-in EWS server that keeps a single contacts mailbox in memory. It
+## understands just enough of the protocol for pyews to work against it:
+## GetFolder, FindFolder, FindItem (with paging and the LMT restriction),
+## GetItem, CreateItem, UpdateItem, DeleteItem and SyncFolderItems. Response
+## latency, server side throttling and the size of the mailbox can be set,
+## so client throughput can be measured reproducibly without a real
+## Exchange server. Run it from the command line:
+##
+##     python tests/mock_server.py --port 8080 --items 100000 --latency 0.05
+##
+## and point a ExchangeService at http://127.0.0.1:8080/EWS/Exchange.asmx
+## with any credentials. Or start it in process with MockEWSServer.start()
+##
+
+import argparse, base64, logging, threading, time
+import xml.etree.ElementTree as ET
+
+from   collections      import OrderedDict
+from   xml.sax.saxutils import escape, quoteattr
+from   tornado          import gen, httpserver, ioloop, netutil, web
+
+S_NAMESPACE = "http://schemas.xmlsoap.org/soap/envelope/"
+M_NAMESPACE = "http://schemas.microsoft.com/exchange/services/2006/messages"
+T_NAMESPACE = "http://schemas.microsoft.com/exchange/services/2006/types"
+E_NAMESPACE = "http://schemas.microsoft.com/exchange/services/2006/errors"
+
+ET.register_namespace('t', T_NAMESPACE)
+
+def QName_M (tag):
+    return '{%s}%s' % (M_NAMESPACE, tag)
+
+def QName_T (tag):
+    return '{%s}%s' % (T_NAMESPACE, tag)
+
+EWS_PATH = '/EWS/Exchange.asmx'
+
+PR_GENDER = 0x3a4d
+PR_LAST_MODIFICATION_TIME = 0x3008
+
+## All the synthetic contacts have this creation and modification time
+BASE_TIME = '2014-01-01T00:00:00Z'
+
+ENVELOPE = ('<?xml version="1.0" encoding="utf-8"?>'
+            '<s:Envelope xmlns:s="%s">'
+            '<s:Header><h:ServerVersionInfo MajorVersion="15" MinorVersion="0" '
+            'MajorBuildNumber="0" MinorBuildNumber="0" Version="Exchange2013" '
+            'xmlns:h="%s"/></s:Header>'
+            '<s:Body xmlns:m="%s" xmlns:t="%s">%%s</s:Body></s:Envelope>' %
+            (S_NAMESPACE, T_NAMESPACE, M_NAMESPACE, T_NAMESPACE))
+
+FAULT = ('<?xml version="1.0" encoding="utf-8"?>'
+         '<s:Envelope xmlns:s="%s"><s:Body><s:Fault>'
+         '<faultcode xmlns:a="%s">a:%%s</faultcode>'
+         '<faultstring xml:lang="en-US">%%s</faultstring>'
+         '<detail><e:ResponseCode xmlns:e="%s">%%s</e:ResponseCode>'
+         '<e:Message xmlns:e="%s">%%s</e:Message>%%s</detail>'
+         '</s:Fault></s:Body></s:Envelope>' %
+         (S_NAMESPACE, E_NAMESPACE, E_NAMESPACE, E_NAMESPACE))
+
+def utcnow ():
+    return time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
+
+def prop_tag (tag):
+    """
+    pyews sends property tags in decimal, Exchange uses hex. Take both.
+    """
+
+    try:
+        return int(tag, 0)
+    except (TypeError, ValueError):
+        return None
+
+def response_message (op, body='', code='NoError', text=None):
+    cls = 'Success' if code == 'NoError' else 'Error'
+    s = '<m:%sResponseMessage ResponseClass="%s">' % (op, cls)
+    if text is not None:
+        s += '<m:MessageText>%s</m:MessageText>' % escape(text)
+    s += '<m:ResponseCode>%s</m:ResponseCode>' % code
+    if cls == 'Error':
+        s += '<m:DescriptiveLinkKey>0</m:DescriptiveLinkKey>'
+    s += body
+    s += '</m:%sResponseMessage>' % op
+
+    return s
+
+def response (op, msgs):
+    return ENVELOPE % ('<m:%sResponse><m:ResponseMessages>%s'
+                       '</m:ResponseMessages></m:%sResponse>' %
+                       (op, ''.join(msgs), op))
+
+class MockFault(Exception):
+    """
+    Raised while handling a request to send back a SOAP fault
+    """
+
+    def __init__ (self, code, text, status=500, back_off_ms=None):
+        Exception.__init__(self, text)
+        self.code = code
+        self.text = text
+        self.status = status
+        self.back_off_ms = back_off_ms
+
+    def to_xml (self):
+        extra = ''
+        if self.back_off_ms is not None:
+            extra = ('<t:MessageXml xmlns:t="%s"><t:Value Name="BackOffMilliseconds">'
+                     '%d</t:Value></t:MessageXml>' % (T_NAMESPACE,
+                                                       self.back_off_ms))
+        fc = 'ErrorServerBusy' if self.code == 'ErrorServerBusy' else 'Client'
+        return FAULT % (fc, escape(self.text), self.code, escape(self.text),
+                        extra)
+
+class MockFolder(object):
+    def __init__ (self, fid, name, folder_class, parent=None, wkfn=None,
+                  tag='Folder'):
+        self.fid = fid
+        self.name = name
+        self.folder_class = folder_class
+        self.parent = parent
+        self.wkfn = wkfn
+        self.tag = tag
+        self.ck = 1
+        self.children = []
+
+        if parent is not None:
+            parent.children.append(self)
+
+    def change_key (self):
+        return 'fck-%d' % self.ck
+
+    def to_xml (self, total):
+        s = '<t:%s>' % self.tag
+        s += '<t:FolderId Id=%s ChangeKey="%s"/>' % (quoteattr(self.fid),
+                                                     self.change_key())
+        if self.parent is not None:
+            s += '<t:ParentFolderId Id=%s ChangeKey="%s"/>' % (
+                quoteattr(self.parent.fid), self.parent.change_key())
+        if self.folder_class is not None:
+            s += '<t:FolderClass>%s</t:FolderClass>' % self.folder_class
+        s += '<t:DisplayName>%s</t:DisplayName>' % escape(self.name)
+        s += '<t:TotalCount>%d</t:TotalCount>' % total
+        s += '<t:ChildFolderCount>%d</t:ChildFolderCount>' % len(self.children)
+        s += '<t:UnreadCount>0</t:UnreadCount>'
+        s += '</t:%s>' % self.tag
+
+        return s
+
+class MockItem(object):
+    """
+    A contact in the mailbox. Synthetic contacts only carry their index and
+    their xml is generated when needed; the fields of contacts created or
+    modified by the client are kept as a list of xml strings, one per top
+    level field.
+    """
+
+    __slots__ = ('iid', 'ck', 'fid', 'index', 'fields', 'lmt', 'created')
+
+    def __init__ (self, iid, fid, index=None, fields=None):
+        self.iid = iid
+        self.ck = 1
+        self.fid = fid
+        self.index = index
+        self.fields = fields
+        self.lmt = BASE_TIME if index is not None else utcnow()
+        self.created = self.lmt
+
+    def change_key (self):
+        return 'ck-%d' % self.ck
+
+    def id_xml (self):
+        return '<t:ItemId Id=%s ChangeKey="%s"/>' % (quoteattr(self.iid),
+                                                      self.change_key())
+
+    def lmt_xml (self):
+        return ('<t:ExtendedProperty><t:ExtendedFieldURI PropertyTag="0x%x" '
+                'PropertyType="SystemTime"/><t:Value>%s</t:Value>'
+                '</t:ExtendedProperty>' % (PR_LAST_MODIFICATION_TIME, self.lmt))
+
+    def get_fields (self):
+        if self.fields is None:
+            return synthetic_fields(self.index)
+        return self.fields
+
+    def display_name (self):
+        if self.fields is None:
+            return synthetic_name(self.index)
+
+        for f in self.fields:
+            if f.startswith('<t:DisplayName'):
+                return parse_field(f).text or ''
+        return ''
+
+    def to_xml (self, shape='AllProperties'):
+        s = '<t:Contact>' + self.id_xml()
+
+        if shape == 'IdOnly':
+            return s + '</t:Contact>'
+
+        if shape == 'Find':
+            s += '<t:DisplayName>%s</t:DisplayName>' % escape(self.display_name())
+            return s + self.lmt_xml() + '</t:Contact>'
+
+        s += '<t:ParentFolderId Id=%s ChangeKey="fck-1"/>' % quoteattr(self.fid)
+        s += '<t:ItemClass>IPM.Contact</t:ItemClass>'
+        s += '<t:DateTimeCreated>%s</t:DateTimeCreated>' % self.created
+        s += self.lmt_xml()
+        s += ''.join(self.get_fields())
+        s += '</t:Contact>'
+
+        return s
+
+def synthetic_name (i):
+    return 'First%d Last%d' % (i, i)
+
+def synthetic_fields (i):
+    """
+    The fields of the i-th generated contact. The values are a function of i
+    alone so that runs are reproducible.
+    """
+
+    first = 'First%d' % i
+    last = 'Last%d' % i
+    gender = (i % 3)
+
+    return [
+        '<t:ExtendedProperty><t:ExtendedFieldURI PropertyTag="0x%x" '
+        'PropertyType="Short"/><t:Value>%d</t:Value></t:ExtendedProperty>' %
+        (PR_GENDER, gender),
+        '<t:Body BodyType="Text">Notes for contact number %d &amp; a bit of '
+        'text to pad things out to a realistic size.</t:Body>' % i,
+        '<t:FileAs>%s, %s</t:FileAs>' % (last, first),
+        '<t:DisplayName>%s %s</t:DisplayName>' % (first, last),
+        '<t:GivenName>%s</t:GivenName>' % first,
+        '<t:Initials>%s.</t:Initials>' % first[0],
+        '<t:CompleteName><t:Title>Dr.</t:Title><t:FirstName>%s</t:FirstName>'
+        '<t:LastName>%s</t:LastName><t:FullName>%s %s</t:FullName>'
+        '</t:CompleteName>' % (first, last, first, last),
+        '<t:CompanyName>Company %d</t:CompanyName>' % (i % 97),
+        '<t:EmailAddresses><t:Entry Key="EmailAddress1">%s.%s@example.com'
+        '</t:Entry><t:Entry Key="EmailAddress2">c%d@example.org</t:Entry>'
+        '</t:EmailAddresses>' % (first.lower(), last.lower(), i),
+        '<t:ImAddresses><t:Entry Key="ImAddress1">im%d@example.com</t:Entry>'
+        '</t:ImAddresses>' % i,
+        '<t:JobTitle>Engineer</t:JobTitle>',
+        '<t:PhoneNumbers><t:Entry Key="MobilePhone">+1 555 %07d</t:Entry>'
+        '<t:Entry Key="BusinessPhone">+1 555 %07d</t:Entry></t:PhoneNumbers>' %
+        (i, i + 1),
+        '<t:Surname>%s</t:Surname>' % last,
+        ]
+
+def field_key (elem):
+    """
+    The identity of a top level contact field, used to figure out which
+    stored field an update replaces.
+    """
+
+    if elem.tag == QName_T('ExtendedProperty'):
+        uri = elem.find(QName_T('ExtendedFieldURI'))
+        if uri is not None:
+            at = dict(uri.attrib)
+            if 'PropertyTag' in at:
+                at['PropertyTag'] = prop_tag(at['PropertyTag'])
+            at.pop('PropertyType', None)
+            return (elem.tag, tuple(sorted(at.items())))
+
+    return (elem.tag, None)
+
+def field_xml (elem):
+    """
+    Serialize a top level contact field. The namespace declaration is left
+    out as the field always goes inside a response that declares t:
+    """
+
+    elem.tail = None
+    return ET.tostring(elem, encoding='utf-8').replace(
+        ' xmlns:t="%s"' % T_NAMESPACE, '', 1)
+
+def parse_field (xml):
+    return ET.fromstring('<f xmlns:t="%s">%s</f>' % (T_NAMESPACE, xml))[0]
+
+class MockMailbox(object):
+    """
+    The folders and contacts of a single mailbox. The contacts folder starts
+    out with 'size' generated contacts. All access is from the IOLoop thread
+    so there is no locking.
+    """
+
+    def __init__ (self, size=1000):
+        self.root = MockFolder('mock-root', 'Top of Information Store', None,
+                               wkfn='msgfolderroot')
+        self.contacts = MockFolder('mock-contacts', 'Contacts', 'IPF.Contact',
+                                   parent=self.root, wkfn='contacts',
+                                   tag='ContactsFolder')
+        self.folders = OrderedDict([(f.fid, f) for f in (self.root,
+                                                         self.contacts)])
+
+        self.items = OrderedDict()
+        self.order = {self.root.fid : [], self.contacts.fid : []}
+        self.next_id = 0
+
+        ## Change log for SyncFolderItems: list of (kind, iid). Synthetic
+        ## contacts are reported as Creates to a sync from scratch.
+        self.changes = []
+
+        for i in range(size):
+            self.add_item(self.contacts.fid, index=i)
+
+    def new_itemid (self):
+        self.next_id += 1
+        return 'mock-item-%08d' % self.next_id
+
+    def add_item (self, fid, index=None, fields=None):
+        item = MockItem(self.new_itemid(), fid, index=index, fields=fields)
+        self.items[item.iid] = item
+        self.order[fid].append(item.iid)
+        self.changes.append(('Create', item.iid))
+
+        return item
+
+    def delete_item (self, iid):
+        item = self.items.pop(iid)
+        self.order[item.fid].remove(iid)
+        self.changes.append(('Delete', iid))
+
+    def update_item (self, item, new_fields):
+        fields = [parse_field(f) for f in item.get_fields()]
+        for new in new_fields:
+            key = field_key(new)
+            old = [f for f in fields if field_key(f) == key]
+            if len(old) == 0:
+                fields.append(new)
+            elif len(new) > 0 and new[0].tag == QName_T('Entry'):
+                ## Indexed fields - merge the entries by their Key
+                for entry in new:
+                    for oe in old[0].findall(QName_T('Entry')):
+                        if oe.attrib.get('Key') == entry.attrib.get('Key'):
+                            old[0].remove(oe)
+                    old[0].append(entry)
+            else:
+                fields[fields.index(old[0])] = new
+
+        item.fields = [field_xml(f) for f in fields]
+        item.ck += 1
+        item.lmt = utcnow()
+        self.changes.append(('Update', item.iid))
+
+    def folder_by_elem (self, elem):
+        """
+        elem is a t:FolderId or t:DistinguishedFolderId element
+        """
+
+        fid = elem.attrib.get('Id', '').strip()
+        if elem.tag == QName_T('DistinguishedFolderId'):
+            for f in self.folders.itervalues():
+                if f.wkfn == fid:
+                    return f
+            return None
+
+        return self.folders.get(fid)
+
+    def total (self, folder):
+        return len(self.order[folder.fid])
+
+class TokenBucket(object):
+    def __init__ (self, rate, burst):
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.tokens = self.burst
+        self.last = time.time()
+
+    def take (self):
+        """
+        Returns 0 if the request can go through, else the number of milli
+        seconds the client should back off.
+        """
+
+        now = time.time()
+        self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+        self.last = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+
+        return int(1000 * (1 - self.tokens) / self.rate) + 1
+
+class MockEWSHandler(web.RequestHandler):
+    def initialize (self, server):
+        self.server = server
+
+    @gen.coroutine
+    def post (self):
+        server = self.server
+        server.stats['requests'] += 1
+
+        user = self.get_user()
+        if user is None:
+            self.set_status(401)
+            self.set_header('WWW-Authenticate', 'Basic realm="mock"')
+            return
+
+        server.in_flight += 1
+        server.stats['max_in_flight'] = max(server.stats['max_in_flight'],
+                                            server.in_flight)
+        try:
+            yield self.answer(server, user)
+        finally:
+            server.in_flight -= 1
+
+    @gen.coroutine
+    def answer (self, server, user):
+        if server.latency > 0:
+            yield gen.sleep(server.latency)
+
+        status, body = 200, None
+        try:
+            server.check_throttle(user)
+            body, nitems = server.dispatch(self.request.body)
+            if nitems > 0 and server.item_latency > 0:
+                yield gen.sleep(nitems * server.item_latency)
+            server.stats['items'] += nitems
+        except MockFault as e:
+            server.stats['faults'] += 1
+            if e.code == 'HTTP':
+                self.set_status(e.status)
+                if e.back_off_ms is not None:
+                    self.set_header('Retry-After',
+                                    str(max(1, e.back_off_ms // 1000)))
+                return
+            status, body = e.status, e.to_xml()
+
+        self.set_status(status)
+        self.set_header('Content-Type', 'text/xml; charset=utf-8')
+        self.write(body)
+
+    def get_user (self):
+        auth = self.request.headers.get('Authorization', '')
+        if not auth.startswith('Basic '):
+            return None
+
+        try:
+            return base64.b64decode(auth[6:]).split(':', 1)[0]
+        except (TypeError, ValueError):
+            return None
+
+    def log_exception (self, typ, value, tb):
+        logging.error('MockEWSHandler: %s', value, exc_info=(typ, value, tb))
+
+class MockEWSServer(object):
+    """
+    The HTTP end of the mock. Keyword arguments:
+
+    - size         : number of contacts to start the mailbox with
+    - latency      : seconds to wait before answering any request
+    - item_latency : additional seconds per item returned or touched
+    - throttle_rate, throttle_burst : if throttle_rate is not None, each user
+      can make throttle_rate requests a second on average with bursts of up
+      to throttle_burst; requests over the budget are refused
+    - throttle_style : 'fault' to refuse with a ErrorServerBusy SOAP fault
+      carrying a BackOffMilliseconds hint, like Exchange Online does; or
+      'http' for a plain HTTP 503 with a Retry-After header
+    - max_find_page : cap on the MaxEntriesReturned of a FindItem
+    - gzip         : compress responses when the client asks for it
+
+    stats counts the requests, faults and items served, and records the
+    largest number of requests that were being answered at the same time.
+    """
+
+    def __init__ (self, size=1000, latency=0, item_latency=0,
+                  throttle_rate=None, throttle_burst=10,
+                  throttle_style='fault', max_find_page=1000, gzip=True):
+        self.mailbox = MockMailbox(size)
+        self.latency = latency
+        self.item_latency = item_latency
+        self.throttle_rate = throttle_rate
+        self.throttle_burst = throttle_burst
+        self.throttle_style = throttle_style
+        self.max_find_page = max_find_page
+        self.gzip = gzip
+
+        self.buckets = {}
+        self.in_flight = 0
+        self.stats = {'requests' : 0, 'faults' : 0, 'items' : 0,
+                      'max_in_flight' : 0}
+
+        self.handlers = {
+            QName_M('GetFolder')       : self.get_folder,
+            QName_M('FindFolder')      : self.find_folder,
+            QName_M('FindItem')        : self.find_item,
+            QName_M('GetItem')         : self.get_item,
+            QName_M('CreateItem')      : self.create_item,
+            QName_M('UpdateItem')      : self.update_item,
+            QName_M('DeleteItem')      : self.delete_item,
+            QName_M('SyncFolderItems') : self.sync_folder_items,
+            }
+
+        self.loop = None
+        self.http = None
+        self.thread = None
+        self.url = None
+
+    def application (self):
+        return web.Application([(EWS_PATH, MockEWSHandler,
+                                 dict(server=self))],
+                               compress_response=self.gzip)
+
+    def listen (self, port=0, address='127.0.0.1'):
+        """
+        Start serving on the current IOLoop, and return the EWS url. With
+        port 0 a free port is picked.
+        """
+
+        sockets = netutil.bind_sockets(port, address)
+        self.http = httpserver.HTTPServer(self.application(),
+                                          decompress_request=True)
+        self.http.add_sockets(sockets)
+        port = sockets[0].getsockname()[1]
+        self.url = 'http://%s:%d%s' % (address, port, EWS_PATH)
+
+        return self.url
+
+    def start (self, port=0, address='127.0.0.1'):
+        """
+        Run the server on its own IOLoop in a background thread and return
+        the EWS url.
+        """
+
+        ready = threading.Event()
+
+        def run ():
+            self.loop = ioloop.IOLoop()
+            self.loop.make_current()
+            self.listen(port, address)
+            ready.set()
+            self.loop.start()
+            self.loop.close(all_fds=True)
+
+        self.thread = threading.Thread(target=run, name='mock-ews')
+        self.thread.daemon = True
+        self.thread.start()
+        ready.wait()
+
+        return self.url
+
+    def stop (self):
+        if self.loop is None:
+            return
+
+        def _stop ():
+            self.http.stop()
+            self.loop.stop()
+
+        self.loop.add_callback(_stop)
+        self.thread.join()
+        self.loop = None
+
+    def check_throttle (self, user):
+        if self.throttle_rate is None:
+            return
+
+        bucket = self.buckets.get(user)
+        if bucket is None:
+            bucket = TokenBucket(self.throttle_rate, self.throttle_burst)
+            self.buckets[user] = bucket
+
+        back_off = bucket.take()
+        if back_off == 0:
+            return
+
+        if self.throttle_style == 'http':
+            raise MockFault('HTTP', 'Service Unavailable', status=503,
+                            back_off_ms=back_off)
+
+        raise MockFault('ErrorServerBusy', 'The server cannot service this '
+                        'request right now. Try again later.',
+                        back_off_ms=back_off)
+
+    def dispatch (self, body):
+        """
+        Handle a SOAP request and return a tuple of the response xml and the
+        number of items in it.
+        """
+
+        try:
+            root = ET.fromstring(body)
+        except ET.ParseError as e:
+            raise MockFault('ErrorSchemaValidation', 'Bad request xml: %s' % e)
+
+        sbody = root.find('{%s}Body' % S_NAMESPACE)
+        if sbody is None or len(sbody) == 0:
+            raise MockFault('ErrorInvalidRequest', 'No SOAP Body in request')
+
+        op = sbody[0]
+        handler = self.handlers.get(op.tag)
+        if handler is None:
+            raise MockFault('ErrorInvalidRequest',
+                            'Operation not supported by mock: %s' % op.tag)
+
+        return handler(op)
+
+    ##
+    ## The operations
+    ##
+
+    def get_folder (self, op):
+        msgs = []
+        for elem in op.find(QName_M('FolderIds')):
+            f = self.mailbox.folder_by_elem(elem)
+            if f is None:
+                msgs.append(response_message('GetFolder', '<m:Folders/>',
+                                             'ErrorFolderNotFound',
+                                             'The specified folder could not '
+                                             'be found in the store.'))
+            else:
+                fxml = f.to_xml(self.mailbox.total(f))
+                msgs.append(response_message('GetFolder', '<m:Folders>%s'
+                                             '</m:Folders>' % fxml))
+
+        return response('GetFolder', msgs), 0
+
+    def find_folder (self, op):
+        deep = op.attrib.get('Traversal') == 'Deep'
+
+        def walk (f):
+            ret = []
+            for c in f.children:
+                ret.append(c)
+                if deep:
+                    ret.extend(walk(c))
+            return ret
+
+        msgs = []
+        for elem in op.find(QName_M('ParentFolderIds')):
+            f = self.mailbox.folder_by_elem(elem)
+            if f is None:
+                msgs.append(response_message('FindFolder', '',
+                                             'ErrorFolderNotFound',
+                                             'The specified folder could not '
+                                             'be found in the store.'))
+                continue
+
+            subs = walk(f)
+            fxml = ''.join([c.to_xml(self.mailbox.total(c)) for c in subs])
+            msgs.append(response_message('FindFolder',
+                                         '<m:RootFolder TotalItemsInView="%d" '
+                                         'IncludesLastItemInRange="true">'
+                                         '<t:Folders>%s</t:Folders>'
+                                         '</m:RootFolder>' % (len(subs), fxml)))
+
+        return response('FindFolder', msgs), 0
+
+    def find_item (self, op):
+        shape = op.find(QName_M('ItemShape')).find(QName_T('BaseShape')).text
+        shape = 'IdOnly' if shape == 'IdOnly' else 'Find'
+
+        view = op.find(QName_M('IndexedPageItemView'))
+        if view is not None:
+            offset = int(view.attrib.get('Offset', 0))
+            count = int(view.attrib.get('MaxEntriesReturned',
+                                        self.max_find_page))
+        else:
+            offset, count = 0, self.max_find_page
+        count = min(count, self.max_find_page)
+
+        lmt = None
+        restr = op.find(QName_M('Restriction'))
+        if restr is not None:
+            const = restr.find('.//' + QName_T('Constant'))
+            if const is not None:
+                lmt = const.attrib.get('Value')
+
+        msgs = []
+        nitems = 0
+        for elem in op.find(QName_M('ParentFolderIds')):
+            f = self.mailbox.folder_by_elem(elem)
+            if f is None:
+                msgs.append(response_message('FindItem', '',
+                                             'ErrorFolderNotFound',
+                                             'The specified folder could not '
+                                             'be found in the store.'))
+                continue
+
+            iids = self.mailbox.order[f.fid]
+            if lmt is not None:
+                iids = [iid for iid in iids if self.mailbox.items[iid].lmt > lmt]
+
+            page = iids[offset:offset+count]
+            last = offset + len(page) >= len(iids)
+            xml = ''.join([self.mailbox.items[iid].to_xml(shape)
+                           for iid in page])
+            nitems += len(page)
+            msgs.append(response_message('FindItem',
+                                         '<m:RootFolder IndexedPagingOffset="%d" '
+                                         'TotalItemsInView="%d" '
+                                         'IncludesLastItemInRange="%s">'
+                                         '<t:Items>%s</t:Items></m:RootFolder>' %
+                                         (offset + len(page), len(iids),
+                                          'true' if last else 'false', xml)))
+
+        return response('FindItem', msgs), nitems
+
+    def get_item (self, op):
+        shape = op.find(QName_M('ItemShape')).find(QName_T('BaseShape')).text
+        if shape not in ('IdOnly', 'AllProperties'):
+            shape = 'AllProperties'
+
+        msgs = []
+        nitems = 0
+        for elem in op.find(QName_M('ItemIds')):
+            item = self.mailbox.items.get(elem.attrib.get('Id', '').strip())
+            if item is None:
+                msgs.append(response_message('GetItem', '<m:Items/>',
+                                             'ErrorItemNotFound',
+                                             'The specified object was not '
+                                             'found in the store.'))
+            else:
+                nitems += 1
+                msgs.append(response_message('GetItem', '<m:Items>%s</m:Items>' %
+                                             item.to_xml(shape)))
+
+        return response('GetItem', msgs), nitems
+
+    def create_item (self, op):
+        fid = op.find(QName_M('SavedItemFolderId'))
+        f = self.mailbox.folder_by_elem(fid[0]) if fid is not None else None
+        if f is None:
+            f = self.mailbox.contacts
+
+        msgs = []
+        for con in op.find(QName_M('Items')):
+            if con.tag != QName_T('Contact'):
+                msgs.append(response_message('CreateItem', '<m:Items/>',
+                                             'ErrorInvalidRequest',
+                                             'Only contacts are supported.'))
+                continue
+
+            fields = [field_xml(c) for c in con
+                      if c.tag not in (QName_T('ItemId'),
+                                       QName_T('ParentFolderId'))]
+            item = self.mailbox.add_item(f.fid, fields=fields)
+            msgs.append(response_message('CreateItem', '<m:Items>%s</m:Items>' %
+                                         item.to_xml('IdOnly')))
+
+        return response('CreateItem', msgs), len(msgs)
+
+    def update_item (self, op):
+        overwrite = op.attrib.get('ConflictResolution') != 'NeverOverwrite'
+
+        msgs = []
+        for change in op.find(QName_M('ItemChanges')):
+            iid = change.find(QName_T('ItemId'))
+            item = self.mailbox.items.get(iid.attrib.get('Id', '').strip())
+            if item is None:
+                msgs.append(response_message('UpdateItem', '<m:Items/>',
+                                             'ErrorItemNotFound',
+                                             'The specified object was not '
+                                             'found in the store.'))
+                continue
+
+            ck = iid.attrib.get('ChangeKey')
+            if not overwrite and ck is not None and ck != item.change_key():
+                msgs.append(response_message('UpdateItem', '<m:Items/>',
+                                             'ErrorIrresolvableConflict',
+                                             'The send or update operation '
+                                             'could not be performed because '
+                                             'the change key passed in the '
+                                             'request does not match the '
+                                             'current change key for the '
+                                             'item.'))
+                continue
+
+            new_fields = []
+            for sif in change.find(QName_T('Updates')):
+                con = sif.find(QName_T('Contact'))
+                if con is not None:
+                    new_fields.extend(list(con))
+
+            self.mailbox.update_item(item, new_fields)
+            msgs.append(response_message('UpdateItem', '<m:Items>%s</m:Items>'
+                                         '<m:ConflictResults><t:Count>0</t:Count>'
+                                         '</m:ConflictResults>' %
+                                         item.to_xml('IdOnly')))
+
+        return response('UpdateItem', msgs), len(msgs)
+
+    def delete_item (self, op):
+        msgs = []
+        for elem in op.find(QName_M('ItemIds')):
+            iid = elem.attrib.get('Id', '').strip()
+            if iid not in self.mailbox.items:
+                msgs.append(response_message('DeleteItem', '',
+                                             'ErrorItemNotFound',
+                                             'The specified object was not '
+                                             'found in the store.'))
+            else:
+                self.mailbox.delete_item(iid)
+                msgs.append(response_message('DeleteItem'))
+
+        return response('DeleteItem', msgs), len(msgs)
+
+    def sync_folder_items (self, op):
+        f = self.mailbox.folder_by_elem(op.find(QName_M('SyncFolderId'))[0])
+        if f is None:
+            return response('SyncFolderItems', [
+                response_message('SyncFolderItems', '', 'ErrorFolderNotFound',
+                                 'The specified folder could not be found in '
+                                 'the store.')]), 0
+
+        state = op.find(QName_M('SyncState'))
+        start = 0
+        if state is not None and state.text:
+            try:
+                start = int(base64.b64decode(state.text.strip()))
+            except (TypeError, ValueError):
+                return response('SyncFolderItems', [
+                    response_message('SyncFolderItems', '',
+                                     'ErrorInvalidSyncStateData',
+                                     'Synchronization state data is corrupt '
+                                     'or otherwise invalid.')]), 0
+
+        mx = op.find(QName_M('MaxChangesReturned'))
+        mx = int(mx.text) if mx is not None else 512
+
+        log = self.mailbox.changes
+        items = self.mailbox.items
+        pos = start
+        out = []
+        while pos < len(log) and len(out) < mx:
+            kind, iid = log[pos]
+            pos += 1
+
+            if kind == 'Delete':
+                out.append('<t:Delete><t:ItemId Id=%s/></t:Delete>' %
+                           quoteattr(iid))
+                continue
+
+            item = items.get(iid)
+            if item is None or item.fid != f.fid:
+                continue
+
+            out.append('<t:%s>%s</t:%s>' % (kind, item.to_xml('IdOnly'), kind))
+
+        last = 'true' if pos >= len(log) else 'false'
+        body = ('<m:SyncState>%s</m:SyncState>'
+                '<m:IncludesLastItemInRange>%s</m:IncludesLastItemInRange>'
+                '<m:Changes>%s</m:Changes>' % (base64.b64encode(str(pos)),
+                                               last, ''.join(out)))
+
+        return (response('SyncFolderItems',
+                         [response_message('SyncFolderItems', body)]),
+                len(out))
+
+def main (argv=None):
+    p = argparse.ArgumentParser(description='Mock EWS server for pyews')
+    p.add_argument('--address', default='127.0.0.1')
+    p.add_argument('--port', type=int, default=8080)
+    p.add_argument('--items', type=int, default=1000,
+                   help='Number of contacts in the mailbox')
+    p.add_argument('--latency', type=float, default=0,
+                   help='Seconds to wait before answering each request')
+    p.add_argument('--item-latency', type=float, default=0,
+                   help='Additional seconds per item in a response')
+    p.add_argument('--throttle-rate', type=float, default=None,
+                   help='Requests per second allowed per user')
+    p.add_argument('--throttle-burst', type=int, default=10)
+    p.add_argument('--throttle-style', choices=['fault', 'http'],
+                   default='fault')
+    p.add_argument('--no-gzip', action='store_true')
+    args = p.parse_args(argv)
+
+    logging.getLogger().setLevel(logging.INFO)
+
+    server = MockEWSServer(size=args.items, latency=args.latency,
+                           item_latency=args.item_latency,
+                           throttle_rate=args.throttle_rate,
+                           throttle_burst=args.throttle_burst,
+                           throttle_style=args.throttle_style,
+                           gzip=not args.no_gzip)
+    url = server.listen(args.port, args.address)
+    logging.info('Mock EWS server with %d contacts at %s', args.items, url)
+
+    try:
+        ioloop.IOLoop.current().start()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+##
+## Created : Sun Oct 18 23:58:14 IST 2026
+##
+## Copyright (C) 2026 Sriram Karra <karra.etc@gmail.com>
+##
+## This file is part of pyews
+##
+## pyews is free software: you can redistribute it and/or modify it under
+## the terms of the GNU Affero General Public License as published by the
+## Free Software Foundation, version 3 of the License
+##
+## pyews is distributed in the hope that it will be useful, but WITHOUT
+## ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+## FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero General Public
+## License for more details.
+##
+## You should have a copy of the license in the doc/ directory of pyews.  If
+## not, see <http://www.gnu.org/licenses/>.
+
+##
+## AsyncExchangeService against the mock server: concurrent paging and
+## batching, within max_concurrency.
+##
+
+import pytest
+
+from   tornado           import gen, ioloop
+from   pyews.pyews       import AsyncExchangeService, WebCredentials
+from   pyews.ews.data    import FolderClass
+
+def make_async_service (url, max_concurrency):
+    ews = AsyncExchangeService()
+    ews.credentials = WebCredentials('user@example.com', 'secret')
+    ews.Url = url
+    ews.init_soap_client()
+    ews.max_concurrency = max_concurrency
+
+    return ews
+
+def run (coro):
+    return ioloop.IOLoop().run_sync(coro)
+
+@pytest.mark.mock_server_args(size=450, latency=0.05)
+def test_paging_within_max_concurrency (mock_server):
+    ews = make_async_service(mock_server.url, 2)
+
+    @gen.coroutine
+    def find ():
+        root = yield ews.get_root_folder()
+        folders = yield ews.FindFolders(root, types=[FolderClass.Contacts])
+        items = yield ews.FindItems(folders[0])
+        raise gen.Return(items)
+
+    before = mock_server.stats['requests']
+    items = run(find)
+
+    ## Five pages of ids, and five batches of GetItems
+    assert mock_server.stats['requests'] - before >= 10
+    assert mock_server.stats['max_in_flight'] == 2
+
+    ids = [c.itemid.value for c in items]
+    assert ids == mock_server.mailbox.items.keys()
+    assert all([c.display_name.value for c in items])
+
+@pytest.mark.mock_server_args(size=8, latency=0.05)
+def test_batches_within_max_concurrency (mock_server):
+    ews = make_async_service(mock_server.url, 3)
+    ews.max_request_items = 1
+
+    ids = ['mock-item-%08d' % i for i in range(1, 9)]
+    ids[5] = 'no-such-item'
+
+    resp = run(lambda: ews.DeleteItems(ids))
+    assert len(resp.responses) == 8
+    assert resp.suc_cnt == 7
+    assert resp.errors.keys() == [5]
+    assert mock_server.stats['max_in_flight'] == 3
+    assert mock_server.mailbox.items.keys() == ['mock-item-00000006']
@@ -0,0 +1,159 @@
+##
+## Created : Sun Oct 18 21:32:05 IST 2026
+##
+## Copyright (C) 2026 Sriram Karra <karra.etc@gmail.com>
+##
+## This file is part of pyews
+##
+## pyews is free software: you can redistribute it and/or modify it under
+## the terms of the GNU Affero General Public License as published by the
+## Free Software Foundation, version 3 of the License
+##
+## pyews is distributed in the hope that it will be useful, but WITHOUT
+## ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+## FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero General Public
+## License for more details.
+##
+## You should have a copy of the license in the doc/ directory of pyews.  If
+## not, see <http://www.gnu.org/licenses/>.
+
+##
+## Splitting the bulk item operations into batches, and putting the
+## responses back together.
+##
+
+import pytest
+
+from   tornado                    import ioloop
+from   tests.conftest             import make_service, CONTACTS_FID
+from   pyews.pyews                import AsyncExchangeService, WebCredentials
+from   pyews.soap                 import SoapConnectionError
+from   pyews.ews.batching         import split_batches
+from   pyews.ews.contact          import Contact
+from   pyews.ews.errors           import EWSBatchError
+from   pyews.ews.request_response import CreateItemsRequest
+from   pyews.ews.request_response import DeleteItemsResponse
+
+def make_contacts (ews, n):
+    cs = []
+    for i in range(n):
+        c = Contact(ews)
+        c.display_name.set('Batch Contact %d' % i)
+        cs.append(c)
+
+    return cs
+
+def test_split_batches ():
+    batches = split_batches(range(10), lambda v: 100, max_items=4)
+    assert batches == [(0, [0, 1, 2, 3]), (4, [4, 5, 6, 7]), (8, [8, 9])]
+
+    batches = split_batches(range(10), lambda v: 100, max_bytes=350,
+                            overhead=50)
+    assert [offset for offset, batch in batches] == [0, 3, 6, 9]
+
+def test_item_size_does_not_serialize ():
+    c = make_contacts(None, 1)[0]
+    c.phones.add('HomePhone', '+1 555 0100')
+
+    size = CreateItemsRequest.item_size(c)
+    assert c._xml is None
+    assert size == len(c.write_to_xml())
+
+@pytest.mark.mock_server_args(size=5)
+def test_execute_batched_offsets (mock_server):
+    ews = make_service(mock_server.url)
+    ews.max_request_items = 2
+
+    ids = ['mock-item-%08d' % i for i in range(1, 6)]
+    ids[1] = 'no-such-item-1'
+    ids[4] = 'no-such-item-2'
+
+    resp = ews.DeleteItems(ids)
+    assert len(resp.responses) == 3
+    assert resp.suc_cnt == 3
+    assert resp.err_cnt == 2
+    assert sorted(resp.errors.keys()) == [1, 4]
+    assert resp.errors[4].resp_code == 'ErrorItemNotFound'
+
+@pytest.mark.mock_server_args(size=3)
+def test_single_batch_returns_its_own_response (mock_server):
+    ews = make_service(mock_server.url)
+
+    resp = ews.DeleteItems(['mock-item-%08d' % i for i in range(1, 3)])
+    assert isinstance(resp, DeleteItemsResponse)
+    assert resp.node is not None
+    assert resp.suc_cnt == 2
+
+def fail_batch_with (monkeypatch, bad):
+    """
+    Have the CreateItems request that carries the contact bad raise a
+    connection error instead of going to the server.
+    """
+
+    execute = CreateItemsRequest.execute
+
+    def failing_execute (req):
+        if bad in req.kwargs['items']:
+            raise SoapConnectionError('simulated', sent=False)
+        return execute(req)
+
+    monkeypatch.setattr(CreateItemsRequest, 'execute', failing_execute)
+
+@pytest.mark.mock_server_args(size=1)
+def test_failed_batch_keeps_the_others (mock_server, monkeypatch):
+    ews = make_service(mock_server.url)
+    ews.max_request_items = 3
+    ews.retry_policy = None
+
+    cs = make_contacts(ews, 9)
+    fail_batch_with(monkeypatch, cs[4])
+
+    resp = ews.execute_batched(CreateItemsRequest, cs, folder_id=CONTACTS_FID)
+    assert resp.has_errors()
+    assert resp.suc_cnt == 6
+    assert len(resp.failed_batches) == 1
+
+    offset, batch, err = resp.failed_batches[0]
+    assert offset == 3
+    assert batch == cs[3:6]
+    assert isinstance(err, SoapConnectionError)
+
+    assert [c.itemid.value is not None for c in cs] == [True] * 3 + \
+        [False] * 3 + [True] * 3
+    assert len(mock_server.mailbox.items) == 1 + 6
+
+    with pytest.raises(EWSBatchError) as e:
+        ews.CreateItems(CONTACTS_FID, make_contacts(ews, 3) + [cs[4]])
+    assert len(e.value.resp_obj.responses) == 1
+
+    ## A call that is not split raises the error of its request
+    with pytest.raises(SoapConnectionError):
+        ews.CreateItems(CONTACTS_FID, [cs[4]])
+
+@pytest.mark.mock_server_args(size=1)
+def test_failed_batch_keeps_the_others_async (mock_server, monkeypatch):
+    ews = AsyncExchangeService()
+    ews.credentials = WebCredentials('user@example.com', 'secret')
+    ews.Url = mock_server.url
+    ews.init_soap_client()
+    ews.max_request_items = 3
+    ews.retry_policy = None
+
+    cs = make_contacts(ews, 9)
+    execute = CreateItemsRequest.execute_async
+
+    def failing_execute (req):
+        if cs[0] in req.kwargs['items']:
+            raise SoapConnectionError('simulated', sent=False)
+        return execute(req)
+
+    monkeypatch.setattr(CreateItemsRequest, 'execute_async', failing_execute)
+
+    def run ():
+        return ews.execute_batched(CreateItemsRequest, cs,
+                                   folder_id=CONTACTS_FID)
+
+    resp = ioloop.IOLoop().run_sync(run)
+    assert [offset for offset, batch, err in resp.failed_batches] == [0]
+    assert resp.suc_cnt == 6
+    assert all([c.itemid.value is not None for c in cs[3:]])
@@ -0,0 +1,136 @@
+##
+## Created : Mon Oct 19 01:37:50 IST 2026
+##
+## Copyright (C) 2026 Sriram Karra <karra.etc@gmail.com>
+##
+## This file is part of pyews
+##
+## pyews is free software: you can redistribute it and/or modify it under
+## the terms of the GNU Affero General Public License as published by the
+## Free Software Foundation, version 3 of the License
+##
+## pyews is distributed in the hope that it will be useful, but WITHOUT
+## ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+## FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero General Public
+## License for more details.
+##
+## You should have a copy of the license in the doc/ directory of pyews.  If
+## not, see <http://www.gnu.org/licenses/>.
+
+##
+## Building contacts from the elements of a response, right away or, for a
+## LazyContact, as the fields are used.
+##
+
+from   pyews             import xmlbackend
+from   pyews.soap        import T_NAMESPACE, QName_T
+from   pyews.ews.item    import BASE_RESP_HANDLERS
+from   pyews.ews.contact import Contact, LazyContact, Notes
+from   pyews.ews.contact import CONTACT_RESP_HANDLERS
+
+CONTACT_XML = '''
+<t:Contact xmlns:t="%s">
+  <t:ItemId Id="item-1" ChangeKey="ck-1"/>
+  <t:ParentFolderId Id="folder-1" ChangeKey="fck-1"/>
+  <t:ItemClass>IPM.Contact</t:ItemClass>
+  <t:DateTimeCreated>2026-01-02T03:04:05Z</t:DateTimeCreated>
+  <t:LastModifiedTime>2026-02-03T04:05:06Z</t:LastModifiedTime>
+  <t:Unheard>Nobody knows this one</t:Unheard>
+  <t:FileAs>Lovelace, Ada</t:FileAs>
+  <t:DisplayName>Ada Lovelace</t:DisplayName>
+  <t:SpouseName>William King</t:SpouseName>
+  <t:CompanyName>Analytical Engines</t:CompanyName>
+  <t:JobTitle>Programmer</t:JobTitle>
+  <t:Body BodyType="Text">Notes on the engine</t:Body>
+  <t:EmailAddresses>
+    <t:Entry Key="EmailAddress1">ada@example.com</t:Entry>
+  </t:EmailAddresses>
+  <t:PhoneNumbers>
+    <t:Entry Key="HomePhone">+44 20 0000 0000</t:Entry>
+  </t:PhoneNumbers>
+  <t:GivenName>Ada</t:GivenName>
+  <t:Surname>Lovelace</t:Surname>
+</t:Contact>
+''' % T_NAMESPACE
+
+def make_contact (cls=Contact):
+    return cls(None, resp_node=xmlbackend.fromstring(CONTACT_XML))
+
+def test_handlers_are_keyed_on_qualified_tags ():
+    for tag in BASE_RESP_HANDLERS.keys() + CONTACT_RESP_HANDLERS.keys():
+        assert tag.startswith('{%s}' % T_NAMESPACE)
+        assert tag is QName_T(tag.split('}')[1])
+
+def test_fields_from_response ():
+    c = make_contact()
+
+    assert c.itemid.value == 'item-1'
+    assert c.change_key.value == 'ck-1'
+    assert c.parent_fid.value == 'folder-1'
+    assert c.item_class.value == 'IPM.Contact'
+    assert c.created_time.value == '2026-01-02T03:04:05Z'
+    assert c.file_as.value == 'Lovelace, Ada'
+    assert c.display_name.value == 'Ada Lovelace'
+    assert c.company_name.value == 'Analytical Engines'
+    assert c.job_title.value == 'Programmer'
+    assert c.notes.value == 'Notes on the engine'
+    assert c.complete_name.given_name.value == 'Ada'
+    assert c.complete_name.surname.value == 'Lovelace'
+    assert 'ada@example.com' in c.emails.write_to_xml()
+    assert '+44 20 0000 0000' in c.phones.write_to_xml()
+
+def test_spouse_name_from_response ():
+    ## Used to raise an AttributeError
+    assert make_contact().spouse_name.value == 'William King'
+
+def test_last_modified_time_from_response ():
+    ## Used to pass the text where an element was expected
+    c = make_contact()
+
+    assert c.last_modified_time.value == '2026-02-03T04:05:06Z'
+    assert c.last_modified_time.write_to_xml() == ''
+
+def test_lazy_contact_decodes_fields_on_first_use (monkeypatch):
+    decoded = []
+    decode_field = LazyContact._decode_field
+    def counting_decode_field (self, name, *spec):
+        decoded.append(name)
+        return decode_field(self, name, *spec)
+    monkeypatch.setattr(LazyContact, '_decode_field', counting_decode_field)
+
+    ## The common fields are there from the start
+    c = make_contact(LazyContact)
+    assert c.itemid.value == 'item-1'
+    assert c.change_key.value == 'ck-1'
+    assert c.parent_fid.value == 'folder-1'
+    assert decoded == []
+    for name in ['display_name', 'spouse_name', 'emails',
+                 'last_modified_time']:
+        assert name not in c.__dict__
+
+    ## Every other field is decoded once, when it is first used
+    assert c.spouse_name.value == 'William King'
+    assert c.spouse_name.value == 'William King'
+    assert decoded == ['spouse_name']
+    assert 'display_name' not in c.__dict__
+    assert 'emails' not in c.__dict__
+
+    assert c.last_modified_time.value == '2026-02-03T04:05:06Z'
+    assert decoded == ['spouse_name']
+
+def test_lazy_contact_is_a_contact ():
+    lazy, eager = make_contact(LazyContact), make_contact()
+
+    assert isinstance(lazy, Contact)
+    assert lazy.write_to_xml() == eager.write_to_xml()
+    assert str(lazy) == str(eager)
+
+def test_lazy_contact_keeps_fields_set_before_first_use ():
+    c = make_contact(LazyContact)
+    c.notes = Notes()
+    c.notes.value = 'New notes'
+
+    xml = c.write_to_xml()
+    assert 'New notes' in xml
+    assert 'Notes on the engine' not in xml
+    assert 'Ada Lovelace' in xml
@@ -0,0 +1,104 @@
+##
+## Created : Sun Oct 18 21:16:40 IST 2026
+##
+## Copyright (C) 2026 Sriram Karra <karra.etc@gmail.com>
+##
+## This file is part of pyews
+##
+## pyews is free software: you can redistribute it and/or modify it under
+## the terms of the GNU Affero General Public License as published by the
+## Free Software Foundation, version 3 of the License
+##
+## pyews is distributed in the hope that it will be useful, but WITHOUT
+## ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+## FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero General Public
+## License for more details.
+##
+## You should have a copy of the license in the doc/ directory of pyews.  If
+## not, see <http://www.gnu.org/licenses/>.
+
+##
+## The xml cached by the fields of an item, and the links from each field to
+## the fields that contain it. Items themselves keep no xml.
+##
+
+from   pyews.ews.contact import Contact, JobTitle
+
+def make_contact ():
+    c = Contact(None)
+    c.display_name.set('Ada Lovelace')
+    c.emails.add('EmailAddress1', 'ada@example.com')
+    c.phones.add('HomePhone', '+44 20 0000 0000')
+
+    return c
+
+def test_empty_fields_are_not_cached ():
+    c = make_contact()
+    c.write_to_xml()
+
+    assert c.spouse_name.write_to_xml() == ''
+    assert c.spouse_name._xml is None
+    assert c.spouse_name._attrib is None
+    assert c.spouse_name._children is None
+    assert c.display_name._xml is not None
+
+def test_replaced_field_is_written_out ():
+    c = make_contact()
+    c.write_to_xml()
+
+    old = c.job_title
+    c.job_title = JobTitle('Analyst')
+    assert 'Analyst' in c.write_to_xml()
+
+    ## The contact keeps no xml of its own, and is not linked to its fields
+    assert c._xml is None
+    assert c not in c.job_title._parents
+
+    ## A change to the field that was replaced does not show
+    old.value = 'Engineer'
+    assert 'Engineer' not in c.write_to_xml()
+
+def test_removed_child_is_unlinked ():
+    c = make_contact()
+    c.emails.add('EmailAddress2', 'countess@example.com')
+    c.write_to_xml()
+
+    email = c.emails.entries[0]
+    c.emails.children.remove(email)
+    assert c.emails not in email._parents
+    assert 'ada@example.com' not in c.write_to_xml()
+
+    email.value = 'lovelace@example.com'
+    assert c.emails._xml is not None
+    assert 'lovelace@example.com' not in c.write_to_xml()
+
+def test_value_change_invalidates_cache ():
+    c = make_contact()
+    xml = c.write_to_xml()
+    assert c.display_name._xml is not None
+
+    c.display_name.set('Augusta Ada King')
+    assert c.display_name._xml is None
+
+    new = c.write_to_xml()
+    assert 'Augusta Ada King' in new
+    assert 'Ada Lovelace' not in new
+    assert new != xml
+
+    ## A change deep down, to an entry of a list field, reaches the list
+    c.emails.entries[0].value = 'countess@example.com'
+    assert c.emails._xml is None
+    assert 'countess@example.com' in c.write_to_xml()
+
+def test_xml_kept_by_fields ():
+    c = make_contact()
+    xml = c.write_to_xml()
+
+    assert c.display_name._xml is not None
+    assert c.emails._xml is not None
+    assert c.write_to_xml() == xml
+
+    ## Writing out again reuses the xml of the fields
+    kept = c.display_name._xml
+    c.write_to_xml()
+    assert c.display_name._xml is kept
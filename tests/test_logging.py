@@ -0,0 +1,92 @@
+##
+## Created : Mon Oct 19 00:58:22 IST 2026
+##
+## Copyright (C) 2026 Sriram Karra <karra.etc@gmail.com>
+##
+## This file is part of pyews
+##
+## pyews is free software: you can redistribute it and/or modify it under
+## the terms of the GNU Affero General Public License as published by the
+## Free Software Foundation, version 3 of the License
+##
+## pyews is distributed in the hope that it will be useful, but WITHOUT
+## ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+## FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero General Public
+## License for more details.
+##
+## You should have a copy of the license in the doc/ directory of pyews.  If
+## not, see <http://www.gnu.org/licenses/>.
+
+##
+## Request and response payloads are formatted for the log only when the
+## log would take them.
+##
+
+import logging
+import pytest
+
+from   tests.conftest             import make_service
+from   pyews                      import utils
+from   pyews.pyews                import ExchangeService
+from   pyews.ews.request_response import GetItemsRequest, FindItemsRequest
+
+@pytest.fixture
+def pretty (monkeypatch):
+    """
+    Counts the calls to utils.pretty_xml
+    """
+
+    calls = []
+    pretty_xml = utils.pretty_xml
+    def counting_pretty_xml (x):
+        calls.append(x)
+        return pretty_xml(x)
+    monkeypatch.setattr(utils, 'pretty_xml', counting_pretty_xml)
+
+    return calls
+
+def test_lazy_xml_is_formatted_only_when_logged (caplog, pretty):
+    x = utils.LazyPrettyXml('<a><b>Caf\xc3\xa9</b></a>')
+
+    caplog.set_level(logging.INFO)
+    assert not utils.debug_enabled()
+    logging.debug('Payload: %s', x)
+    assert pretty == []
+    assert caplog.records == []
+
+    caplog.set_level(logging.DEBUG)
+    assert utils.debug_enabled()
+    logging.debug('Payload: %s', x)
+    assert set(pretty) == set([x.x])
+    assert '<b>Caf' in caplog.text
+
+@pytest.mark.parametrize('flag, req_class, level, logged', [
+    (None,  GetItemsRequest,  logging.DEBUG, True),
+    (None,  FindItemsRequest, logging.DEBUG, False),
+    (True,  FindItemsRequest, logging.DEBUG, True),
+    (False, GetItemsRequest,  logging.DEBUG, False),
+    (True,  GetItemsRequest,  logging.INFO,  False),
+    (None,  GetItemsRequest,  logging.INFO,  False),
+])
+def test_log_payloads (caplog, flag, req_class, level, logged):
+    ews = ExchangeService()
+    ews.log_payloads = flag
+    caplog.set_level(level)
+
+    assert req_class(ews).log_payloads() == logged
+
+@pytest.mark.mock_server_args(size=3)
+def test_payloads_cost_nothing_unless_logged (mock_server, caplog, pretty):
+    ews = make_service(mock_server.url)
+    ews.log_payloads = True
+    ids = ['mock-item-%08d' % i for i in range(1, 4)]
+
+    caplog.set_level(logging.INFO)
+    assert len(ews.GetItems(ids)) == 3
+    assert pretty == []
+
+    ## The request and the response. Each log handler formats them again.
+    caplog.set_level(logging.DEBUG)
+    assert len(ews.GetItems(ids)) == 3
+    assert len(set(pretty)) == 2
+    assert 'mock-item-00000003' in caplog.text
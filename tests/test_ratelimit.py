@@ -0,0 +1,113 @@
+##
+## Created : Mon Oct 19 00:12:37 IST 2026
+##
+## Copyright (C) 2026 Sriram Karra <karra.etc@gmail.com>
+##
+## This file is part of pyews
+##
+## pyews is free software: you can redistribute it and/or modify it under
+## the terms of the GNU Affero General Public License as published by the
+## Free Software Foundation, version 3 of the License
+##
+## pyews is distributed in the hope that it will be useful, but WITHOUT
+## ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+## FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero General Public
+## License for more details.
+##
+## You should have a copy of the license in the doc/ directory of pyews.  If
+## not, see <http://www.gnu.org/licenses/>.
+
+##
+## Client side pacing with the token buckets, on a clock that only moves
+## when we say so.
+##
+
+import pytest
+
+from   pyews             import ratelimit
+from   pyews.ratelimit   import TokenBucket, RateLimiter
+
+class FakeClock(object):
+    """
+    Stands in for the time module in pyews.ratelimit. Sleeping moves the
+    clock forward, and is remembered.
+    """
+
+    def __init__ (self):
+        self.now = 1000.0
+        self.slept = []
+
+    def time (self):
+        return self.now
+
+    def sleep (self, secs):
+        self.slept.append(secs)
+        self.now += secs
+
+@pytest.fixture
+def clock (monkeypatch):
+    c = FakeClock()
+    monkeypatch.setattr(ratelimit, 'time', c)
+
+    return c
+
+@pytest.mark.parametrize('rate, burst', [
+    (0, None), (-1, 5), (0.0, 1), (float('nan'), 1), (2, 0), (2, 0.5),
+])
+def test_bad_buckets_are_refused (rate, burst):
+    with pytest.raises(ValueError):
+        TokenBucket(rate, burst)
+
+def test_burst_defaults_to_a_token (clock):
+    b = TokenBucket(0.5)
+    assert b.burst == 1
+    assert b.reserve() == 0
+    assert b.reserve() == pytest.approx(2.0)
+
+def test_pacing (clock):
+    b = TokenBucket(4, 2)
+
+    ## The burst goes through right away, after that it is one request
+    ## every quarter second
+    for i in range(5):
+        b.acquire()
+    assert clock.slept == pytest.approx([0.25, 0.25, 0.25])
+    assert clock.now == pytest.approx(1000.75)
+
+    ## Callers that do not wait their turn queue up behind earlier ones
+    assert [b.reserve() for i in range(3)] == pytest.approx([0.25, 0.5, 0.75])
+
+    ## Idle time fills the bucket, but never beyond the burst
+    clock.now += 10
+    assert b.reserve() == 0
+    assert b.reserve() == 0
+    assert b.reserve() == pytest.approx(0.25)
+
+def test_fill_level (clock):
+    b = TokenBucket(2, 4)
+    assert b.fill_level() == 1.0
+
+    b.reserve()
+    b.reserve()
+    assert b.fill_level() == pytest.approx(0.5)
+
+    clock.now += 0.5
+    assert b.fill_level() == pytest.approx(0.75)
+
+    ## Callers that are queued up do not make it go below empty
+    for i in range(6):
+        b.reserve()
+    assert b.fill_level() == 0.0
+
+    clock.now += 1.5
+    assert b.fill_level() == 0.0
+    clock.now += 0.5
+    assert b.fill_level() == pytest.approx(0.25)
+
+def test_limiter_waits_for_the_emptiest_bucket (clock):
+    l = RateLimiter(TokenBucket(10, 1), TokenBucket(1, 1))
+
+    assert l.reserve() == 0
+    assert l.reserve() == pytest.approx(1.0)
+    assert l.fill_level() == 0.0
+    assert RateLimiter().fill_level() == 1.0
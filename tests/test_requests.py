@@ -0,0 +1,107 @@
+##
+## Created : Sun Oct 18 22:41:09 IST 2026
+##
+## Copyright (C) 2026 Sriram Karra <karra.etc@gmail.com>
+##
+## This file is part of pyews
+##
+## pyews is free software: you can redistribute it and/or modify it under
+## the terms of the GNU Affero General Public License as published by the
+## Free Software Foundation, version 3 of the License
+##
+## pyews is distributed in the hope that it will be useful, but WITHOUT
+## ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+## FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero General Public
+## License for more details.
+##
+## You should have a copy of the license in the doc/ directory of pyews.  If
+## not, see <http://www.gnu.org/licenses/>.
+
+##
+## The request builders (ews/builders.py) against the templates they stand
+## in for: the compacted output of each template and the builder output
+## must be the same xml.
+##
+
+import pytest
+
+from   pyews             import utils, xmlbackend
+from   pyews.pyews       import ExchangeService
+from   pyews.ews         import builders
+from   pyews.ews.contact import Contact
+
+def new_contact (ews):
+    c = Contact(ews)
+    c.display_name.set('A & B <Co>')
+    c.notes.value = '   '
+    c.emails.add('EmailAddress1', 'a@example.com')
+
+    return c
+
+def old_contact (ews):
+    c = Contact(ews)
+    c.itemid.set('iid')
+    c.change_key.set('ck')
+    c.display_name.set('U')
+    c.job_title.set('  ')
+
+    return c
+
+def request_args (ews):
+    return {
+        utils.REQ_BIND_FOLDER    : dict(folder_name='msgfolderroot'),
+        utils.REQ_FIND_FOLDER_ID : dict(folder_ids=[('mock-root', 'ck')],
+                                        traversal='Deep'),
+        utils.REQ_FIND_ITEM      : dict(batch_size=100, offset=0,
+                                        folder_id='f'),
+        utils.REQ_FIND_ITEM_LMT  : dict(batch_size=100, offset=0,
+                                        folder_id='f',
+                                        lmt='2020-01-01T00:00:00Z'),
+        utils.REQ_GET_ITEM       : dict(itemids=['a', 'b'],
+                                        custom_eprops_xml=[]),
+        utils.REQ_CREATE_ITEM    : dict(folder_id='f',
+                                        items=[new_contact(ews)]),
+        utils.REQ_UPDATE_ITEM    : dict(items=[old_contact(ews)]),
+        utils.REQ_DELETE_ITEM    : dict(itemids=['a', 'b']),
+        utils.REQ_SYNC_FOLDER    : dict(folder_id='f', sync_state='s',
+                                        batch_size=10),
+    }
+
+def normalized (x):
+    """
+    The element tree of the xml in the string x as nested tuples. Text that
+    is all white space between elements is dropped; attribute values are
+    stripped, as the templates leave spaces in some of them.
+    """
+
+    if isinstance(x, unicode):
+        x = x.encode('utf-8')
+
+    def walk (elem):
+        text = elem.text
+        if len(elem) > 0 and text is not None and not text.strip():
+            text = None
+        atts = sorted([(k, v.strip()) for k, v in elem.attrib.items()])
+
+        return (elem.tag, atts, text or None, [walk(e) for e in elem])
+
+    return walk(xmlbackend.fromstring(x))
+
+@pytest.mark.parametrize('template', sorted(builders.BUILDERS.keys()))
+def test_builder_matches_template (template):
+    ews = ExchangeService()
+    args = request_args(ews)[template]
+
+    compacted = utils.compact_xml(ews.loader.load(template).generate(**args))
+    built = builders.BUILDERS[template](**args)
+
+    assert normalized(compacted) == normalized(built)
+
+def test_compact_keeps_values ():
+    ews = ExchangeService()
+    args = request_args(ews)[utils.REQ_CREATE_ITEM]
+    compacted = utils.compact_xml(
+        ews.loader.load(utils.REQ_CREATE_ITEM).generate(**args))
+
+    assert '&lt;Co&gt;' in compacted
+    assert '<t:Body BodyType="Text">   </t:Body>' in compacted
@@ -0,0 +1,101 @@
+##
+## Created : Mon Oct 19 02:16:44 IST 2026
+##
+## Copyright (C) 2026 Sriram Karra <karra.etc@gmail.com>
+##
+## This file is part of pyews
+##
+## pyews is free software: you can redistribute it and/or modify it under
+## the terms of the GNU Affero General Public License as published by the
+## Free Software Foundation, version 3 of the License
+##
+## pyews is distributed in the hope that it will be useful, but WITHOUT
+## ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+## FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero General Public
+## License for more details.
+##
+## You should have a copy of the license in the doc/ directory of pyews.  If
+## not, see <http://www.gnu.org/licenses/>.
+
+##
+## What ResponseScan picks out of a response in its one walk down the tree.
+##
+
+import pytest
+
+from   tests.conftest             import make_service, CONTACTS_FID
+from   pyews                      import xmlbackend
+from   pyews.soap                 import QName_M, QName_T
+from   pyews.soap                 import S_NAMESPACE, M_NAMESPACE, T_NAMESPACE
+from   pyews.ews.contact          import Contact
+from   pyews.ews.request_response import ResponseScan
+
+SYNC_RESPONSE = '''<?xml version="1.0" encoding="utf-8"?>
+<s:Envelope xmlns:s="%s" xmlns:m="%s" xmlns:t="%s">
+  <s:Body>
+    <m:SyncFolderItemsResponse>
+      <m:ResponseMessages>
+        <m:SyncFolderItemsResponseMessage ResponseClass="Success">
+          <m:ResponseCode>NoError</m:ResponseCode>
+          <m:SyncState>c3RhdGUtMQ==</m:SyncState>
+          <m:IncludesLastItemInRange>true</m:IncludesLastItemInRange>
+          <m:Changes>
+            <t:Create>
+              <t:Contact><t:ItemId Id="new-1" ChangeKey="ck-1"/></t:Contact>
+            </t:Create>
+            <t:Update>
+              <t:Contact>
+                <t:ItemId Id="old-1" ChangeKey="ck-2"/>
+                <t:Folder><t:DisplayName>Not ours</t:DisplayName></t:Folder>
+              </t:Contact>
+            </t:Update>
+            <t:Create>
+              <t:Contact><t:ItemId Id="new-2" ChangeKey="ck-1"/></t:Contact>
+            </t:Create>
+            <t:Delete><t:ItemId Id="gone-1"/></t:Delete>
+          </m:Changes>
+        </m:SyncFolderItemsResponseMessage>
+      </m:ResponseMessages>
+    </m:SyncFolderItemsResponse>
+  </s:Body>
+</s:Envelope>
+''' % (S_NAMESPACE, M_NAMESPACE, T_NAMESPACE)
+
+def test_scan_of_sync_response ():
+    scan = ResponseScan(xmlbackend.fromstring(SYNC_RESPONSE))
+
+    assert [m.tag for m in scan.messages] == [
+        QName_M('SyncFolderItemsResponseMessage')]
+    assert scan.faults == []
+    assert scan.sync_state == 'c3RhdGUtMQ=='
+
+    assert [c.tag for c in scan.creates] == [QName_T('Contact')] * 2
+    assert [c[0].get('Id') for c in scan.creates] == ['new-1', 'new-2']
+    assert [c[0].get('Id') for c in scan.updates] == ['old-1']
+    assert [i.get('Id') for i in scan.deletes] == ['gone-1']
+
+    ## The walk does not go into the changes
+    assert scan.contacts == []
+    assert scan.folder is None
+    assert scan.root_folder is None
+
+@pytest.mark.mock_server_args(size=5)
+def test_sync_folder_items (mock_server):
+    ews = make_service(mock_server.url)
+
+    c = Contact(ews)
+    c.display_name.set('Synced Contact')
+    c.save()
+    ews.DeleteItems(['mock-item-00000002'])
+
+    resp = ews.SyncFolderItems(CONTACTS_FID, None)
+    assert resp.sync_state
+    assert len(resp.news) == 5
+    assert c.itemid.value in [n.itemid.value for n in resp.news]
+    assert resp.mods == []
+    assert len(resp.dels) == 1
+    assert [d.get('Id') for d in resp.scan.deletes] == ['mock-item-00000002']
+
+    ## Nothing has happened since
+    resp = ews.SyncFolderItems(CONTACTS_FID, resp.sync_state)
+    assert (resp.news, resp.mods, resp.dels) == ([], [], [])
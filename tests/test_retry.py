@@ -0,0 +1,96 @@
+##
+## Created : Sun Oct 18 20:58:10 IST 2026
+##
+## Copyright (C) 2026 Sriram Karra <karra.etc@gmail.com>
+##
+## This file is part of pyews
+##
+## pyews is free software: you can redistribute it and/or modify it under
+## the terms of the GNU Affero General Public License as published by the
+## Free Software Foundation, version 3 of the License
+##
+## pyews is distributed in the hope that it will be useful, but WITHOUT
+## ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+## FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero General Public
+## License for more details.
+##
+## You should have a copy of the license in the doc/ directory of pyews.  If
+## not, see <http://www.gnu.org/licenses/>.
+
+##
+## Which errors the RetryPolicy retries, and that requests which are not
+## idempotent are not repeated when the server may have run them already.
+##
+
+import pytest
+
+from   tests.conftest             import make_service, CONTACTS_FID
+from   pyews.soap                 import SoapConnectionError, SoapHTTPError
+from   pyews.ews.contact          import Contact
+from   pyews.ews.retry            import RetryPolicy
+from   pyews.ews.request_response import GetItemsRequest
+
+@pytest.mark.parametrize('idempotent, status, retryable', [
+    (True,  429, True), (True,  502, True), (True,  503, True),
+    (True,  504, True), (False, 429, True), (False, 502, False),
+    (False, 503, True), (False, 504, False),
+])
+def test_http_errors (idempotent, status, retryable):
+    policy = RetryPolicy()
+    err = SoapHTTPError(status)
+
+    assert policy.classify(err, idempotent)[0] == retryable
+
+@pytest.mark.parametrize('idempotent, sent, retryable', [
+    (True, True, True), (True, False, True),
+    (False, True, False), (False, False, True),
+])
+def test_connection_errors (idempotent, sent, retryable):
+    policy = RetryPolicy()
+    err = SoapConnectionError(None, sent=sent)
+
+    assert policy.classify(err, idempotent)[0] == retryable
+
+def test_refused_connection_is_not_sent ():
+    ## Nothing listens on port 9 of the loopback interface
+    ews = make_service('http://127.0.0.1:9/EWS/Exchange.asmx', timeout=2)
+    ews.retry_policy = RetryPolicy(max_attempts=2, base_delay=0.01)
+
+    c = Contact(ews)
+    c.display_name.set('Nobody Home')
+    with pytest.raises(SoapConnectionError) as e:
+        ews.CreateItems(CONTACTS_FID, [c])
+
+    assert e.value.sent is False
+    assert ews.retry_policy.retries == 1
+
+@pytest.mark.mock_server_args(size=1, item_latency=0.6)
+def test_create_is_not_repeated_on_read_timeout (mock_server):
+    ## The response takes longer than the client is willing to wait, but
+    ## the contact is created all the same. Sending the request again would
+    ## create it a second time.
+    ews = make_service(mock_server.url, timeout=0.3)
+    ews.retry_policy = RetryPolicy(max_attempts=3, base_delay=0.01)
+    before = len(mock_server.mailbox.items)
+
+    c = Contact(ews)
+    c.display_name.set('Only Once')
+    with pytest.raises(SoapConnectionError):
+        ews.CreateItems(CONTACTS_FID, [c])
+
+    assert len(mock_server.mailbox.items) == before + 1
+    assert ews.retry_policy.retries == 0
+
+@pytest.mark.mock_server_args(size=3, throttle_rate=20, throttle_burst=1)
+def test_retried_request_keeps_resp_node (mock_server):
+    ews = make_service(mock_server.url)
+    ews.retry_policy = RetryPolicy(base_delay=0.05)
+
+    for i in range(1, 4):
+        req = GetItemsRequest(ews, itemids=['mock-item-%08d' % i],
+                              custom_eprops_xml=[])
+        resp = req.execute()
+        assert req.resp_node is resp.node
+        assert req.resp_node is not None
+
+    assert ews.retry_policy.retries > 0
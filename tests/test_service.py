@@ -0,0 +1,137 @@
+##
+## Created : Sun Oct 18 22:15:27 IST 2026
+##
+## Copyright (C) 2026 Sriram Karra <karra.etc@gmail.com>
+##
+## This file is part of pyews
+##
+## pyews is free software: you can redistribute it and/or modify it under
+## the terms of the GNU Affero General Public License as published by the
+## Free Software Foundation, version 3 of the License
+##
+## pyews is distributed in the hope that it will be useful, but WITHOUT
+## ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+## FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero General Public
+## License for more details.
+##
+## You should have a copy of the license in the doc/ directory of pyews.  If
+## not, see <http://www.gnu.org/licenses/>.
+
+##
+## ExchangeService end to end against the mock server: the same items come
+## back whichever way the requests are put together and the responses are
+## parsed, throttled requests are retried, and large requests go out in
+## batches with streamed bodies.
+##
+
+import pytest
+
+from   tests.conftest    import make_service, CONTACTS_FID
+from   pyews             import xmlbackend
+from   pyews.ews.contact import Contact
+from   pyews.ews.data    import FolderClass
+from   pyews.ews.retry   import RetryPolicy
+
+## The ways of talking to the server that should not make any difference to
+## the results: ExchangeService attributes to set for each
+MODES = [
+    ('default',   {}),
+    ('stream',    {'stream_responses' : True}),
+    ('lazy',      {'lazy_contacts' : True}),
+    ('stream_lazy', {'stream_responses' : True, 'lazy_contacts' : True}),
+    ('templates', {'request_builders' : False}),
+]
+
+def contacts_folder (ews):
+    return ews.get_root_folder().FindFolders(types=[FolderClass.Contacts])[0]
+
+def summary (contacts):
+    return [(c.itemid.value, c.change_key.value, str(c), c.write_to_xml())
+            for c in contacts]
+
+def fetch_all (ews):
+    """
+    The contacts of the mock mailbox as fetched with FindItems, and a few of
+    them again with GetItems
+    """
+
+    found = ews.FindItems(contacts_folder(ews))
+    ids = [c.itemid.value for c in found[::7]]
+
+    return summary(found), summary(ews.GetItems(ids))
+
+@pytest.fixture(scope='module')
+def items_server ():
+    from tests.mock_server import MockEWSServer
+
+    server = MockEWSServer(size=150)
+    server.start()
+    yield server
+    server.stop()
+
+@pytest.fixture(scope='module')
+def expected (items_server):
+    return fetch_all(make_service(items_server.url))
+
+@pytest.mark.parametrize('backend', xmlbackend.available())
+@pytest.mark.parametrize('mode, settings', MODES)
+def test_same_items_in_every_mode (items_server, expected, backend, mode,
+                                   settings):
+    before = xmlbackend.name
+    xmlbackend.use(backend)
+    try:
+        ews = make_service(items_server.url)
+        for attr, val in settings.iteritems():
+            setattr(ews, attr, val)
+
+        found, got = fetch_all(ews)
+    finally:
+        xmlbackend.use(before)
+
+    assert len(found) == 150
+    assert found == expected[0]
+    assert got == expected[1]
+
+@pytest.mark.parametrize('style, reason', [('fault', 'ErrorServerBusy'),
+                                           ('http', 'HTTP503')])
+def test_throttled_requests_are_retried (mock_server, style, reason):
+    mock_server.throttle_rate = 20
+    mock_server.throttle_burst = 1
+    mock_server.throttle_style = style
+
+    ews = make_service(mock_server.url)
+    ews.retry_policy = RetryPolicy(base_delay=0.05)
+
+    ids = ['mock-item-%08d' % i for i in range(1, 4)]
+    for iid in ids:
+        assert [c.itemid.value for c in ews.GetItems([iid])] == [iid]
+
+    policy = ews.retry_policy
+    assert policy.retries > 0
+    assert policy.gave_up == 0
+    assert policy.by_reason.keys() == [reason]
+    assert mock_server.stats['faults'] == policy.retries
+
+@pytest.mark.mock_server_args(size=1)
+def test_streamed_create_items (mock_server):
+    ews = make_service(mock_server.url)
+    assert ews.stream_request_items <= 600
+
+    cs = []
+    for i in range(600):
+        c = Contact(ews)
+        c.display_name.set('Streamed Contact %d' % i)
+        c.notes.value = u'Caf\xe9 & co. %d' % i
+        cs.append(c)
+
+    ews.CreateItems(CONTACTS_FID, cs)
+
+    ids = [c.itemid.value for c in cs]
+    assert None not in ids
+    assert len(set(ids)) == 600
+    assert len(mock_server.mailbox.items) == 601
+
+    got = dict([(c.itemid.value, c) for c in ews.GetItems(ids[::50])])
+    for c in cs[::50]:
+        assert got[c.itemid.value].display_name.value == c.display_name.value
+        assert got[c.itemid.value].notes.value == c.notes.value
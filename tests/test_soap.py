@@ -0,0 +1,171 @@
+##
+## Created : Sun Oct 18 21:47:19 IST 2026
+##
+## Copyright (C) 2026 Sriram Karra <karra.etc@gmail.com>
+##
+## This file is part of pyews
+##
+## pyews is free software: you can redistribute it and/or modify it under
+## the terms of the GNU Affero General Public License as published by the
+## Free Software Foundation, version 3 of the License
+##
+## pyews is distributed in the hope that it will be useful, but WITHOUT
+## ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+## FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero General Public
+## License for more details.
+##
+## You should have a copy of the license in the doc/ directory of pyews.  If
+## not, see <http://www.gnu.org/licenses/>.
+
+##
+## The keep-alive connection pool shared by the SoapClients of a url, gzip
+## compression of the requests and responses, the decoding of response
+## bodies, and the registry of qualified names.
+##
+
+import time
+import pytest
+
+from   tests.conftest    import make_service, CONTACTS_FID
+from   pyews             import xmlbackend
+from   pyews.soap        import connection_pool, QName, QName_M, QName_T
+from   pyews.soap        import QNames, unQName, M_NAMESPACE, T_NAMESPACE
+from   pyews.ews.item    import TAG_EXTENDED_FIELD_URI, TAG_VALUE
+from   pyews.transport   import HTTPTransport, ReplayResponse
+from   pyews.ews.contact import Contact
+from   pyews.ews.data    import FolderClass
+
+@pytest.mark.mock_server_args(size=1, latency=0.3)
+def test_pool_is_used_till_the_response_is_read (mock_server):
+    ews = make_service(mock_server.url, idle_timeout=0.2)
+    entry = connection_pool.entries[mock_server.url]
+
+    ews.get_root_folder()
+    done = time.time()
+
+    ## The request took longer than the idle timeout, but the connection
+    ## was in use all along
+    assert done - entry.last_used < 0.1
+    connection_pool.close(mock_server.url)
+
+def contacts (ews):
+    folder = ews.get_root_folder().FindFolders(types=[FolderClass.Contacts])[0]
+    return [(c.itemid.value, str(c)) for c in ews.FindItems(folder)]
+
+@pytest.mark.mock_server_args(size=200)
+def test_gzip_saves_bytes (mock_server):
+    plain = make_service(mock_server.url)
+    gz = make_service(mock_server.url, compress_requests=True,
+                      compress_responses=True)
+
+    assert contacts(gz) == contacts(plain)
+
+    ## Responses listing contacts shrink to a fraction of their size
+    stats = gz.soap.total_stats
+    assert stats.resp_bytes > 0
+    assert stats.resp_wire_bytes < stats.resp_bytes / 4
+    assert stats.bytes_saved == ((stats.req_bytes - stats.req_wire_bytes) +
+                                 (stats.resp_bytes - stats.resp_wire_bytes))
+
+    ## And so do requests carrying them, which the server takes all the same
+    cs = []
+    for i in range(100):
+        c = Contact(gz)
+        c.display_name.set(u'Gzipped Contact %d' % i)
+        cs.append(c)
+    gz.CreateItems(CONTACTS_FID, cs)
+
+    stats = gz.soap.last_stats
+    assert stats.req_wire_bytes < stats.req_bytes / 4
+    assert len(mock_server.mailbox.items) == 300
+    assert len(contacts(gz)) == 300
+
+@pytest.mark.mock_server_args(size=50, gzip=False)
+def test_gzip_is_only_asked_for (mock_server):
+    ## A server that does not compress is fine too, and nothing is saved
+    gz = make_service(mock_server.url, compress_responses=True)
+
+    assert len(contacts(gz)) == 50
+    stats = gz.soap.total_stats
+    assert stats.resp_bytes > 0
+    assert stats.resp_wire_bytes == stats.resp_bytes
+    assert stats.bytes_saved == 0
+
+class RecodingTransport(object):
+    """
+    Hands back the responses of the server in the given encoding, with the
+    xml declaration saying so but no charset in the Content-Type header
+    """
+
+    def __init__ (self, encoding):
+        self.inner = HTTPTransport()
+        self.encoding = encoding
+
+    def post (self, client, url, data, headers, stream, timeout):
+        r = self.inner.post(client, url, data, headers, stream, timeout)
+        body = r.content
+        r.close()
+
+        body = body.decode('utf-8').replace('encoding="utf-8"',
+                                            'encoding="%s"' % self.encoding, 1)
+        return ReplayResponse(r.status_code, {'Content-Type' : 'text/xml'},
+                              body.encode(self.encoding))
+
+@pytest.mark.parametrize('encoding', ['utf-8', 'iso-8859-1'])
+@pytest.mark.parametrize('stream', [False, True])
+@pytest.mark.mock_server_args(size=1)
+def test_non_ascii_responses (mock_server, encoding, stream):
+    ## Without a charset in the headers, the response text would be taken
+    ## to be in ISO-8859-1. The parser goes by the xml declaration instead.
+    name = u'Zo\xeb Caf\xe9 & Cr\xe8me'
+
+    c = Contact(make_service(mock_server.url))
+    c.display_name.set(name)
+    c.notes.value = name
+    c.save()
+
+    ews = make_service(mock_server.url, transport=RecodingTransport(encoding))
+    ews.stream_responses = stream
+    [got] = ews.GetItems([c.itemid.value])
+
+    assert got.display_name.value == name
+    assert got.notes.value == name
+    assert ews.soap.last_stats.resp_bytes > 0
+
+def test_qualified_names_are_made_once ():
+    tag = QName_T('Contact')
+    assert tag == '{%s}Contact' % T_NAMESPACE
+    assert tag is intern('{%s}Contact' % T_NAMESPACE)
+
+    assert QName_T('Contact') is tag
+    assert QName(T_NAMESPACE, 'Contact') is tag
+    assert QName(M_NAMESPACE, 'Items') is QName_M('Items')
+    assert QName_M('Contact') != tag
+
+    assert TAG_EXTENDED_FIELD_URI is QName_T('ExtendedFieldURI')
+    assert TAG_VALUE is QName_T('Value')
+
+def test_registry_for_other_namespaces ():
+    qnames = QNames('urn:pyews:test')
+    assert len(qnames) == 0
+    assert qnames['a'] is qnames['a'] == '{urn:pyews:test}a'
+    assert qnames.keys() == ['a']
+
+    assert QName('urn:pyews:test', 'b') is QName('urn:pyews:test', 'b')
+
+def test_parsed_tags_match_the_registry ():
+    elem = xmlbackend.fromstring('<t:Contact xmlns:t="%s"><t:Value/>'
+                                 '</t:Contact>' % T_NAMESPACE)
+
+    assert elem.tag == QName_T('Contact')
+    assert elem[0].tag == TAG_VALUE
+    assert elem.find(TAG_VALUE) is not None
+
+def test_unqname ():
+    assert unQName(QName_T('Contact')) == 'Contact'
+    assert unQName('{urn:x}Entry') == 'Entry'
+    assert unQName('Entry') == 'Entry'
+
+    ## And again, now that the answers are remembered
+    assert unQName('{urn:x}Entry') == 'Entry'
+    assert unQName('Entry') == 'Entry'
@@ -0,0 +1,116 @@
+##
+## Created : Sun Oct 18 23:41:05 IST 2026
+##
+## Copyright (C) 2026 Sriram Karra <karra.etc@gmail.com>
+##
+## This file is part of pyews
+##
+## pyews is free software: you can redistribute it and/or modify it under
+## the terms of the GNU Affero General Public License as published by the
+## Free Software Foundation, version 3 of the License
+##
+## pyews is distributed in the hope that it will be useful, but WITHOUT
+## ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+## FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero General Public
+## License for more details.
+##
+## You should have a copy of the license in the doc/ directory of pyews.  If
+## not, see <http://www.gnu.org/licenses/>.
+
+##
+## The numbers the timing sinks get: every attempt of a retried request is
+## counted, and so is the rendering of a streamed request body.
+##
+
+import time
+import pytest
+
+from   tests.conftest    import make_service, CONTACTS_FID
+from   pyews.transport   import HTTPTransport, ReplayResponse
+from   pyews.ews.contact import Contact
+from   pyews.ews.retry   import RetryPolicy
+
+class ListSink(object):
+    def __init__ (self):
+        self.timings = []
+
+    def record (self, timings):
+        self.timings.append(timings)
+
+class BusyOnceTransport(object):
+    """
+    Answers the first request with a 503 after a while, and passes the rest
+    on to the server
+    """
+
+    BODY = 'Server busy'
+
+    def __init__ (self, delay):
+        self.inner = HTTPTransport()
+        self.delay = delay
+        self.busy = True
+
+    def post (self, client, url, data, headers, stream, timeout):
+        if not self.busy:
+            return self.inner.post(client, url, data, headers, stream,
+                                   timeout)
+
+        self.busy = False
+        if not isinstance(data, basestring):
+            data = ''.join(data)
+        time.sleep(self.delay)
+        return ReplayResponse(503, {'Retry-After' : '0'}, self.BODY)
+
+def service (url, **kwargs):
+    ews = make_service(url, **kwargs)
+    ews.timing_sinks.append(ListSink())
+
+    return ews
+
+@pytest.mark.mock_server_args(size=5)
+def test_every_attempt_is_counted (mock_server):
+    ews = service(mock_server.url, transport=BusyOnceTransport(0.2))
+    ews.retry_policy = RetryPolicy(max_attempts=2, base_delay=0.01)
+
+    ids = ['mock-item-%08d' % i for i in range(1, 6)]
+    assert len(ews.GetItems(ids)) == 5
+
+    [t] = ews.timing_sinks[0].timings
+    last = ews.soap.last_stats
+    assert t.attempts == 2
+    assert t.error is None
+    assert t.items == 5
+    assert t.retry_wait > 0
+
+    ## The same request went out twice, and the 503 had a body too
+    assert t.req_bytes == 2 * last.req_bytes
+    assert t.req_wire_bytes == 2 * last.req_wire_bytes
+    assert t.resp_bytes == last.resp_bytes + len(BusyOnceTransport.BODY)
+    assert t.network >= 0.2 + last.network_time
+
+    total = ews.soap.total_stats
+    assert (t.req_bytes, t.resp_bytes) == (total.req_bytes, total.resp_bytes)
+
+@pytest.mark.mock_server_args(size=1)
+def test_streamed_body_is_timed (mock_server):
+    def create (ews):
+        cs = []
+        for i in range(50):
+            c = Contact(ews)
+            c.display_name.set('Timed Contact %d' % i)
+            cs.append(c)
+        ews.CreateItems(CONTACTS_FID, cs)
+
+        return ews.timing_sinks[0].timings[-1]
+
+    ews = service(mock_server.url)
+    whole = create(ews)
+
+    ews.stream_request_items = 10
+    streamed = create(ews)
+
+    assert streamed.error is None
+    assert streamed.items == whole.items == 50
+    assert streamed.render > 0
+    assert streamed.req_bytes == whole.req_bytes
+    assert streamed.req_wire_bytes > 0
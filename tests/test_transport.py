@@ -0,0 +1,105 @@
+##
+## Created : Mon Oct 19 00:21:37 IST 2026
+##
+## Copyright (C) 2026 Sriram Karra <karra.etc@gmail.com>
+##
+## This file is part of pyews
+##
+## pyews is free software: you can redistribute it and/or modify it under
+## the terms of the GNU Affero General Public License as published by the
+## Free Software Foundation, version 3 of the License
+##
+## pyews is distributed in the hope that it will be useful, but WITHOUT
+## ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+## FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero General Public
+## License for more details.
+##
+## You should have a copy of the license in the doc/ directory of pyews.  If
+## not, see <http://www.gnu.org/licenses/>.
+
+##
+## Recording exchanges with the server and replaying them, and the keys
+## that requests are matched on.
+##
+
+import pytest
+
+from   tests.conftest    import make_service
+from   pyews.soap        import SoapHTTPError
+from   pyews.transport   import RecordingTransport, ReplayTransport
+from   pyews.transport   import SoapReplayError, request_key
+from   pyews.ews.data    import FolderClass
+
+def contacts (ews):
+    folder = ews.get_root_folder().FindFolders(types=[FolderClass.Contacts])[0]
+    return [(c.itemid.value, str(c)) for c in ews.FindItems(folder)]
+
+@pytest.mark.mock_server_args(size=120)
+def test_record_then_replay (mock_server, tmpdir):
+    path = str(tmpdir)
+
+    ews = make_service(mock_server.url, transport=RecordingTransport(path))
+    recorded = contacts(ews)
+    assert len(recorded) == 120
+
+    ## Nothing reaches the server on replay
+    requests = mock_server.stats['requests']
+    ews = make_service(mock_server.url, transport=ReplayTransport(path))
+    assert contacts(ews) == recorded
+    assert mock_server.stats['requests'] == requests
+
+def test_keys_ignore_layout_but_not_values ():
+    a = '<m:GetItem>\n  <t:ItemId Id="x" />\n  <t:Name>a b</t:Name>\n</m:GetItem>'
+    b = '<m:GetItem><!-- ids --><t:ItemId\n    Id="x"/><t:Name>a b</t:Name></m:GetItem>'
+    c = '<m:GetItem><t:ItemId Id="x"/><t:Name>a  b</t:Name></m:GetItem>'
+    d = '<m:GetItem><t:ItemId Id="x"/><t:Name> a b</t:Name></m:GetItem>'
+
+    assert request_key(a) == request_key(b)
+    assert request_key(a) != request_key(c)
+    assert request_key(a) != request_key(d)
+
+class ClosingTransport(object):
+    """
+    Wraps a transport and remembers the responses it hands out
+    """
+
+    def __init__ (self, inner):
+        self.inner = inner
+        self.responses = []
+
+    def post (self, *args):
+        r = self.inner.post(*args)
+        self.responses.append(r)
+        return r
+
+@pytest.mark.mock_server_args(size=1, throttle_rate=0.001, throttle_burst=1,
+                              throttle_style='http')
+def test_error_responses_are_closed (mock_server, tmpdir):
+    path = str(tmpdir)
+
+    ews = make_service(mock_server.url, transport=RecordingTransport(path))
+    ews.retry_policy = None
+    ews.get_root_folder()
+    with pytest.raises(SoapHTTPError):
+        ews.FindItems(ews.root_folder)
+
+    ## The 503 is replayed from a memory mapped file, which must be let go.
+    ## The mock sends it without a body, and an empty file is not mapped.
+    for meta in tmpdir.listdir('*.meta'):
+        if '"status": 503' in meta.read():
+            tmpdir.join(meta.purebasename + '.body').write('Server busy')
+
+    replay = ClosingTransport(ReplayTransport(path))
+    ews = make_service(mock_server.url, transport=replay)
+    ews.retry_policy = None
+    ews.get_root_folder()
+    with pytest.raises(SoapHTTPError) as e:
+        ews.FindItems(ews.root_folder)
+
+    assert e.value.status_code == 503
+    assert e.value.text == 'Server busy'
+    assert len(replay.responses) == 2
+    assert all([r.closer is None for r in replay.responses])
+
+    with pytest.raises(SoapReplayError):
+        ews.FindItems(ews.get_root_folder().FindFolders()[0])
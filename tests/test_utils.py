@@ -0,0 +1,135 @@
+##
+## Created : Sun Oct 18 22:06:51 IST 2026
+##
+## Copyright (C) 2026 Sriram Karra <karra.etc@gmail.com>
+##
+## This file is part of pyews
+##
+## pyews is free software: you can redistribute it and/or modify it under
+## the terms of the GNU Affero General Public License as published by the
+## Free Software Foundation, version 3 of the License
+##
+## pyews is distributed in the hope that it will be useful, but WITHOUT
+## ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+## FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero General Public
+## License for more details.
+##
+## You should have a copy of the license in the doc/ directory of pyews.  If
+## not, see <http://www.gnu.org/licenses/>.
+
+import pytest
+
+from   pyews             import utils, xmlbackend
+from   pyews.utils       import compact_xml, xml_text, xml_attr, utf8
+from   pyews.pyews       import ExchangeService
+from   pyews.ews.contact import Contact
+
+def test_compact_xml ():
+    x = '''<?xml version="1.0"?>
+<soap:Envelope xmlns:soap="s"
+               xmlns:t="t">
+  <!-- A comment -->
+  <t:Contact>
+    <t:DisplayName> Ada </t:DisplayName>
+    <t:FileAs/>
+    <t:Alias />
+  </t:Contact>
+</soap:Envelope>
+'''
+
+    assert compact_xml(x) == ('<?xml version="1.0"?>'
+                              '<soap:Envelope xmlns:soap="s" xmlns:t="t">'
+                              '<t:Contact><t:DisplayName> Ada </t:DisplayName>'
+                              '<t:FileAs/><t:Alias /></t:Contact>'
+                              '</soap:Envelope>')
+
+def test_compact_xml_keeps_white_space_text ():
+    x = '<t:Contact>\n  <t:Notes>   </t:Notes>\n  <t:Alias>\t</t:Alias>\n</t:Contact>'
+
+    assert compact_xml(x) == ('<t:Contact><t:Notes>   </t:Notes>'
+                              '<t:Alias>\t</t:Alias></t:Contact>')
+
+@pytest.fixture
+def loader (monkeypatch):
+    """
+    A fresh shared template loader, which counts the templates it compiles
+    in its 'created' list
+    """
+
+    monkeypatch.setattr(utils, '_loader', None)
+    loader = utils.template_loader()
+
+    loader.created = []
+    create = loader._create_template
+    def counting_create (name):
+        loader.created.append(name)
+        return create(name)
+    monkeypatch.setattr(loader, '_create_template', counting_create)
+
+    return loader
+
+def test_services_share_the_template_loader (loader):
+    assert ExchangeService().loader is loader
+    assert ExchangeService().loader is loader
+    assert utils.template_loader() is loader
+
+def test_warm_templates_compiles_each_template_once (loader):
+    assert utils.warm_templates() is loader
+    assert sorted(loader.created) == sorted(utils.REQ_TEMPLATES +
+                                            ['base_request.xml'])
+
+    ## Services that come along later find them all ready
+    del loader.created[:]
+    utils.warm_templates()
+    ews = ExchangeService()
+    for name in utils.REQ_TEMPLATES:
+        assert ews.loader.load(name) is loader.templates[name]
+    assert loader.created == []
+
+def test_warm_templates_takes_names (loader):
+    utils.warm_templates([utils.REQ_GET_ITEM])
+    assert sorted(loader.created) == ['base_request.xml', utils.REQ_GET_ITEM]
+
+HINDI = u'\u0939\u093f\u0928\u094d\u0926\u0940'
+
+## (value, as element text, as attribute value)
+ESCAPES = [
+    (None,                   '',                     ''),
+    ('plain',                'plain',                'plain'),
+    ('a & b',                'a &amp; b',            'a &amp; b'),
+    ('<t:Notes>',            '&lt;t:Notes&gt;',      '&lt;t:Notes&gt;'),
+    ('say "hi"',             'say "hi"',             'say &quot;hi&quot;'),
+    ('&amp;',                '&amp;amp;',            '&amp;amp;'),
+    (u'Caf\xe9 & "co" <x>', 'Caf\xc3\xa9 &amp; "co" &lt;x&gt;',
+                             'Caf\xc3\xa9 &amp; &quot;co&quot; &lt;x&gt;'),
+    ('Caf\xc3\xa9',          'Caf\xc3\xa9',           'Caf\xc3\xa9'),
+    (HINDI,                  HINDI.encode('utf-8'),  HINDI.encode('utf-8')),
+    (42,                     '42',                   '42'),
+]
+
+@pytest.mark.parametrize('value, text, attr', ESCAPES)
+def test_xml_escaping (value, text, attr):
+    assert xml_text(value) == text
+    assert xml_attr(value) == attr
+    assert type(xml_text(value)) is str
+    assert type(xml_attr(value)) is str
+
+@pytest.mark.parametrize('value, text, attr', ESCAPES[1:])
+def test_escaped_values_parse_back (value, text, attr):
+    elem = xmlbackend.fromstring('<a b="%s">%s</a>' % (attr, text))
+    value = utf8(value).decode('utf-8')
+
+    assert elem.text == value
+    assert elem.get('b') == value
+
+def test_contact_xml_escapes_values ():
+    name = u'<Ada & "Bob"> Caf\xe9'
+
+    c = Contact(None)
+    c.display_name.set(name)
+    c.notes.value = name + u' & more'
+
+    xml = '<x xmlns:t="urn:t">%s</x>' % c.write_to_xml()
+    elem = xmlbackend.fromstring(xml)
+    assert elem.find('.//{urn:t}DisplayName').text == name
+    assert elem.find('.//{urn:t}Body').text == name + u' & more'
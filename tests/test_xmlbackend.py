@@ -0,0 +1,52 @@
+##
+## Created : Sun Oct 18 21:55:36 IST 2026
+##
+## Copyright (C) 2026 Sriram Karra <karra.etc@gmail.com>
+##
+## This file is part of pyews
+##
+## pyews is free software: you can redistribute it and/or modify it under
+## the terms of the GNU Affero General Public License as published by the
+## Free Software Foundation, version 3 of the License
+##
+## pyews is distributed in the hope that it will be useful, but WITHOUT
+## ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+## FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero General Public
+## License for more details.
+##
+## You should have a copy of the license in the doc/ directory of pyews.  If
+## not, see <http://www.gnu.org/licenses/>.
+
+##
+## The xml backends. See pyews/xmlbackend.py
+##
+
+import pytest
+
+from   pyews import xmlbackend
+
+@pytest.fixture
+def backend (request):
+    """
+    Switch to the backend named by the test parameter for the duration of
+    the test
+    """
+
+    if request.param not in xmlbackend.available():
+        pytest.skip('xml backend %s is not installed' % request.param)
+
+    before = xmlbackend.name
+    xmlbackend.use(request.param)
+    yield request.param
+    xmlbackend.use(before)
+
+## Deeper than libxml2 allows by default
+DEEP_XML = '<a>' * 300 + '</a>' * 300
+
+@pytest.mark.parametrize('backend', ['lxml'], indirect=True)
+def test_huge_tree_is_opt_in (backend, monkeypatch):
+    with pytest.raises(xmlbackend.etree.XMLSyntaxError):
+        xmlbackend.fromstring(DEEP_XML)
+
+    monkeypatch.setattr(xmlbackend, 'HUGE_TREE', True)
+    assert xmlbackend.fromstring(DEEP_XML).tag == 'a'